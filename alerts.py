@@ -2,30 +2,88 @@ import time
 from dataclasses import dataclass
 from typing import List, Dict
 from settings import settings
-from storage import kv_get, kv_set
+from storage import transaction
+from detectors import DROP, RECOVER
+from models import Payout, Worker
+from tenants import Tenant
+from worker_state import OFFLINE, RECOVERED
+
+# сколько имён перечисляем в сгруппированном алерте
+GROUP_NAMES_MAX = 15
 
 @dataclass
 class Event:
     kind: str
     msg: str
 
-def _mins_since(ts: int) -> float:
-    return (time.time() - ts) / 60 if ts else float("inf")
+def _names(names: List[str]) -> str:
+    head = ", ".join(names[:GROUP_NAMES_MAX])
+    return head + (f" и ещё {len(names) - GROUP_NAMES_MAX}" if len(names) > GROUP_NAMES_MAX else "")
+
+async def check_offline(t: Tenant, workers: List[Worker]) -> List[Event]:
+    """Алерты только на переходы online→offline и offline→online, сгруппированно."""
+    transitions = await t.states.update(
+        workers, offline_min=settings.alert_offline_min, confirm_polls=settings.alert_offline_confirm_polls
+    )
+    went_off = sorted(alias for kind, _, alias in transitions if kind == OFFLINE)
+    back_on = sorted(alias for kind, _, alias in transitions if kind == RECOVERED)
+    ev = []
+    if len(went_off) == 1:
+        ev.append(Event("offline", f"⚠️ {went_off[0]} офлайн > {settings.alert_offline_min} мин"))
+    elif went_off:
+        ev.append(Event("offline", f"⚠️ {len(went_off)} воркеров офлайн > {settings.alert_offline_min} мин: {_names(went_off)}"))
+    if len(back_on) == 1:
+        ev.append(Event("recovered", f"✅ {back_on[0]} снова онлайн"))
+    elif back_on:
+        ev.append(Event("recovered", f"✅ {len(back_on)} воркеров снова онлайн: {_names(back_on)}"))
+    return ev
+
+async def check_payouts(new_by_coin: Dict[str, List[Payout]]) -> List[Event]:
+    """Новые выплаты из реестра — по каждой монете отдельно."""
+    ev = []
+    for coin, pays in new_by_coin.items():
+        for p in pays:
+            ev.append(Event("payout", f"✅ Выплата: {p.amount} {coin}"))
+    return ev
 
-async def check_offline(workers: List[Dict]) -> List[Event]:
+async def check_hashrate_drop(t: Tenant, workers: List[Worker]) -> List[Event]:
+    """Падение/восстановление хешрейта по EWMA-детектору на каждого воркера (O(1) на воркер)."""
+    detectors = t.detectors
+    await detectors.load()
     ev = []
     for w in workers:
-        if _mins_since(w.get("last_active") or 0) > settings.alert_offline_min:
-            ev.append(Event("offline", f"⚠️ {w.get('alias') or w.get('name')} офлайн > {settings.alert_offline_min} мин"))
+        if not w.online:
+            continue  # офлайн ловит check_offline
+        hr = w.hr_10min or w.hr_recent
+        d = detectors.drop(f"{w.coin}:{w.name}")
+        r = d.update(hr, alpha=settings.alert_ewma_alpha, drop_pct=settings.alert_drop_pct,
+                     warmup=settings.alert_warmup_samples)
+        name = w.alias or w.name
+        if r == DROP:
+            ev.append(Event("hashrate_drop", f"📉 {name}: хешрейт упал более чем на {settings.alert_drop_pct:.0f}% от нормы"))
+        elif r == RECOVER:
+            ev.append(Event("hashrate_recover", f"📈 {name}: хешрейт восстановился"))
+    await detectors.checkpoint()
     return ev
 
-async def check_payouts(latest: list[dict]) -> List[Event]:
-    if not latest:
-        return []
-    last_id = await kv_get("last_payout_ts")
-    newest = str(latest[0].get("time") or "")
-    if newest and newest != last_id:
-        await kv_set("last_payout_ts", newest)
-        amt = latest[0].get("amount"); coin = latest[0].get("coin")
-        return [Event("payout", f"✅ Выплата: {amt} {coin}")]
+async def check_daily_income(t: Tenant, fiat_24h: float) -> List[Event]:
+    """Доход флота за 24ч (в валюте тенанта) ниже ALERT_MIN_DAILY_USD."""
+    await t.detectors.load()
+    r = t.detectors.floor("fleet:daily_fiat").update(fiat_24h, settings.alert_min_daily_usd)
+    await t.detectors.checkpoint()
+    if r == DROP:
+        return [Event("income_low", f"💤 Доход за 24ч {fiat_24h:.2f} {t.fiat} ниже порога {settings.alert_min_daily_usd:.2f}")]
+    if r == RECOVER:
+        return [Event("income_ok", f"💰 Доход за 24ч снова выше порога: {fiat_24h:.2f} {t.fiat}")]
     return []
+
+async def record(t: Tenant, events: List[Event]) -> None:
+    """Пишем отправленные алерты в журнал (в рамках текущей транзакции цикла)."""
+    if not events:
+        return
+    now = int(time.time())
+    async with transaction() as db:
+        await db.executemany(
+            "INSERT INTO alert_log(tenant, ts, kind, msg) VALUES(?,?,?,?)",
+            [(t.id, now, e.kind, e.msg) for e in events],
+        )
@@ -0,0 +1,218 @@
+"""
+Алиасы и группы воркеров: реестр с горячей перезагрузкой.
+
+Источники (каждый следующий перекрывает предыдущий):
+1. алиасы тенанта из БД (колонка tenant.aliases; для 'default' — WORKER_ALIAS_* из .env);
+2. файл ALIASES_FILE (.json, .yaml/.yml — если установлен PyYAML): общий раздел
+   и разделы тенантов. Перечитывается, когда меняется mtime;
+3. правки на ходу командой /alias — таблица worker_alias в SQLite; все реплики
+   видят их по счётчику alias_version в kv.
+
+Формат файла:
+
+    aliases:                # для всех тенантов; COIN:name — только для монеты
+      rig_01: Garage-1
+      BTC:s19_07: Garage-S19-7
+    groups:
+      Garage: [rig_01, BTC:s19_07]
+    tenants:
+      acme: {aliases: {...}, groups: {...}}
+
+Запись для монеты (COIN:name) важнее общей, в каком бы слое та ни была.
+Для каждого тенанта собирается AliasTable: по таблице на монету (общие записи
+уже влиты) и memo (монета, сырое имя) -> (алиас, группа), так что разрешение
+воркера при опросе — один поиск в словаре.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from settings import settings
+from storage import connection, kv_get, transaction
+
+try:
+    import yaml  # необязательная зависимость: без неё файл алиасов — только JSON
+except ImportError:  # pragma: no cover
+    yaml = None
+
+log = logging.getLogger(__name__)
+
+Key = Tuple[str, str]      # (МОНЕТА или '' — все монеты, нормализованное имя)
+Entry = Tuple[str, str]    # (алиас, группа); '' — не задано
+Entries = Dict[Key, Entry]
+
+ANY = ""
+NONE: Entry = ("", "")
+MEMO_MAX = 1 << 16
+VERSION_KEY = "alias_version"
+
+
+@lru_cache(maxsize=MEMO_MAX)
+def norm_name(s: str) -> str:
+    """Заменяем всё, кроме [A-Za-z0-9_], на '_' (как в ключах WORKER_ALIAS_*)."""
+    return re.sub(r"[^A-Za-z0-9_]", "_", s)
+
+
+def parse_key(raw: str) -> Key:
+    """'rig-01' -> ('', 'rig_01'); 'BTC:rig-01' -> ('BTC', 'rig_01')."""
+    coin, sep, name = raw.partition(":")
+    if sep and coin.isalpha():
+        return coin.upper(), norm_name(name)
+    return ANY, norm_name(raw)
+
+
+def _merge(low: Entry, high: Entry) -> Entry:
+    return high[0] or low[0], high[1] or low[1]
+
+
+def layer(*sources: Entries) -> Entries:
+    out: Entries = {}
+    for src in sources:
+        for k, e in src.items():
+            out[k] = _merge(out.get(k, NONE), e)
+    return out
+
+
+class AliasTable:
+    __slots__ = ("_global", "_by_coin", "_memo")
+
+    def __init__(self, entries: Entries | None = None):
+        entries = entries or {}
+        self._global: Dict[str, Entry] = {n: e for (c, n), e in entries.items() if c == ANY}
+        self._by_coin: Dict[str, Dict[str, Entry]] = {}
+        for (c, n), e in entries.items():
+            if c != ANY:
+                table = self._by_coin.setdefault(c, dict(self._global))
+                table[n] = _merge(self._global.get(n, NONE), e)
+        self._memo: Dict[Tuple[str, str], Entry] = {}
+
+    def resolve(self, coin: str, raw: str) -> Entry:
+        hit = self._memo.get((coin, raw))
+        if hit is None:
+            hit = self._by_coin.get(coin, self._global).get(norm_name(raw), NONE)
+            if len(self._memo) < MEMO_MAX:
+                self._memo[(coin, raw)] = hit
+        return hit
+
+
+# ======================= источники =======================
+
+def from_maps(scoped: Dict[Tuple[str, str], str], global_: Dict[str, str]) -> Entries:
+    """Словари из .env / колонки tenant.aliases."""
+    out: Entries = {(ANY, n): (a, "") for n, a in global_.items()}
+    out.update(((c.upper(), n), (a, "")) for (c, n), a in scoped.items())
+    return out
+
+
+def _section(j: Dict[str, Any]) -> Entries:
+    out: Entries = {}
+    for raw, alias in (j.get("aliases") or {}).items():
+        out[parse_key(str(raw))] = (str(alias), "")
+    for group, names in (j.get("groups") or {}).items():
+        for raw in names or []:
+            k = parse_key(str(raw))
+            out[k] = _merge(out.get(k, NONE), ("", str(group)))
+    return out
+
+
+def load_file(path: str) -> Dict[str, Entries]:
+    """{'': общий раздел, tid: раздел тенанта}."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise RuntimeError(f"{path}: для YAML нужен PyYAML (pip install pyyaml)")
+            j = yaml.safe_load(f) or {}
+        else:
+            j = json.load(f)
+    if not isinstance(j, dict):
+        raise ValueError(f"{path}: ожидается словарь aliases/groups/tenants")
+    out = {ANY: _section(j)}
+    for tid, sec in (j.get("tenants") or {}).items():
+        out[str(tid)] = _section(sec or {})
+    return out
+
+
+async def load_db() -> Dict[str, Entries]:
+    db = await connection()
+    out: Dict[str, Entries] = {}
+    async with db.execute("SELECT tenant, coin, name, alias, grp FROM worker_alias") as cur:
+        async for tid, coin, name, alias, grp in cur:
+            out.setdefault(tid, {})[(coin, name)] = (alias, grp)
+    return out
+
+
+class AliasRegistry:
+    def __init__(self) -> None:
+        self.version = 0  # растёт при любом изменении источников
+        self._file: Dict[str, Entries] = {}
+        self._file_mtime: float | None = None
+        self._db: Dict[str, Entries] = {}
+        self._db_version: str | None = None
+
+    async def refresh(self) -> bool:
+        """Перечитывает изменившиеся источники; True — что-то поменялось."""
+        changed = False
+        path = settings.aliases_file
+        if path:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._file_mtime:
+                try:
+                    self._file = load_file(path) if mtime is not None else {}
+                    self._file_mtime = mtime
+                    changed = True
+                except Exception as e:
+                    # битый файл не стирает рабочие алиасы — ждём исправления
+                    log.warning("aliases file %s not loaded: %s", path, e)
+                    self._file_mtime = mtime
+        dbv = await kv_get(VERSION_KEY)
+        if dbv != self._db_version:
+            self._db = await load_db()
+            self._db_version = dbv
+            changed = True
+        if changed:
+            self.version += 1
+        return changed
+
+    def table(self, tid: str, base: Entries) -> AliasTable:
+        return AliasTable(
+            layer(base, self._file.get(ANY, {}), self._file.get(tid, {}), self._db.get(tid, {}))
+        )
+
+    async def set(self, tid: str, raw: str, alias: str, group: str = "") -> None:
+        coin, name = parse_key(raw)
+        async with transaction() as db:
+            await db.execute(
+                "REPLACE INTO worker_alias(tenant, coin, name, alias, grp) VALUES(?,?,?,?,?)",
+                (tid, coin, name, alias, group),
+            )
+            await _bump(db)
+
+    async def delete(self, tid: str, raw: str) -> bool:
+        coin, name = parse_key(raw)
+        async with transaction() as db:
+            cur = await db.execute(
+                "DELETE FROM worker_alias WHERE tenant=? AND coin=? AND name=?", (tid, coin, name)
+            )
+            await _bump(db)
+            return cur.rowcount > 0
+
+    def edits(self, tid: str) -> List[Tuple[Key, Entry]]:
+        return sorted(self._db.get(tid, {}).items())
+
+
+async def _bump(db) -> None:
+    await db.execute(
+        "INSERT INTO kv(k, v) VALUES(?, '1') ON CONFLICT(k) DO UPDATE SET v = CAST(v AS INTEGER) + 1",
+        (VERSION_KEY,),
+    )
+
+
+registry = AliasRegistry()
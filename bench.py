@@ -0,0 +1,271 @@
+"""
+Сквозной бенчмарк бота против локального fake_upstream.py и фейкового Telegram.
+
+    python bench.py                       # флоты 10 / 1000 / 10000 воркеров
+    python bench.py --sizes 100 -n 50 --latency-ms 30 --error-rate 0.02
+
+Каждый размер флота гоняется в отдельном процессе (своя база во временном
+каталоге, свой fake_upstream), чтобы память мерилась честно. Меряются:
+- фоновые опросы (poll_workers / poll_payouts / poll_profit / poll_income)
+  с холодным кэшем ответов — каждый прогон реально ходит в апстрим;
+- сборка отчётов меню с холодным кэшем (builder напрямую);
+- нажатие кнопки целиком (cb_router → снимок → edit_message_text);
+- серии нажатий по одному сообщению (burst:*) — сколько правок доходит до
+  Telegram после склейки (callbacks.py).
+Для каждой операции — p50/p99 (мс), запросов к апстриму и сообщений/правок
+Telegram на прогон; для размера — пик tracemalloc и max RSS процесса.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List
+
+import aiohttp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHAT_ID = 1
+_message_ids = itertools.count(1)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else 0.0
+
+
+class FakeBot:
+    """Минимальный Telegram: копит отправленное."""
+
+    def __init__(self) -> None:
+        self.sent = 0
+        self.longest = 0  # самое длинное сообщение (лимит Telegram — 4096 символов)
+
+    async def send_message(self, chat_id: int, text: str, **kw) -> None:
+        self.sent += 1
+
+
+class FakeQuery:
+    def __init__(self, data: str, bot: FakeBot, message: SimpleNamespace):
+        self.data = data
+        self.message = message
+        self._bot = bot
+
+    async def answer(self, *a, **kw) -> None:
+        pass
+
+    async def edit_message_text(self, text: str, **kw) -> None:
+        self._bot.sent += 1
+        self._bot.longest = max(self._bot.longest, len(text))
+
+
+def _fake_update(data: str, bot: FakeBot, message_id: int | None = None):
+    chat = SimpleNamespace(id=CHAT_ID, send_message=lambda text, **kw: bot.send_message(CHAT_ID, text))
+    message = SimpleNamespace(chat=chat, message_id=message_id or next(_message_ids))
+    return SimpleNamespace(effective_chat=chat, callback_query=FakeQuery(data, bot, message))
+
+
+async def _burst(bot_module, fake: FakeBot, taps: List[str], gap_ms: float) -> None:
+    """Серия нажатий по одному (новому) сообщению с интервалом gap_ms, все обрабатываются параллельно."""
+    mid = next(_message_ids)
+    tasks = []
+    for data in taps:
+        tasks.append(asyncio.ensure_future(bot_module.cb_router(_fake_update(data, fake, mid), None)))
+        await asyncio.sleep(gap_ms / 1000)
+    await asyncio.gather(*tasks)
+
+
+# ======================= дочерний процесс: один размер флота =======================
+
+async def _run_size(args: argparse.Namespace) -> Dict:
+    import bot
+    import profit_store
+    import storage
+    from broadcaster import Broadcaster
+    from http_pool import close_sessions, open_sessions
+    from leader import Leader, LocalLease
+    from reports import reports
+    from tenants import DEFAULT, registry
+
+    async def upstream(method: str, path: str) -> Dict[str, int]:
+        async with aiohttp.ClientSession() as s:
+            async with s.request(method, args.upstream + path) as r:
+                return await r.json()
+
+    tracemalloc.start()
+    await storage.init_db()
+    await open_sessions()
+    await registry.seed_from_settings()
+    t = registry.get(DEFAULT)
+    fake = FakeBot()
+    app = SimpleNamespace(bot=fake, bot_data={})
+
+    async def noop(*a) -> None:
+        pass
+
+    lead = app.bot_data["leader"] = Leader(LocalLease(), ttl=30, on_elected=noop, on_lost=noop)
+    await lead.start()
+    broadcaster = app.bot_data["broadcaster"] = Broadcaster(fake, global_rate=1000, chat_rate=1000, concurrency=4)
+    await broadcaster.start()
+
+    def cold() -> None:
+        t.client.cache.invalidate()
+        profit_store._synced_at.clear()
+
+    ops: Dict[str, Callable[[], Awaitable[object]]] = {
+        "poll:workers": lambda: bot.poll_workers(app, t.id),
+        "poll:payouts": lambda: bot.poll_payouts(app, t.id),
+        "poll:profit": lambda: bot.poll_profit(app, t.id),
+        "poll:income": lambda: bot.poll_income(app, t.id),
+    }
+    for kind in ("today_msk", "today_since", "hashrate", "payouts_ALL"):
+        ops[f"build:{kind}"] = functools.partial(reports._builders[kind], t)
+    callbacks = ("today_msk", "today_since", "hashrate", "hr:all:3", "hr:off:0", "payouts_ALL")
+    bursts = {
+        "burst:hashrate x5": lambda: _burst(bot, fake, ["hashrate"] * 5, 0),
+        "burst:hr pages x5": lambda: _burst(bot, fake, [f"hr:all:{i}" for i in range(1, 6)], 50),
+    }
+
+    results: Dict[str, Dict] = {}
+
+    async def measure(name: str, fn: Callable[[], Awaitable[object]], before: Callable[[], None] | None) -> None:
+        await fn()  # прогрев (базовые линии реестров, первая синхронизация истории)
+        await upstream("POST", "/__reset")
+        lat: List[float] = []
+        errors = 0
+        sent0 = fake.sent
+        for _ in range(args.n):
+            if before:
+                before()
+            t0 = time.perf_counter()
+            try:
+                await fn()
+            except Exception:
+                errors += 1
+            lat.append((time.perf_counter() - t0) * 1000)
+        reqs = sum((await upstream("GET", "/__stats")).values())
+        results[name] = {
+            "p50": _pct(lat, 0.5), "p99": _pct(lat, 0.99), "upstream": reqs / args.n, "errors": errors,
+            "sent": (fake.sent - sent0) / args.n,
+        }
+
+    try:
+        for name, fn in ops.items():
+            await measure(name, fn, cold)
+        for kind in callbacks:
+            # каждое нажатие — по новому сообщению: одиночное нажатие, без debounce
+            await measure(f"button:{kind}", lambda: bot.cb_router(_fake_update(kind, fake), None), None)
+        for name, fn in bursts.items():
+            await measure(name, fn, None)
+        _, peak = tracemalloc.get_traced_memory()
+        return {
+            "workers": args.workers,
+            "ops": results,
+            "tracemalloc_peak_mb": peak / 2**20,
+            "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "sent": fake.sent,
+            "longest_message": fake.longest,
+            "reports": len(reports),
+        }
+    finally:
+        await broadcaster.stop()
+        await lead.stop()
+        await close_sessions()
+        await storage.close_db()
+
+
+def _child(args: argparse.Namespace) -> None:
+    port = _free_port()
+    cmd = [
+        sys.executable, os.path.join(HERE, "fake_upstream.py"), "--port", str(port),
+        "--workers", str(args.workers), "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+    ]
+    srv = subprocess.Popen(cmd)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                    break
+            except OSError:
+                time.sleep(0.05)
+        tmp = tempfile.mkdtemp(prefix="trustbot-bench-")
+        os.environ.update(
+            TRUSTPOOL_BASE=f"{base}/res/saas",
+            COINGECKO_BASE=f"{base}/api/v3",
+            TRUSTPOOL_ACCESS_KEY="bench",
+            TELEGRAM_TOKEN="123:bench",
+            TELEGRAM_CHAT_IDS=str(CHAT_ID),
+            DB_PATH=os.path.join(tmp, "state.db"),
+            COINS="BTC,LTC",
+            ONLY_OFFLINE_ALERTS="false",
+            ALERT_MIN_DAILY_USD="25",
+        )
+        args.upstream = base
+        sys.path.insert(0, HERE)
+        print(json.dumps(asyncio.run(_run_size(args))))
+    finally:
+        srv.terminate()
+        srv.wait()
+
+
+# ======================= родитель: таблица по размерам =======================
+
+def _report(res: Dict) -> None:
+    print(f"\n=== {res['workers']} воркеров: tracemalloc peak {res['tracemalloc_peak_mb']:.1f} MB, "
+          f"max RSS {res['maxrss_mb']:.0f} MB, самое длинное сообщение {res['longest_message']} симв.")
+    print(f"{'операция':<24}{'p50, мс':>10}{'p99, мс':>10}{'апстрим/прогон':>16}{'Telegram/прогон':>17}{'ошибок':>8}")
+    for name, r in res["ops"].items():
+        print(
+            f"{name:<24}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['upstream']:>16.1f}{r['sent']:>17.1f}{r['errors']:>8}"
+        )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10,1000,10000")
+    ap.add_argument("-n", type=int, default=20, help="прогонов на операцию")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--workers", type=int, help=argparse.SUPPRESS)  # дочерний процесс
+    args = ap.parse_args()
+
+    if args.workers is not None:
+        _child(args)
+        return
+
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--workers", str(size), "-n", str(args.n),
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate),
+        ]
+        out = subprocess.run(cmd, capture_output=True, text=True, env={**os.environ})
+        line = out.stdout.strip().splitlines()[-1:] if out.returncode == 0 else []
+        if not line:
+            print(f"\n=== {size} воркеров: прогон упал\n{out.stderr[-2000:]}")
+            continue
+        _report(json.loads(line[0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,45 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from typing import List, Dict
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
 
 from settings import settings
-from trustpool_client import TrustpoolClient
+import prices
 from prices import get_prices
-from alerts import check_offline, check_payouts
-from storage import init_db
+from alerts import check_offline, check_payouts, check_hashrate_drop, check_daily_income, record
+from storage import init_db, close_db, transaction
+from http_pool import open_sessions, close_sessions
+from fanout import gather_map
+from broadcaster import Broadcaster
+from cache import hit_ratio
+import profit_store
+import price_store
+import worker_series
+import payout_ledger
+import export
+from units import fmt_hashrate
+from models import Payout
+from tenants import Tenant, registry
+from reports import Snapshot, reports
+import fleet
+from fleet import FleetView
+import scheduler
+import webhook
+import metrics
+import tape
+import aliases
+import resilience
+from callbacks import coalescer, digest
+from leader import Leader, backend as leader_backend
 
 MSK = ZoneInfo("Europe/Moscow")
-client = TrustpoolClient()
 
 # ======================= helpers =======================
 
@@ -30,53 +55,80 @@ def _msk_midnight_to_now_utc_range() -> tuple[int, int]:
     start_utc = start_msk.astimezone(timezone.utc)
     return int(start_utc.timestamp()), int(now_utc.timestamp())
 
-async def _sum_profit_between(coin: str, start_ts: int, end_ts: int) -> float:
+async def _value_between(
+    t: Tenant, coin: str, start_ts: int, end_ts: int, spot: asyncio.Future
+) -> tuple[float, float | None]:
     """
-    Суммируем прибыль coin по точкам почасового графика в интервале [start_ts, end_ts].
-    Доп. защита: если time в миллисекундах — приводим к секундам.
+    (монет, стоимость в фиате) за [start_ts, end_ts] по локальной почасовой истории:
+    монеты — из накопленной суммы (два индексных поиска), фиат — каждый час прибыли
+    по цене того же часа. Перед подсчётом дотягиваем только
+    недостающие часы прибыли и цен; без истории цен — по текущей цене (spot), а
+    если и её нет — стоимость None («курс недоступен»).
     """
-    data = await client.profit_chart(coin=coin, range_type="hour", size=24 * 14)
-    total = 0.0
-    for p in data:
-        if not isinstance(p, dict):
-            continue
-        ts = int(p.get("time", 0) or 0)
-        if ts > 2_000_000_000_000:
-            ts //= 1000
-        elif ts > 50_000_000_000:
-            ts //= 1000
-        if start_ts <= ts <= end_ts:
-            try:
-                total += float(p.get("profit", 0.0) or 0.0)
-            except Exception:
-                pass
-    return total
-
-async def _broadcast(app: Application, text: str):
-    if not settings.tg_chats:
+    await profit_store.sync(t.client, coin)
+    try:
+        await price_store.sync(coin, t.fiat)
+    except Exception:
+        pass  # CoinGecko недоступен — досчитаем по последней известной / текущей цене
+    # spot общий на все монеты отчёта: shield, чтобы дедлайн одной монеты его не отменил
+    try:
+        prices_map = await asyncio.shield(spot)
+    except Exception:
+        prices_map = {}
+    amount, value = await asyncio.gather(
+        profit_store.sum_between(t.id, coin, start_ts, end_ts),
+        price_store.value_between(t.id, coin, t.fiat, start_ts, end_ts, _price(prices_map, coin)),
+    )
+    return amount, value
+
+async def _broadcast(app: Application, t: Tenant, text: str):
+    if not t.chats:
         return
-    for chat_id in settings.tg_chats:
+    await app.bot_data["broadcaster"].enqueue(t.chats, text)
+
+def _tenant(update: Update) -> Tenant | None:
+    chat = update.effective_chat
+    return registry.for_chat(chat.id) if chat else None
+
+def _is_admin(update: Update) -> bool:
+    chat = update.effective_chat
+    return bool(chat and chat.id in settings.admin_chats)
+
+async def _reply(update: Update, text: str, edit: bool = False, reply_markup=None):
+    h = digest(text, reply_markup)
+    if edit and update.callback_query:
+        q = update.callback_query
+        if coalescer.unchanged(q.message, h):
+            return  # на экране уже ровно это
         try:
-            await app.bot.send_message(chat_id=chat_id, text=text)
-        except Exception as e:
-            print(f"Send to {chat_id} failed: {e}")
-
-def _fiat_total(amounts: Dict[str, float], prices: Dict[str, float]) -> float:
-    if not isinstance(amounts, dict) or not isinstance(prices, dict):
-        return 0.0
-    total = 0.0
-    for c in settings.coins:
-        a = float(amounts.get(c, 0.0) or 0.0)
-        p = float(prices.get(c, 0.0) or 0.0)
-        total += a * p
-    return total
-
-def _price(prices, coin: str) -> float:
-    # безопасно берём цену монеты
+            await q.edit_message_text(text, reply_markup=reply_markup)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        coalescer.remember(q.message, h)
+    else:
+        msg = await update.effective_chat.send_message(text, reply_markup=reply_markup)
+        coalescer.remember(msg, h)
+
+NO_TENANT = "Этот чат не привязан ни к одному аккаунту Trustpool."
+
+def _price(prices, coin: str) -> float | None:
+    # безопасно берём цену монеты; None — цены нет
     try:
-        return float((prices or {}).get(coin, 0.0) or 0.0)
+        v = (prices or {}).get(coin)
+        return float(v) if v is not None else None
     except Exception:
-        return 0.0
+        return None
+
+def _fiat_str(value: float | None, fiat: str) -> str:
+    return f"{value:.2f} {fiat}" if value is not None else "? (курс недоступен)"
+
+def _total_line(values: List[float | None], fiat: str) -> str:
+    known = [v for v in values if v is not None]
+    if values and not known:
+        return f"Итого ≈ {_fiat_str(None, fiat)}"
+    line = f"Итого ≈ {sum(known):.2f} {fiat}"
+    return line if len(known) == len(values) else line + " (без монет без курса)"
 
 def _main_menu_keyboard() -> InlineKeyboardMarkup:
     kb = [
@@ -106,33 +158,168 @@ async def cmd_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await update.effective_chat.send_message(text, reply_markup=_main_menu_keyboard())
 
 async def cmd_today(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    await _handle_today_msk(update, ctx)
+    await _serve(update, "today_msk")
 
 async def cmd_hashrate(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    await _handle_hashrate(update, ctx)
+    await _serve(update, "hashrate")
 
 async def cmd_payouts(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     args = ctx.args or []
     mode = (args[0].upper() if args else "ALL")
-    await _handle_payouts_generic(update, ctx, mode)
+    await _serve(update, f"payouts_{mode if mode in PAYOUT_MODES else 'ALL'}")
+
+async def cmd_income(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    t = _tenant(update)
+    if t is None:
+        await update.effective_chat.send_message(NO_TENANT)
+        return
+    spec = (ctx.args[0] if ctx.args else "7d").lower()
+    try:
+        start_ts, end_ts = profit_store.period_range(spec, MSK)
+    except ValueError as e:
+        await update.effective_chat.send_message(str(e))
+        return
+    spot = asyncio.ensure_future(get_prices(t.coins, t.fiat))
+    by_coin = await gather_map(t.coins, lambda c: _value_between(t, c, start_ts, end_ts, spot))
+    sums: Dict[str, tuple[float, float]] = {c: v for c, v in by_coin.items() if not isinstance(v, BaseException)}
+    firsts = await gather_map(t.coins, lambda c: profit_store.first_ts(t.id, c))
+
+    lines = [f"📈 Доход за {spec}\nс {_fmt_ts(start_ts)} по {_fmt_ts(end_ts)}:"]
+    for c in t.coins:
+        if c not in sums:
+            lines.append(f"• {c}: нет данных")
+            continue
+        amt, fiat = sums[c]
+        line = f"• {c}: {amt:.8f} ≈ {_fiat_str(fiat, t.fiat)}"
+        first = firsts.get(c)
+        if isinstance(first, int) and first > start_ts:
+            line += f" (история с {_fmt_ts(first)})"
+        lines.append(line)
+    lines.append(_total_line([f for _, f in sums.values()], t.fiat))
+    await update.effective_chat.send_message("\n".join(lines))
+
+_exporting: set[str] = set()  # тенанты, для которых выгрузка готовится или загружается
+
+async def cmd_export(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/export <profit|payouts|workers> [период] — история в CSV (gzip) документом."""
+    t = _tenant(update)
+    chat = update.effective_chat
+    if t is None:
+        await chat.send_message(NO_TENANT)
+        return
+    args = [a.lower() for a in ctx.args or []]
+    if not args or args[0] not in export.DATASETS:
+        await chat.send_message(
+            f"Использование: /export <{'|'.join(export.DATASETS)}> [период: 24h, 7d, 30d, 90d, mtd, ytd]"
+        )
+        return
+    dataset, spec = args[0], (args[1] if len(args) > 1 else "30d")
+    try:
+        start_ts, end_ts = profit_store.period_range(spec, MSK)
+    except ValueError as e:
+        await chat.send_message(str(e))
+        return
+    if t.id in _exporting:
+        await chat.send_message("Выгрузка по этому аккаунту уже готовится, дождитесь файла")
+        return
+    # занимаем до первого await: параллельный /export того же тенанта увидит флаг
+    _exporting.add(t.id)
+    try:
+        await chat.send_message(f"⏳ Готовлю выгрузку {dataset} за {spec}…")
+        # в фоне: выгрузка за год не должна держать обработку остальных апдейтов
+        ctx.application.create_task(_send_export(chat, t, dataset, spec, start_ts, end_ts))
+    except BaseException:
+        _exporting.discard(t.id)  # задача не запущена — освобождать флаг больше некому
+        raise
+
+async def _send_export(chat, t: Tenant, dataset: str, spec: str, start_ts: int, end_ts: int):
+    # тенант занят, пока файл не ушёл в Telegram: временный файл живёт до конца загрузки
+    try:
+        try:
+            f, n = await export.build(t, dataset, start_ts, end_ts)
+        except export.TooLarge as e:
+            await chat.send_message(str(e))
+            return
+        except Exception:
+            await chat.send_message("Не удалось подготовить выгрузку, попробуйте позже")
+            raise
+        with f:
+            await chat.send_document(
+                f, filename=f"{t.id}_{dataset}_{spec}.csv.gz", write_timeout=120,
+                caption=f"📤 {dataset}: {n} строк\nс {_fmt_ts(start_ts)} по {_fmt_ts(end_ts)}",
+            )
+    finally:
+        _exporting.discard(t.id)
+
+async def cmd_worker(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    t = _tenant(update)
+    if t is None:
+        await update.effective_chat.send_message(NO_TENANT)
+        return
+    query = " ".join(ctx.args or []).strip().lower()
+    if not query:
+        await update.effective_chat.send_message("Использование: /worker <имя или алиас>")
+        return
+    ws = await t.client.worker_stats()
+    found = [w for w in ws if query in (w.name.lower(), w.alias.lower())]
+    if not found:
+        await update.effective_chat.send_message("Воркер не найден")
+        return
+    lines: List[str] = []
+    for w in found:
+        lines.append(f"⚙️ {w.alias} ({w.coin}), сейчас {fmt_hashrate(w.hr_recent)}")
+        for label, sec in (("1ч", 3600), ("24ч", 86400), ("7д", 7 * 86400), ("30д", 30 * 86400)):
+            st = await worker_series.stats(t.id, w.coin, w.name, sec)
+            if st is None:
+                lines.append(f"• {label}: нет данных")
+            else:
+                mn, avg, mx, _ = st
+                lines.append(f"• {label}: avg {fmt_hashrate(avg)} (min {fmt_hashrate(mn)}, max {fmt_hashrate(mx)})")
+    await update.effective_chat.send_message("\n".join(lines))
+
+async def cmd_cache(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    t = _tenant(update)
+    if t is None:
+        await update.effective_chat.send_message(NO_TENANT)
+        return
+    stats = {**t.client.cache.stats(), **prices.cache.stats()}
+    if not stats:
+        await update.effective_chat.send_message("Кэш пока пуст")
+        return
+    lines = ["🗄 Кэш Trustpool и цен (hit / stale / coalesced / miss / fallback):"]
+    for path, c in sorted(stats.items()):
+        lines.append(
+            f"• {path}: {c.get('hit', 0)} / {c.get('stale', 0)} / {c.get('coalesced', 0)} / {c.get('miss', 0)}"
+            f" / {c.get('fallback', 0)} — {hit_ratio(c) * 100:.0f}%"
+        )
+    sched = scheduler.stats()
+    if sched:
+        lines.append("⏱ Опрос (тенантов / интервал / ошибок подряд):")
+        lines += [f"• {name}: {n} / {iv:.0f}s / {err}" for name, n, iv, err in sched]
+    circuits = resilience.open_circuits()
+    if circuits:
+        lines.append("🔌 Отключены до восстановления: " + ", ".join(f"{u} {e}" for u, e in circuits))
+    await update.effective_chat.send_message("\n".join(lines))
 
 # ======================= callback handlers =======================
 
+def _cb_label(update: Update, ctx=None) -> str:
+    data = update.callback_query.data if update.callback_query else ""
+    if data.startswith("hr:"):
+        return "cb:hashrate_page"
+    return f"cb:{data if data in reports.kinds() else 'other'}"
+
 async def cb_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     if not q or not q.data:
         return
     data = q.data
     try:
-        if data == "today_msk":
-            await _handle_today_msk(update, ctx, edit=True)
-        elif data == "today_since":
-            await _handle_today_since(update, ctx, edit=True)
-        elif data == "hashrate":
-            await _handle_hashrate(update, ctx, edit=True)
-        elif data.startswith("payouts_"):
-            _, coin = data.split("_", 1)
-            await _handle_payouts_generic(update, ctx, coin, edit=True)
+        # повторы и серии нажатий по одному сообщению склеиваются (callbacks.py)
+        if data in reports.kinds():
+            await coalescer.run(q.message, data, lambda: _serve(update, data, edit=True))
+        elif data.startswith("hr:"):
+            await coalescer.run(q.message, data, lambda: _serve_fleet_page(update, data))
         else:
             await q.answer("Неизвестное действие", show_alert=False)
             return
@@ -145,166 +332,457 @@ async def cb_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 # ======================= core UI actions =======================
 
-async def _handle_today_msk(update: Update, ctx: ContextTypes.DEFAULT_TYPE, edit: bool = False):
+PAYOUT_MODES = ("BTC", "LTC", "DOGE", "ALL")
+
+def _msk_midnight_ts() -> float:
+    return _msk_midnight_to_now_utc_range()[0]
+
+async def _serve(update: Update, kind: str, edit: bool = False):
+    """Отвечает из материализованного снимка отчёта (см. reports.py)."""
+    t = _tenant(update)
+    if t is None:
+        await _reply(update, NO_TENANT, edit)
+        return
+    # «сегодня» после полуночи МСК — уже другой отчёт, вчерашний снимок не отдаём
+    not_before = _msk_midnight_ts() if kind == "today_msk" else 0.0
+    snap = await reports.get(t, kind, max_age=settings.report_max_age_sec, not_before=not_before)
+    kb = _fleet_keyboard(snap.value) if isinstance(snap.value, FleetView) else _main_menu_keyboard()
+    await _reply(update, f"{snap.text}\n\n{_footer(snap)}", edit, kb)
+
+def _footer(snap: Snapshot) -> str:
+    stamp = datetime.fromtimestamp(snap.built_at, tz=MSK).strftime("%H:%M")
+    footer = f"🕒 данные на {stamp} МСК"
+    if snap.stale:
+        footer += "\n⚠️ " + ", ".join(
+            f"{src} не отвечает — данные на {datetime.fromtimestamp(ts, tz=MSK).strftime('%H:%M')}"
+            for src, ts in sorted(snap.stale.items())
+        )
+    return footer
+
+async def _report_today_msk(t: Tenant) -> str:
     start_ts, end_ts = _msk_midnight_to_now_utc_range()
-    prices_map = await get_prices()
-    if not isinstance(prices_map, dict):
-        prices_map = {}
+    spot = asyncio.ensure_future(get_prices(t.coins, t.fiat))
+    by_coin = await gather_map(t.coins, lambda c: _value_between(t, c, start_ts, end_ts, spot))
 
-    msk_sum_by_coin: Dict[str, float] = {}
-    for coin in settings.coins:
-        try:
-            msk_sum_by_coin[coin] = await _sum_profit_between(coin, start_ts, end_ts)
-        except Exception:
-            msk_sum_by_coin[coin] = 0.0
+    msk_sum_by_coin: Dict[str, tuple[float, float]] = {
+        c: v for c, v in by_coin.items() if not isinstance(v, BaseException)
+    }
 
     now_msk = datetime.now(MSK)
     start_msk = datetime(now_msk.year, now_msk.month, now_msk.day, 0, 0, 0, tzinfo=MSK)
     lines = [f"📅 Доход за сегодня (МСК)\nс {start_msk.strftime('%H:%M %Z')} по {now_msk.strftime('%H:%M %Z')}:"]
 
-    for c in settings.coins:
-        amt = float(msk_sum_by_coin.get(c, 0.0) or 0.0)
-        fiat = amt * _price(prices_map, c)
-        lines.append(f"• {c}: {amt:.8f} ≈ {fiat:.2f} {settings.fiat}")
-
-    lines.append(f"Итого ≈ {_fiat_total(msk_sum_by_coin, prices_map):.2f} {settings.fiat}")
-    text = "\n".join(lines)
-
-    if edit and update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=_main_menu_keyboard())
-    else:
-        await update.effective_chat.send_message(text, reply_markup=_main_menu_keyboard())
-
-async def _handle_today_since(update: Update, ctx: ContextTypes.DEFAULT_TYPE, edit: bool = False):
+    for c in t.coins:
+        if c not in msk_sum_by_coin:
+            lines.append(f"• {c}: нет данных")
+            continue
+        amt, fiat = msk_sum_by_coin[c]
+        lines.append(f"• {c}: {amt:.8f} ≈ {_fiat_str(fiat, t.fiat)}")
+
+    lines.append(_total_line([f for _, f in msk_sum_by_coin.values()], t.fiat))
+    return "\n".join(lines)
+
+async def _since_last_payout(
+    t: Tenant, coin: str, now_ts: int, spot: asyncio.Future
+) -> tuple[int, tuple[float, float]]:
+    """(время последней выплаты, (монет, фиат) с неё) по одной монете."""
+    await payout_ledger.ensure(t.client, coin)
+    last = await payout_ledger.last(t.id, coin)
+    lp_ts = last[0] if last else 0
+    if lp_ts <= 0:
+        return 0, (0.0, 0.0)
+    return lp_ts, await _value_between(t, coin, lp_ts, now_ts, spot)
+
+async def _report_today_since(t: Tenant) -> str:
     now_utc_ts = int(datetime.now(timezone.utc).timestamp())
-    prices_map = await get_prices()
-    if not isinstance(prices_map, dict):
-        prices_map = {}
+    spot = asyncio.ensure_future(get_prices(t.coins, t.fiat))
+    by_coin = await gather_map(t.coins, lambda c: _since_last_payout(t, c, now_utc_ts, spot))
 
     last_payout_ts_by_coin: Dict[str, int] = {}
-    for coin in settings.coins:
-        try:
-            pays = await client.payouts_list(coin, limit=1)
-        except Exception:
-            pays = []
-        if pays:
-            last_payout_ts_by_coin[coin] = int(pays[0].get("time", 0))
-
-    since_pay_sum_by_coin: Dict[str, float] = {}
-    for coin in settings.coins:
-        lp_ts = int(last_payout_ts_by_coin.get(coin, 0) or 0)
-        if lp_ts > 0:
-            try:
-                since_pay_sum_by_coin[coin] = await _sum_profit_between(coin, lp_ts, now_utc_ts)
-            except Exception:
-                since_pay_sum_by_coin[coin] = 0.0
-        else:
-            since_pay_sum_by_coin[coin] = 0.0
+    since_pay_sum_by_coin: Dict[str, tuple[float, float]] = {}
+    for coin, r in by_coin.items():
+        if isinstance(r, BaseException):
+            continue
+        lp_ts, amt = r
+        if lp_ts:
+            last_payout_ts_by_coin[coin] = lp_ts
+        since_pay_sum_by_coin[coin] = amt
 
     lines = ["💸 Доход с момента последней выплаты:"]
-    for c in settings.coins:
-        amt = float(since_pay_sum_by_coin.get(c, 0.0) or 0.0)
-        fiat = amt * _price(prices_map, c)
+    for c in t.coins:
+        if c not in since_pay_sum_by_coin:
+            lines.append(f"• {c}: нет данных")
+            continue
+        amt, fiat = since_pay_sum_by_coin[c]
         lp = last_payout_ts_by_coin.get(c)
         lp_str = _fmt_ts(lp, tz=MSK) if lp else "—"
-        lines.append(f"• {c}: {amt:.8f} ≈ {fiat:.2f} {settings.fiat} (последняя выплата: {lp_str})")
-
-    lines.append(f"Итого ≈ {_fiat_total(since_pay_sum_by_coin, prices_map):.2f} {settings.fiat}")
-    text = "\n".join(lines)
-
-    if edit and update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=_main_menu_keyboard())
-    else:
-        await update.effective_chat.send_message(text, reply_markup=_main_menu_keyboard())
-
-async def _handle_hashrate(update: Update, ctx: ContextTypes.DEFAULT_TYPE, edit: bool = False):
-    ws = await client.worker_stats()
-    on = sum(1 for w in ws if (w.get("status") or "").lower() == "active")
-    off = len(ws) - on
-    lines = [f"⚙️ Воркеры: online {on}, offline {off}"]
-    for w in ws:
-        lines.append(f"• {w['alias']}: {w['recent_hashrate']} (24h {w['hashrate_1day']}) — {w['coin']}")
-    text = "\n".join(lines)
-    if edit and update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=_main_menu_keyboard())
-    else:
-        await update.effective_chat.send_message(text, reply_markup=_main_menu_keyboard())
+        lines.append(f"• {c}: {amt:.8f} ≈ {_fiat_str(fiat, t.fiat)} (последняя выплата: {lp_str})")
+
+    lines.append(_total_line([f for _, f in since_pay_sum_by_coin.values()], t.fiat))
+    return "\n".join(lines)
+
+async def _report_hashrate(t: Tenant) -> FleetView:
+    ws = await t.client.worker_stats()
+    return FleetView(ws, page_size=settings.hashrate_page_size, top_n=settings.hashrate_top_n)
+
+def _fleet_keyboard(view: FleetView, flt: str | None = None, page: int = 0, pages: int = 1) -> InlineKeyboardMarkup:
+    """Фильтры (+ листание на странице списка) над обычным меню."""
+    filters = [(fleet.ALL, "📋 Все"), (fleet.OFFLINE, f"🔴 Офлайн ({view.offline})")]
+    filters += [(c, c) for c in view.coins] if len(view.coins) > 1 else []
+    rows = [[InlineKeyboardButton(label, callback_data=f"hr:{f}:0") for f, label in filters if f != flt]]
+    if flt is not None:
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("◀️", callback_data=f"hr:{flt}:{page - 1}"))
+        nav.append(InlineKeyboardButton("📊 Сводка", callback_data="hashrate"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton("▶️", callback_data=f"hr:{flt}:{page + 1}"))
+        rows.append(nav)
+    return InlineKeyboardMarkup(rows + list(_main_menu_keyboard().inline_keyboard))
+
+async def _serve_fleet_page(update: Update, data: str):
+    """hr:<фильтр>:<страница> — страница списка воркеров из снимка отчёта «hashrate»."""
+    t = _tenant(update)
+    if t is None:
+        await _reply(update, NO_TENANT, True)
+        return
+    _, flt, page = data.split(":", 2)
+    snap = await reports.get(t, "hashrate", max_age=settings.report_max_age_sec)
+    view: FleetView = snap.value
+    text, page, pages = view.page(flt, int(page) if page.isdigit() else 0)
+    await _reply(update, f"{text}\n\n{_footer(snap)}", True, _fleet_keyboard(view, flt, page, pages))
 
-async def _handle_payouts_generic(update: Update, ctx: ContextTypes.DEFAULT_TYPE, mode: str, edit: bool = False):
-    mode = (mode or "ALL").upper()
+async def _report_payouts(t: Tenant, mode: str) -> str:
     if mode == "LTC":
         coins: List[str] = ["LTC", "DOGE"]
     elif mode in {"BTC", "DOGE"}:
         coins = [mode]
     else:
-        coins = list(settings.coins)
+        coins = list(t.coins)
+
+    async def recent(coin: str) -> List[Payout]:
+        await payout_ledger.ensure(t.client, coin)
+        return await payout_ledger.recent(t.id, coin, limit=10)
+
+    by_coin = await gather_map(coins, recent)
 
     lines: List[str] = []
     for coin in coins:
-        try:
-            pts = await client.payouts_list(coin, limit=10)
-        except Exception:
-            pts = []
+        pts = by_coin.get(coin)
         lines.append(f"🧾 Последние выплаты {coin}:")
-        if not pts:
+        if isinstance(pts, BaseException):
+            lines.append("• ошибка получения данных")
+        elif not pts:
             lines.append("• нет данных")
         else:
             for p in pts:
-                when = _fmt_ts(int(p.get("time", 0)), tz=MSK)
-                lines.append(f"• {when}: {p.get('amount', 0)} {coin}")
+                when = _fmt_ts(p.time, tz=MSK)
+                lines.append(f"• {when}: {p.amount} {coin}")
         lines.append("")
-    text = "\n".join(lines).strip()
-    if edit and update.callback_query:
-        await update.callback_query.edit_message_text(text, reply_markup=_main_menu_keyboard())
-    else:
-        await update.effective_chat.send_message(text, reply_markup=_main_menu_keyboard())
+    return "\n".join(lines).strip()
 
-# ======================= alerts loop =======================
+reports.register("today_msk", _report_today_msk)
+reports.register("today_since", _report_today_since)
+reports.register("hashrate", _report_hashrate)
+for _mode in PAYOUT_MODES:
+    reports.register(f"payouts_{_mode}", functools.partial(_report_payouts, mode=_mode))
+
+# ======================= tenants (admin) =======================
+
+async def cmd_tenants(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update):
+        return
+    ts = registry.all()
+    if not ts:
+        await update.effective_chat.send_message("Тенантов нет")
+        return
+    lines = [f"👥 Тенанты ({len(ts)}):"]
+    for t in sorted(ts, key=lambda t: t.id)[:100]:
+        lines.append(f"• {t.id}: {','.join(t.coins)} / {t.fiat}, чатов {len(t.chats)}")
+    await update.effective_chat.send_message("\n".join(lines))
+
+async def cmd_tenant_add(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/tenant_add <id> <access_key> [COINS] [FIAT]"""
+    if not _is_admin(update):
+        return
+    args = ctx.args or []
+    if len(args) < 2:
+        await update.effective_chat.send_message("Использование: /tenant_add <id> <access_key> [BTC,LTC] [USD]")
+        return
+    tid, key = args[0], args[1]
+    coins = [c.strip().upper() for c in (args[2] if len(args) > 2 else "BTC").split(",") if c.strip()]
+    fiat = args[3] if len(args) > 3 else "USD"
+    await registry.upsert(tid, key, coins, fiat)
+    if ctx.application.bot_data["leader"].is_leader:
+        scheduler.schedule_tenant(ctx.application, tid)
+    await update.effective_chat.send_message(f"Тенант {tid} сохранён")
+
+async def cmd_tenant_del(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update) or not ctx.args:
+        return
+    await registry.remove(ctx.args[0])
+    scheduler.unschedule_tenant(ctx.application, ctx.args[0])
+    reports.drop(ctx.args[0])
+    await update.effective_chat.send_message(f"Тенант {ctx.args[0]} отключён")
+
+async def cmd_subscribe(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/tenant_sub <id> — привязать текущий чат к тенанту (алерты + команды)."""
+    if not _is_admin(update) or not ctx.args:
+        return
+    if registry.get(ctx.args[0]) is None:
+        await update.effective_chat.send_message("Нет такого тенанта")
+        return
+    await registry.subscribe(ctx.args[0], update.effective_chat.id)
+    await update.effective_chat.send_message(f"Чат привязан к {ctx.args[0]}")
 
-async def poll_and_alert(context: ContextTypes.DEFAULT_TYPE):
-    app = context.application
-    ws = await client.worker_stats()
-
-    events = []
-    if settings.only_offline_alerts:
-        events += await check_offline(ws)
-        # выплаты (оставляем, можно вырубить — закомментировать блок)
-        latest_payouts = []
-        for c in settings.coins:
-            try:
-                p = await client.payouts(c)
-            except Exception:
-                p = []
-            if p:
-                latest_payouts = p
-                break
-        events += await check_payouts(latest_payouts)
+async def cmd_unsubscribe(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update) or not ctx.args:
+        return
+    await registry.unsubscribe(ctx.args[0], update.effective_chat.id)
+    await update.effective_chat.send_message(f"Чат отвязан от {ctx.args[0]}")
+
+async def cmd_alias(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """/alias <воркер|COIN:воркер> <алиас|-> [группа] — алиас/группа воркера тенанта чата."""
+    t = _tenant(update)
+    if not _is_admin(update) or t is None:
+        return
+    args = ctx.args or []
+    if len(args) < 2:
+        lines = ["Использование: /alias <воркер|BTC:воркер> <алиас|-> [группа]", "«-» без группы — удалить правку."]
+        edits = aliases.registry.edits(t.id)
+        if edits:
+            lines.append(f"Правки ({len(edits)}):")
+            lines += [
+                f"• {c + ':' if c else ''}{n} → {a or '—'}{f' [{g}]' if g else ''}" for (c, n), (a, g) in edits[:50]
+            ]
+        await update.effective_chat.send_message("\n".join(lines))
+        return
+    raw, alias = args[0], args[1]
+    group = " ".join(args[2:])
+    if alias == "-" and not group:
+        ok = await aliases.registry.delete(t.id, raw)
+        msg = f"Правка для {raw} удалена" if ok else f"Для {raw} правок нет"
     else:
-        events += await check_offline(ws)
+        await aliases.registry.set(t.id, raw, "" if alias == "-" else alias, group)
+        msg = f"{raw} → {alias}{f' [{group}]' if group else ''}"
+    await registry.load()
+    reports.invalidate(t.id, "hashrate")
+    await update.effective_chat.send_message(msg)
 
+# ======================= alerts loop =======================
+
+async def _fleet_fiat_24h(t: Tenant) -> float:
+    """
+    Доход флота за 24ч в фиате. Если доход или курс какой-то монеты не получены —
+    исключение: ноль вместо них выглядел бы как падение дохода.
+    """
+    revenue, prices_map = await asyncio.gather(t.client.revenue_24h(), get_prices(t.coins, t.fiat))
+    missing = [c for c in t.coins if revenue.get(c) and c not in prices_map]
+    if missing:
+        raise LookupError(f"CoinGecko: нет курса {', '.join(missing)}/{t.fiat}")
+    return sum(revenue.get(c, 0.0) * prices_map.get(c, 0.0) for c in t.coins)
+
+async def _fence(app: Application) -> None:
+    """Внутри транзакции опроса: пишем от имени лидера, только пока аренда наша."""
+    await app.bot_data["leader"].fence()
+
+async def _alert(app: Application, t: Tenant, events) -> None:
+    """Журнал + постановка в outbox — в транзакции опроса, после _fence."""
+    await record(t, events)
     if events:
         text = "🚨 Алерты:\n" + "\n".join(f"• {e.msg}" for e in events)
-        await _broadcast(app, text)
+        await _broadcast(app, t, text)
+
+async def poll_workers(app: Application, tid: str) -> bool | None:
+    """Статусы воркеров: офлайн/онлайн, падение хешрейта, сэмплы рядов."""
+    t = registry.get(tid)
+    if t is None:
+        return None
+    ws = await t.client.worker_stats()
+    # всё состояние алертов опроса — одним коммитом
+    async with transaction():
+        await _fence(app)
+        events = await check_offline(t, ws)
+        if not settings.only_offline_alerts:
+            events += await check_hashrate_drop(t, ws)
+        await worker_series.append(t.id, ws)
+        await _alert(app, t, events)
+    reports.invalidate(t.id, "hashrate")
+    return bool(events)
+
+def _workers_due(tid: str) -> float | None:
+    t = registry.get(tid)
+    return t.states.next_due() if t else None
+
+async def poll_payouts(app: Application, tid: str) -> bool | None:
+    """Новые строки реестра выплат по каждой монете."""
+    t = registry.get(tid)
+    if t is None:
+        return None
+    by_coin = await gather_map(t.coins, lambda c: payout_ledger.fetch(t.client, c))
+    if by_coin and all(isinstance(p, BaseException) for p in by_coin.values()):
+        raise next(iter(by_coin.values()))
+    async with transaction():
+        await _fence(app)
+        new_payouts = await payout_ledger.ingest_many(
+            t.id, {c: p for c, p in by_coin.items() if not isinstance(p, BaseException)}
+        )
+        events = await check_payouts(new_payouts)
+        await _alert(app, t, events)
+    if events:
+        reports.invalidate(t.id, "today_since", *(f"payouts_{m}" for m in PAYOUT_MODES))
+    return bool(events)
+
+async def poll_profit(app: Application, tid: str) -> bool | None:
+    """Дотягивает почасовую прибыль сразу после закрытия часа."""
+    t = registry.get(tid)
+    if t is None:
+        return None
+    written = await gather_map(t.coins, lambda c: profit_store.sync(t.client, c, force=True))
+    changed = any(not isinstance(n, BaseException) and n > 0 for n in written.values())
+    # заодно цены закрывшегося часа (не чаще PRICE_SYNC_MIN_SEC на монету, общие для тенантов)
+    await gather_map(t.coins, lambda c: price_store.sync(c, t.fiat))
+    if changed:
+        reports.invalidate(t.id, "today_msk", "today_since")
+    return changed
+
+async def poll_income(app: Application, tid: str) -> bool | None:
+    """Цены + доход за 24ч -> алерт низкого дохода."""
+    t = registry.get(tid)
+    if t is None:
+        return None
+    fiat_24h = await _fleet_fiat_24h(t)
+    async with transaction():
+        await _fence(app)
+        events = await check_daily_income(t, fiat_24h)
+        await _alert(app, t, events)
+    return bool(events)
+
+def _sources() -> List[scheduler.Source]:
+    src = [
+        scheduler.Source(
+            "workers", poll_workers,
+            base=settings.poll_interval_sec, lo=settings.poll_min_sec, hi=settings.poll_workers_max_sec,
+            cap=_workers_due,
+        ),
+        scheduler.Source("payouts", poll_payouts, base=settings.poll_payouts_sec),
+        scheduler.Source(
+            "profit", poll_profit, base=3600, lo=300, hi=3600, align=3600, offset=settings.poll_profit_offset_sec
+        ),
+    ]
+    if not settings.only_offline_alerts and settings.alert_min_daily_usd > 0:
+        src.append(scheduler.Source("income", poll_income, base=settings.poll_prices_sec))
+    return src
+
+@metrics.collector
+def _state_metrics():
+    totals: Dict[tuple, int] = {}
+    for cache in [t.client.cache for t in registry.all()] + [prices.cache]:
+        for path, c in cache.stats().items():
+            for result, n in c.items():
+                totals[(path, result)] = totals.get((path, result), 0) + n
+    yield (
+        "trustbot_cache_requests_total", "counter", "Trustpool and price response cache lookups by result",
+        [({"path": p, "result": r}, n) for (p, r), n in totals.items()],
+    )
+    yield "trustbot_tenants", "gauge", "Enabled tenants", [({}, len(registry.all()))]
+    yield "trustbot_reports_materialized", "gauge", "Report snapshots in memory", [({}, len(reports))]
 
 # ======================= lifecycle =======================
 
+async def _become_leader(app: Application, token: int):
+    """Лидер: фоновые опросчики + рассылка (outbox общий — подхватываем недосланное)."""
+    broadcaster = app.bot_data["broadcaster"] = Broadcaster(
+        app.bot,
+        global_rate=settings.tg_global_rate,
+        chat_rate=settings.tg_chat_rate,
+        concurrency=settings.tg_send_concurrency,
+    )
+    await broadcaster.start()
+    scheduler.schedule_all(app, [t.id for t in registry.all()])
+
+async def _step_down(app: Application):
+    scheduler.unschedule_all(app)
+    broadcaster = app.bot_data.pop("broadcaster", None)
+    if broadcaster is not None:
+        await broadcaster.stop()
+
+async def _leader_tick(app: Application, is_leader: bool):
+    # тенантов могли добавить/удалить через другую реплику, а алиасы — поправить
+    version = aliases.registry.version
+    await registry.load()
+    if aliases.registry.version != version:
+        for t in registry.all():
+            reports.invalidate(t.id, "hashrate")
+    if is_leader:
+        scheduler.reconcile(app, [t.id for t in registry.all()])
+
 async def on_startup(app: Application):
     await init_db()
-    app.job_queue.run_repeating(poll_and_alert, interval=120, first=10, name="poll_and_alert")
+    await open_sessions()
+    if settings.metrics_port and not settings.webhook_url:
+        app.bot_data["metrics_server"] = await metrics.start_server(settings.metrics_listen, settings.metrics_port)
+    await registry.seed_from_settings()
+    await registry.load()
+    scheduler.set_sources(_sources())
+    lead = app.bot_data["leader"] = Leader(
+        leader_backend(settings.leader_backend),
+        ttl=settings.leader_lease_sec,
+        on_elected=lambda token: _become_leader(app, token),
+        on_lost=lambda: _step_down(app),
+        on_tick=lambda is_leader: _leader_tick(app, is_leader),
+    )
+    await lead.start()
+
+async def on_shutdown(app: Application):
+    if "leader" in app.bot_data:
+        await app.bot_data["leader"].stop()
+    if "metrics_server" in app.bot_data:
+        await app.bot_data.pop("metrics_server").cleanup()
+    for t in registry.all():
+        await t.detectors.checkpoint(force=True)
+    await close_sessions()
+    tape.close()
+    await close_db()
+
+COMMANDS = {
+    "start": cmd_start,
+    "today": cmd_today,
+    "hashrate": cmd_hashrate,
+    "payouts": cmd_payouts,
+    "income": cmd_income,
+    "worker": cmd_worker,
+    "cache": cmd_cache,
+    "export": cmd_export,
+    "tenants": cmd_tenants,
+    "tenant_add": cmd_tenant_add,
+    "tenant_del": cmd_tenant_del,
+    "tenant_sub": cmd_subscribe,
+    "tenant_unsub": cmd_unsubscribe,
+    "alias": cmd_alias,
+}
+
+def _health(app: Application) -> Dict[str, int]:
+    lead = app.bot_data.get("leader")
+    out = {"tenants": len(registry.all()), "reports": len(reports), "leader": int(bool(lead and lead.is_leader))}
+    if "broadcaster" in app.bot_data:
+        out["outbox"] = app.bot_data["broadcaster"].backlog()
+    return out
 
 def main():
-    app = (
-        Application.builder()
-        .token(settings.tg_token)
-        .post_init(on_startup)
-        .build()
-    )
-    app.add_handler(CommandHandler("start", cmd_start))
-    app.add_handler(CommandHandler("today", cmd_today))
-    app.add_handler(CommandHandler("hashrate", cmd_hashrate))
-    app.add_handler(CommandHandler("payouts", cmd_payouts))
-    app.add_handler(CallbackQueryHandler(cb_router))
-    app.run_polling()
+    builder = Application.builder().token(settings.tg_token).concurrent_updates(max(1, settings.updates_concurrency))
+    if settings.webhook_url:
+        # апдейты приходят во встроенный сервер (webhook.py), Updater не нужен
+        app = builder.updater(None).build()
+    else:
+        app = builder.post_init(on_startup).post_shutdown(on_shutdown).build()
+    for name, fn in COMMANDS.items():
+        app.add_handler(CommandHandler(name, metrics.handler(f"cmd:{name}", fn)))
+    app.add_handler(CallbackQueryHandler(metrics.handler(_cb_label, cb_router)))
+    if settings.webhook_url:
+        webhook.run(app, on_startup=on_startup, on_shutdown=on_shutdown, health=_health)
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
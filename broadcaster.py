@@ -0,0 +1,205 @@
+"""
+Очередь рассылки алертов в Telegram.
+
+- доставка параллельно несколькими воркерами под глобальным и per-chat
+  token bucket (лимиты Telegram: ~30 msg/s на бота, ~1 msg/s на чат);
+- на 429 (RetryAfter) чат откладывается ровно на retry_after, сообщение не теряется;
+- если в чат накопилось несколько текстов — уходят одним сообщением;
+- неотправленное лежит в таблице outbox и переживает рестарт;
+- enqueue внутри транзакции опроса будит доставку только после её коммита:
+  откаченный алерт не уйдёт в чат.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Deque, Dict, Iterable, List, Tuple
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from metrics import TG_RETRY_AFTER, TG_SEND_SECONDS
+from storage import after_commit, connection, transaction
+
+log = logging.getLogger(__name__)
+
+TG_MAX_LEN = 4096
+MAX_ATTEMPTS = 5
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = max(rate, 1e-6)
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.ts = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def delay(self) -> float:
+        """Сколько ждать до следующего токена (0 — можно сейчас)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    async def acquire(self) -> None:
+        while (d := self.delay()) > 0:
+            await asyncio.sleep(d)
+        self.take()
+
+
+def _retry_after_sec(e: RetryAfter) -> float:
+    ra = e.retry_after
+    return ra.total_seconds() if isinstance(ra, timedelta) else float(ra)
+
+
+class Broadcaster:
+    def __init__(self, bot, *, global_rate: float, chat_rate: float, concurrency: int):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.concurrency = max(1, concurrency)
+        self._pending: Dict[int, Deque[Tuple[int, str]]] = {}  # chat -> [(outbox id, text)]
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._attempts: Dict[int, int] = {}
+        self._blocked_until: Dict[int, float] = {}  # чат -> monotonic, до которого 429
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        self._queued: set[int] = set()  # чаты в _ready или в работе
+        self._tasks: List[asyncio.Task] = []
+
+    # -------- жизненный цикл --------
+    async def start(self) -> None:
+        db = await connection()
+        async with db.execute("SELECT id, chat_id, text FROM outbox ORDER BY id") as cur:
+            async for mid, chat_id, text in cur:
+                self._pending.setdefault(chat_id, deque()).append((mid, text))
+        for chat_id in self._pending:
+            self._mark_ready(chat_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # -------- API --------
+    async def enqueue(self, chat_ids: Iterable[int], text: str) -> None:
+        chats = list(dict.fromkeys(chat_ids))
+        if not chats:
+            return
+        now = int(time.time())
+        async with transaction() as db:
+            ids = []
+            for chat_id in chats:
+                cur = await db.execute(
+                    "INSERT INTO outbox(chat_id, text, created) VALUES(?,?,?)", (chat_id, text, now)
+                )
+                ids.append(cur.lastrowid)
+                await cur.close()
+
+            def wake() -> None:
+                for chat_id, mid in zip(chats, ids):
+                    self._pending.setdefault(chat_id, deque()).append((mid, text))
+                    self._mark_ready(chat_id)
+
+            after_commit(wake)
+
+    def backlog(self) -> int:
+        return sum(len(q) for q in self._pending.values())
+
+    # -------- внутреннее --------
+    def _mark_ready(self, chat_id: int, delay: float = 0.0) -> None:
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._mark_ready, chat_id)
+            return
+        if chat_id in self._queued or not self._pending.get(chat_id):
+            return
+        self._queued.add(chat_id)
+        self._ready.put_nowait(chat_id)
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        b = self._buckets.get(chat_id)
+        if b is None:
+            b = self._buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1.0)
+        return b
+
+    def _coalesce(self, q: Deque[Tuple[int, str]]) -> Tuple[List[int], str]:
+        """Склеиваем очередь чата в одно сообщение в пределах лимита Telegram."""
+        ids: List[int] = []
+        parts: List[str] = []
+        size = 0
+        for mid, text in q:
+            add = len(text) + (2 if parts else 0)
+            if parts and size + add > TG_MAX_LEN:
+                break
+            ids.append(mid)
+            parts.append(text[:TG_MAX_LEN])
+            size += add
+        return ids, "\n\n".join(parts)
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            delay = 0.0
+            try:
+                delay = await self._deliver(chat_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("broadcast to %s failed", chat_id)
+                delay = 5.0
+            finally:
+                self._queued.discard(chat_id)
+            self._mark_ready(chat_id, delay)
+
+    async def _deliver(self, chat_id: int) -> float:
+        """Отправляет накопленное в чат. Возвращает задержку до следующей попытки."""
+        q = self._pending.get(chat_id)
+        if not q:
+            return 0.0
+        wait = max(self._blocked_until.get(chat_id, 0.0) - time.monotonic(), self._bucket(chat_id).delay())
+        if wait > 0:
+            return wait
+        ids, text = self._coalesce(q)
+        await self.global_bucket.acquire()
+        self._bucket(chat_id).take()
+        t0 = time.perf_counter()
+        result = "ok"
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            result = "retry_after"
+            TG_RETRY_AFTER.inc()
+            ra = _retry_after_sec(e)
+            self._blocked_until[chat_id] = time.monotonic() + ra
+            return ra
+        except (BadRequest, Forbidden) as e:
+            # чат недоступен/сообщение некорректно — повторять бессмысленно
+            result = "dropped"
+            log.warning("send to %s dropped: %s", chat_id, e)
+        except TelegramError as e:
+            result = "error"
+            n = self._attempts[chat_id] = self._attempts.get(chat_id, 0) + 1
+            if n < MAX_ATTEMPTS:
+                return min(60.0, 2.0 ** n)
+            log.warning("send to %s failed after %d attempts: %s", chat_id, n, e)
+        finally:
+            TG_SEND_SECONDS.observe(time.perf_counter() - t0, result=result)
+
+        self._attempts.pop(chat_id, None)
+        for _ in ids:
+            q.popleft()
+        if not q:
+            self._pending.pop(chat_id, None)
+        async with transaction() as db:
+            await db.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i in ids])
+        return 0.0
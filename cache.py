@@ -0,0 +1,118 @@
+"""
+TTL-кэш ответов апстрима с single-flight и stale-while-revalidate.
+
+- свежая запись (age < ttl) отдаётся сразу;
+- устаревшая, но в пределах окна swr — отдаётся сразу, а в фоне идёт обновление;
+- одинаковые одновременные запросы схлопываются в один вызов;
+- fallback: если обновить не удалось, отдаётся последнее удачное значение
+  любой давности — с пометкой через resilience.note_stale().
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import resilience
+
+MAX_ENTRIES = 2048
+
+
+@dataclass
+class _Entry:
+    value: Any
+    ts: float
+
+
+class ResponseCache:
+    def __init__(self, source: str = "") -> None:
+        self.source = source  # имя источника в пометке об устаревших данных
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # группа (обычно path) -> {"hit", "stale", "miss", "coalesced"}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _count(self, group: str, what: str) -> None:
+        self._stats[group][what] += 1
+
+    def _start(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            return task
+
+        async def run() -> Any:
+            try:
+                value = await fetch()
+                self._store(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = self._inflight[key] = asyncio.create_task(run())
+        return task
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        self._entries[key] = _Entry(value, now)
+        if len(self._entries) > MAX_ENTRIES:
+            # выкидываем самые старые записи
+            for k, _ in sorted(self._entries.items(), key=lambda kv: kv[1].ts)[: len(self._entries) // 4]:
+                self._entries.pop(k, None)
+
+    async def get(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        *,
+        ttl: float,
+        swr: float = 0.0,
+        group: str = "",
+        fallback: bool = False,
+    ) -> Any:
+        if ttl <= 0:
+            self._count(group, "miss")
+            return await fetch()
+
+        e = self._entries.get(key)
+        if e is not None:
+            age = time.monotonic() - e.ts
+            if age < ttl:
+                self._count(group, "hit")
+                return e.value
+            if age < ttl + swr:
+                self._count(group, "stale")
+                task = self._start(key, fetch)
+                # ошибка фонового обновления не должна всплыть как "never retrieved"
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return e.value
+
+        if key in self._inflight:
+            self._count(group, "coalesced")
+        else:
+            self._count(group, "miss")
+        try:
+            # shield: отмена одного ожидающего не отменяет общий запрос
+            return await asyncio.shield(self._start(key, fetch))
+        except Exception:
+            if not fallback or e is None:
+                raise
+        self._count(group, "fallback")
+        resilience.note_stale(self.source or group, time.time() - (time.monotonic() - e.ts))
+        return e.value
+
+    def invalidate(self, prefix: Any = None) -> None:
+        if prefix is None:
+            self._entries.clear()
+            return
+        for k in [k for k in self._entries if isinstance(k, tuple) and k and k[0] == prefix]:
+            self._entries.pop(k, None)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {g: dict(c) for g, c in self._stats.items()}
+
+
+def hit_ratio(c: Dict[str, int]) -> float:
+    total = sum(c.values())
+    return (c.get("hit", 0) + c.get("stale", 0) + c.get("coalesced", 0)) / total if total else 0.0
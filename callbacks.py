@@ -0,0 +1,113 @@
+"""
+Склейка нажатий inline-кнопок (обработчики колбэков идут параллельно, см.
+UPDATES_CONCURRENCY).
+
+- Повторное нажатие того же действия на том же сообщении, пока первое ещё
+  обрабатывается, не запускает вторую обработку — ждёт первую.
+- Debounce по сообщению: одиночное нажатие обрабатывается сразу; если по
+  сообщению нажимали меньше CALLBACK_DEBOUNCE_MS назад (листание ▶️▶️▶️,
+  несколько человек в группе), обработка ждёт окно, и выполняется только
+  последнее нажатие серии — остальные лишь получают ответ на колбэк.
+- Хеш показанного (текст + клавиатура) помнится по сообщению: правка с тем же
+  содержимым не отправляется — Telegram всё равно ответил бы «message is not
+  modified».
+
+Всё в памяти процесса: реплики за балансировщиком склеивают каждая своё.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from metrics import CALLBACKS_COALESCED
+from settings import settings
+
+Key = Tuple[int, int]  # (чат, сообщение)
+
+
+def _key(msg: Any) -> Key | None:
+    chat = getattr(msg, "chat", None)
+    mid = getattr(msg, "message_id", None)
+    return (chat.id, mid) if chat is not None and mid is not None else None
+
+
+def digest(text: str, markup: Any = None) -> int:
+    rows = getattr(markup, "inline_keyboard", None) or ()
+    return hash((text, tuple(tuple((b.text, b.callback_data) for b in row) for row in rows)))
+
+
+class Coalescer:
+    def __init__(self, max_messages: int = 4096):
+        self.max_messages = max_messages
+        self._inflight: Dict[Tuple[int, int, str], asyncio.Future] = {}
+        self._latest: Dict[Key, int] = {}     # номер последнего нажатия по сообщению
+        self._tapped: Dict[Key, float] = {}   # время последнего нажатия (monotonic)
+        self._shown: "OrderedDict[Key, int]" = OrderedDict()
+        self._seq = 0
+
+    # -------- показанное содержимое --------
+    def unchanged(self, msg: Any, h: int) -> bool:
+        k = _key(msg)
+        if k is None or self._shown.get(k) != h:
+            return False
+        self._shown.move_to_end(k)
+        CALLBACKS_COALESCED.inc(result="unchanged")
+        return True
+
+    def remember(self, msg: Any, h: int) -> None:
+        k = _key(msg)
+        if k is None:
+            return
+        self._shown[k] = h
+        self._shown.move_to_end(k)
+        while len(self._shown) > self.max_messages:
+            self._shown.popitem(last=False)
+
+    # -------- нажатия --------
+    def _is_burst(self, k: Key) -> bool:
+        now = time.monotonic()
+        window = settings.callback_debounce_ms / 1000
+        burst = now - self._tapped.get(k, float("-inf")) < window
+        self._tapped[k] = now
+        if len(self._tapped) > self.max_messages:
+            self._tapped = {m: ts for m, ts in self._tapped.items() if now - ts < window}
+        return burst
+
+    async def run(self, msg: Any, action: str, fn: Callable[[], Awaitable[None]]) -> None:
+        """fn() — обработка нажатия action на сообщении msg (с правкой сообщения)."""
+        k = _key(msg)
+        if k is None:  # inline-сообщение без chat/message_id — склеивать не по чему
+            await fn()
+            return
+        ik = (*k, action)
+        running = self._inflight.get(ik)
+        if running is not None:
+            CALLBACKS_COALESCED.inc(result="joined")
+            err = await asyncio.shield(running)
+            if err is not None:
+                raise err
+            return
+        done = self._inflight[ik] = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        seq = self._latest[k] = self._seq
+        err: BaseException | None = None
+        try:
+            if self._is_burst(k):
+                await asyncio.sleep(settings.callback_debounce_ms / 1000)
+                if self._latest.get(k) != seq:
+                    CALLBACKS_COALESCED.inc(result="debounced")
+                    return
+            await fn()
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            del self._inflight[ik]
+            if self._latest.get(k) == seq:
+                del self._latest[k]
+            done.set_result(err)
+
+
+coalescer = Coalescer()
@@ -0,0 +1,165 @@
+"""
+Потоковые детекторы для алертов: O(1) на сэмпл, состояние в памяти,
+периодический чекпойнт в SQLite (таблица detector_state).
+
+- EwmaDrop — падение хешрейта воркера относительно EWMA-базы с гистерезисом:
+  срабатывает при x < base·(1 − drop), восстанавливается при x ≥ base·(1 − drop/2).
+  Пока воркер «в просадке», база заморожена и не съезжает вниз вслед за ним.
+- Floor — значение ниже порога (доход флота в сутки) с гистерезисом +10%.
+
+Детекторы обновляются на рабочих копиях; в банк копии попадают только после
+коммита транзакции опроса (checkpoint), при откате отбрасываются — иначе
+повтор опроса не увидел бы уже «сработавший» переход.
+"""
+from __future__ import annotations
+
+import time
+from typing import Dict
+
+from storage import after_commit, after_rollback, connection, transaction
+
+DROP = "drop"
+RECOVER = "recover"
+
+
+class EwmaDrop:
+    __slots__ = ("base", "n", "fired", "dirty")
+
+    def __init__(self, base: float = 0.0, n: int = 0, fired: bool = False):
+        self.base = base
+        self.n = n
+        self.fired = fired
+        self.dirty = False
+
+    def copy(self) -> EwmaDrop:
+        c = EwmaDrop(self.base, self.n, self.fired)
+        c.dirty = self.dirty
+        return c
+
+    def update(self, x: float, *, alpha: float, drop_pct: float, warmup: int) -> str | None:
+        self.dirty = True
+        if self.n == 0:
+            self.base, self.n = x, 1
+            return None
+        drop = max(0.0, min(drop_pct, 100.0)) / 100.0
+        if self.fired:
+            if x >= self.base * (1.0 - drop / 2):
+                self.fired = False
+                self.base += alpha * (x - self.base)
+                self.n += 1
+                return RECOVER
+            return None
+        if self.n >= warmup and self.base > 0 and x < self.base * (1.0 - drop):
+            self.fired = True
+            return DROP
+        self.base += alpha * (x - self.base)
+        self.n += 1
+        return None
+
+
+class Floor:
+    __slots__ = ("fired", "dirty")
+
+    HYSTERESIS = 1.10
+
+    def __init__(self, fired: bool = False):
+        self.fired = fired
+        self.dirty = False
+
+    def copy(self) -> Floor:
+        c = Floor(self.fired)
+        c.dirty = self.dirty
+        return c
+
+    def update(self, x: float, floor: float) -> str | None:
+        if floor <= 0:
+            return None
+        if not self.fired and x < floor:
+            self.fired = self.dirty = True
+            return DROP
+        if self.fired and x >= floor * self.HYSTERESIS:
+            self.fired = False
+            self.dirty = True
+            return RECOVER
+        return None
+
+
+class DetectorBank:
+    """Набор детекторов по ключам + ленивый load и checkpoint (применение после коммита + запись)."""
+
+    def __init__(self, tenant: str, checkpoint_sec: float):
+        self.tenant = tenant
+        self.checkpoint_sec = checkpoint_sec
+        self.drops: Dict[str, EwmaDrop] = {}
+        self.floors: Dict[str, Floor] = {}
+        # рабочие копии текущего опроса (см. drop/floor, checkpoint)
+        self._new_drops: Dict[str, EwmaDrop] = {}
+        self._new_floors: Dict[str, Floor] = {}
+        self._loaded = False
+        self._saved_at = time.monotonic()
+
+    async def load(self) -> None:
+        if self._loaded:
+            return
+        db = await connection()
+        async with db.execute(
+            "SELECT k, kind, base, n, fired FROM detector_state WHERE tenant=?", (self.tenant,)
+        ) as cur:
+            async for k, kind, base, n, fired in cur:
+                if kind == "ewma":
+                    self.drops[k] = EwmaDrop(float(base), int(n), bool(fired))
+                elif kind == "floor":
+                    self.floors[k] = Floor(bool(fired))
+        self._loaded = True
+
+    def drop(self, key: str) -> EwmaDrop:
+        """Рабочая копия детектора: в банк попадёт на checkpoint после коммита."""
+        d = self._new_drops.get(key)
+        if d is None:
+            cur = self.drops.get(key)
+            d = self._new_drops[key] = cur.copy() if cur else EwmaDrop()
+        return d
+
+    def floor(self, key: str) -> Floor:
+        f = self._new_floors.get(key)
+        if f is None:
+            cur = self.floors.get(key)
+            f = self._new_floors[key] = cur.copy() if cur else Floor()
+        return f
+
+    def _apply(self) -> None:
+        self.drops.update(self._new_drops)
+        self.floors.update(self._new_floors)
+        self._new_drops, self._new_floors = {}, {}
+
+    def _discard(self) -> None:
+        self._new_drops, self._new_floors = {}, {}
+
+    def _saved(self) -> None:
+        for d in self.drops.values():
+            d.dirty = False
+        for f in self.floors.values():
+            f.dirty = False
+        self._saved_at = time.monotonic()
+
+    async def checkpoint(self, *, force: bool = False) -> int:
+        """
+        Рабочие копии — в банк после коммита текущей транзакции (при откате —
+        в мусор); раз в checkpoint_sec изменившиеся детекторы пишутся в detector_state.
+        """
+        after_rollback(self._discard)
+        after_commit(self._apply)
+        if not force and time.monotonic() - self._saved_at < self.checkpoint_sec:
+            return 0
+        t = self.tenant
+        drops = {**self.drops, **self._new_drops}
+        floors = {**self.floors, **self._new_floors}
+        rows = [(t, k, "ewma", d.base, d.n, int(d.fired)) for k, d in drops.items() if d.dirty]
+        rows += [(t, k, "floor", 0.0, 0, int(f.fired)) for k, f in floors.items() if f.dirty]
+        if rows:
+            async with transaction() as db:
+                await db.executemany(
+                    "REPLACE INTO detector_state(tenant, k, kind, base, n, fired) VALUES(?,?,?,?,?,?)", rows
+                )
+        after_commit(self._saved)
+        return len(rows)
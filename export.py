@@ -0,0 +1,182 @@
+"""
+Выгрузка истории в CSV (gzip) для учёта: /export <profit|payouts|workers> [период].
+
+Строки идут конвейером: SQLite читается страницами по EXPORT_PAGE_ROWS (keyset
+по первичному ключу, без OFFSET), каждая страница форматируется и сжимается в
+отдельном потоке во временный файл на диске. В памяти — одна страница, сколько
+бы строк ни было в выгрузке. Перед чтением недостающая история дотягивается из
+Trustpool и CoinGecko: прибыль и цены — глубже уже сохранённого, выплаты —
+старше самой ранней в реестре.
+
+Наборы:
+- profit  — почасовая прибыль, цена того же часа и стоимость в фиате тенанта;
+- payouts — реестр выплат;
+- workers — хешрейт воркеров по часам (по суткам, если период длиннее
+  ретеншена часовых корзин).
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import gzip
+import io
+import tempfile
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import IO, Any, AsyncIterator, Callable, List, Sequence, Tuple
+
+import payout_ledger
+import price_store
+import profit_store
+from fanout import gather_map
+from settings import settings
+from storage import connection
+from worker_series import DAY, HOUR
+
+DATASETS = ("profit", "payouts", "workers")
+
+Fmt = Callable[[tuple], Sequence[Any]]
+
+
+class TooLarge(Exception):
+    """Сжатая выгрузка не влезает в EXPORT_MAX_MB."""
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def _keyset(sql: str, args: tuple, after: tuple) -> AsyncIterator[List[tuple]]:
+    """
+    Страницы запроса. sql заканчивается условием «(k1, ..., kn) > (?, ..., ?)» по
+    колонкам ORDER BY и «LIMIT ?»; ключ следующей страницы — первые n колонок
+    последней строки.
+    """
+    db = await connection()
+    page = max(1, settings.export_page_rows)
+    while True:
+        async with db.execute(sql, (*args, *after, page)) as cur:
+            rows = await cur.fetchall()
+        if rows:
+            yield rows
+        if len(rows) < page:
+            return
+        after = tuple(rows[-1][:len(after)])
+
+
+def _marks(items: Sequence[Any]) -> str:
+    return ",".join("?" * len(items))
+
+
+# ======================= наборы =======================
+
+async def _profit(t, start_ts: int, end_ts: int) -> Tuple[List[str], AsyncIterator[List[tuple]], Fmt]:
+    await gather_map(t.coins, lambda c: profit_store.sync(t.client, c, since=start_ts))
+    await gather_map(t.coins, lambda c: price_store.sync(c, t.fiat, since=start_ts))
+    fiat = t.fiat.upper()
+    sql = (
+        "SELECT ph.coin, ph.ts, ph.profit, p.price FROM profit_hourly ph "
+        "LEFT JOIN price_hourly p ON p.coin = ph.coin AND p.fiat = ? AND p.ts = ph.ts - ph.ts % 3600 "
+        f"WHERE ph.tenant = ? AND ph.coin IN ({_marks(t.coins)}) AND ph.ts BETWEEN ? AND ? "
+        "AND (ph.coin, ph.ts) > (?, ?) ORDER BY ph.coin, ph.ts LIMIT ?"
+    )
+    pages = _keyset(sql, (fiat, t.id, *t.coins, start_ts, end_ts), ("", -1))
+
+    def fmt(r: tuple) -> Sequence[Any]:
+        coin, ts, profit, price = r
+        if price is None:
+            return ts, _iso(ts), coin, profit, "", ""
+        return ts, _iso(ts), coin, profit, price, round(profit * price, 6)
+
+    return ["ts", "time_utc", "coin", "profit", f"price_{fiat.lower()}", f"value_{fiat.lower()}"], pages, fmt
+
+
+async def _payouts(t, start_ts: int, end_ts: int) -> Tuple[List[str], AsyncIterator[List[tuple]], Fmt]:
+    await gather_map(t.coins, lambda c: payout_ledger.backfill(t.client, c))
+    sql = (
+        f"SELECT coin, time, txid, amount FROM payout WHERE tenant = ? AND coin IN ({_marks(t.coins)}) "
+        "AND time BETWEEN ? AND ? AND (coin, time, txid) > (?, ?, ?) ORDER BY coin, time, txid LIMIT ?"
+    )
+    pages = _keyset(sql, (t.id, *t.coins, start_ts, end_ts), ("", -1, ""))
+
+    def fmt(r: tuple) -> Sequence[Any]:
+        coin, ts, txid, amount = r
+        # txid вида t<время>:<сумма> — ключ выплаты без хеша (см. Payout.key)
+        return ts, _iso(ts), coin, amount, "" if txid.startswith("t") and ":" in txid else txid
+
+    return ["ts", "time_utc", "coin", "amount", "txid"], pages, fmt
+
+
+async def _workers(t, start_ts: int, end_ts: int) -> Tuple[List[str], AsyncIterator[List[tuple]], Fmt]:
+    res = HOUR if end_ts - start_ts <= settings.series_hourly_retention_d * DAY else DAY
+    # порядок индекса worker_rollup_bucket (res, bucket, worker_id) — страницы без сортировки
+    sql = (
+        "SELECT r.bucket, r.worker_id, w.coin, w.name, r.n, r.hr_sum, r.hr_min, r.hr_max, "
+        "r.reject_sum, r.online_n FROM worker_rollup r JOIN worker w ON w.id = r.worker_id "
+        "WHERE w.tenant = ? AND r.res = ? AND r.bucket BETWEEN ? AND ? "
+        "AND (r.bucket, r.worker_id) > (?, ?) ORDER BY r.bucket, r.worker_id LIMIT ?"
+    )
+    pages = _keyset(sql, (t.id, res, start_ts - start_ts % res, end_ts), (-1, -1))
+    table = t.client.aliases
+
+    def fmt(r: tuple) -> Sequence[Any]:
+        ts, _, coin, name, n, hr_sum, hr_min, hr_max, rej_sum, online_n = r
+        alias, group = table.resolve(coin, name)
+        return (
+            ts, _iso(ts), coin, name, alias, group,
+            round(hr_sum / n, 2), round(hr_min, 2), round(hr_max, 2),
+            round(rej_sum / n, 4), round(100 * online_n / n, 1), n,
+        )
+
+    header = [
+        "ts", "time_utc", "coin", "worker", "alias", "group",
+        "hr_avg", "hr_min", "hr_max", "reject_avg", "online_pct", "samples",
+    ]
+    return header, pages, fmt
+
+
+_SOURCES = {"profit": _profit, "payouts": _payouts, "workers": _workers}
+
+
+# ======================= запись =======================
+
+class _GzipCsv:
+    """CSV -> gzip -> временный файл. write()/close() блокирующие — их зовут из потока."""
+
+    def __init__(self, header: Sequence[str], fmt: Fmt):
+        self.file: IO[bytes] = tempfile.TemporaryFile()
+        self.rows = 0
+        self._fmt = fmt
+        gz = gzip.GzipFile(fileobj=self.file, mode="wb", compresslevel=6)
+        # BOM — чтобы Excel открыл UTF-8 без мастера импорта
+        self._text = io.TextIOWrapper(gz, encoding="utf-8-sig", newline="")
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(header)
+
+    def write(self, rows: List[tuple]) -> int:
+        self._csv.writerows(map(self._fmt, rows))
+        self.rows += len(rows)
+        return self.file.tell()  # сжатых байт на диске (без хвоста в буферах)
+
+    def close(self) -> None:
+        self._text.close()  # закрывает и GzipFile; сам файл остаётся открытым
+        self.file.seek(0)
+
+
+async def build(t, dataset: str, start_ts: int, end_ts: int) -> Tuple[IO[bytes], int]:
+    """(открытый файл .csv.gz, число строк). Файл закрывает вызывающий."""
+    header, pages, fmt = await _SOURCES[dataset](t, start_ts, end_ts)
+    out = _GzipCsv(header, fmt)
+    limit = settings.export_max_mb * 1024 * 1024
+    try:
+        async with aclosing(pages):
+            async for page in pages:
+                if await asyncio.to_thread(out.write, page) > limit:
+                    raise TooLarge(
+                        f"Выгрузка больше {settings.export_max_mb:g} МБ — возьмите период короче"
+                    )
+        await asyncio.to_thread(out.close)
+    except BaseException:
+        out.file.close()
+        raise
+    return out.file, out.rows
@@ -0,0 +1,109 @@
+"""
+Локальный «Telegram»: шлёт фейковые апдейты во встроенный webhook-сервер.
+
+    python fake_updates.py --url http://127.0.0.1:8080/telegram --secret S -n 200 -c 20
+
+Проверяет, что чужой секрет отклоняется (403), /healthz жив, и меряет время
+подтверждения апдейтов (p50/p95/max). Ответы бота на фейковые чаты уйдут
+в настоящий Bot API и получат ошибку — для замера приёма это не важно.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_ids = itertools.count(int(time.time()))
+
+
+def _message(chat_id: int, text: str) -> dict:
+    uid = next(_ids)
+    user = {"id": chat_id, "is_bot": False, "first_name": "fake"}
+    return {
+        "update_id": uid,
+        "message": {
+            "message_id": uid,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            if text.startswith("/")
+            else [],
+        },
+    }
+
+
+def _callback(chat_id: int, data: str) -> dict:
+    uid = next(_ids)
+    user = {"id": chat_id, "is_bot": False, "first_name": "fake"}
+    return {
+        "update_id": uid,
+        "callback_query": {
+            "id": str(uid),
+            "from": user,
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": uid,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "menu",
+            },
+        },
+    }
+
+
+def _pct(xs: list[float], q: float) -> float:
+    return sorted(xs)[min(len(xs) - 1, int(len(xs) * q))] if xs else 0.0
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8080/telegram")
+    ap.add_argument("--secret", required=True)
+    ap.add_argument("--chat-id", type=int, default=1)
+    ap.add_argument("-n", type=int, default=100, help="сколько апдейтов")
+    ap.add_argument("-c", type=int, default=10, help="параллельно")
+    args = ap.parse_args()
+
+    base = "{0.scheme}://{0.netloc}".format(urlsplit(args.url))
+    kinds = [
+        lambda: _message(args.chat_id, "/start"),
+        lambda: _callback(args.chat_id, "hashrate"),
+        lambda: _callback(args.chat_id, "today_msk"),
+    ]
+    lat: list[float] = []
+    codes: dict[int, int] = {}
+    sem = asyncio.Semaphore(args.c)
+
+    async with aiohttp.ClientSession() as s:
+        async with s.post(args.url, json=_message(args.chat_id, "/start"), headers={SECRET_HEADER: "wrong"}) as r:
+            print(f"чужой секрет: {r.status} (ожидается 403)")
+        async with s.get(base + "/healthz") as r:
+            print(f"/healthz: {r.status} {await r.text()}")
+
+        async def one(i: int) -> None:
+            async with sem:
+                t0 = time.perf_counter()
+                async with s.post(args.url, json=kinds[i % len(kinds)](), headers={SECRET_HEADER: args.secret}) as r:
+                    await r.read()
+                    codes[r.status] = codes.get(r.status, 0) + 1
+                lat.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.n)))
+        wall = time.perf_counter() - t0
+
+    print(f"апдейтов: {args.n}, коды: {codes}, {args.n / wall:.0f} rps")
+    print(f"ack, мс: p50 {_pct(lat, 0.5):.1f}  p95 {_pct(lat, 0.95):.1f}  max {max(lat, default=0):.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
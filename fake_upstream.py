@@ -0,0 +1,177 @@
+"""
+Локальная подмена Trustpool и CoinGecko для нагрузочных прогонов.
+
+    python fake_upstream.py --port 8099 --workers 1000 --latency-ms 40 --error-rate 0.01
+    TRUSTPOOL_BASE=http://127.0.0.1:8099/res/saas COINGECKO_BASE=http://127.0.0.1:8099/api/v3 python bot.py
+
+Эндпоинты Trustpool (/observer/home, /observer/worker, /observer/payment/detail,
+/observer/profit/chart — и равномерная сетка, и список точек) и CoinGecko
+/simple/price, /coins/{id}/market_chart/range (цена плавно ходит ±5% за сутки). Флот генерируется детерминированно; задержка, jitter и доля
+ошибок 500 настраиваются. GET /__stats — счётчики запросов по эндпоинтам,
+POST /__reset — обнулить их.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Dict
+
+from aiohttp import web
+
+TP = "/res/saas"
+CG = "/api/v3"
+PRICES = {"bitcoin": 60000.0, "litecoin": 80.0, "dogecoin": 0.12}
+# DOGE в воркерах отдаётся как LTC (мердж-майнинг), как у настоящего пула
+WORKER_COINS = {"DOGE": "LTC"}
+UNIT = {"BTC": ("TH/s", 120.0), "LTC": ("GH/s", 9.5), "DOGE": ("GH/s", 9.5)}
+
+
+class Fleet:
+    def __init__(self, workers: int, coins: list[str], offline_pct: float, seed: int = 1):
+        self.workers = workers
+        self.coins = coins
+        self.offline_pct = offline_pct
+        self.rng = random.Random(seed)
+        self.started = int(time.time())
+        self._workers_json: Dict[str, bytes] = {}
+
+    def workers_body(self, coin: str) -> bytes:
+        """Список воркеров монеты (готовый JSON — на 10k воркеров его не собираем на каждый запрос)."""
+        body = self._workers_json.get(coin)
+        if body is None:
+            per_coin = max(1, self.workers // len(self.coins))
+            unit, base = UNIT.get(coin, ("TH/s", 100.0))
+            rng = random.Random(f"{coin}:{self.workers}")
+            now = int(time.time())
+            rows = []
+            for i in range(per_coin):
+                off = rng.random() * 100 < self.offline_pct
+                hr = 0.0 if off else base * rng.uniform(0.85, 1.1)
+                rows.append({
+                    "name": f"{coin.lower()}{i:05d}",
+                    "status": "inactive" if off else "active",
+                    "last_active": now - (3600 if off else rng.randint(0, 60)),
+                    "recent_hashrate": f"{hr:.2f} {unit}",
+                    "hashrate_10min": f"{hr:.2f} {unit}",
+                    "hashrate_1hour": f"{hr:.2f} {unit}",
+                    "hashrate_1day": f"{base:.2f} {unit}",
+                    "reject_rate": f"{rng.uniform(0, 0.5):.2f}%",
+                })
+            body = self._workers_json[coin] = json.dumps({"code": 0, "data": {"data": rows}}).encode()
+        return body
+
+
+def _ok(data) -> web.Response:
+    return web.json_response({"code": 0, "data": data})
+
+
+def make_app(args: argparse.Namespace) -> web.Application:
+    fleet = Fleet(args.workers, [c.upper() for c in args.coins.split(",")], args.offline_pct)
+    stats: Dict[str, int] = {}
+
+    @web.middleware
+    async def chaos(request: web.Request, handler):
+        if request.path.startswith("/__"):
+            return await handler(request)
+        stats[request.path] = stats.get(request.path, 0) + 1
+        delay = (args.latency_ms + random.uniform(-args.jitter_ms, args.jitter_ms)) / 1000
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if random.random() < args.error_rate:
+            return web.Response(status=500, text="injected error")
+        return await handler(request)
+
+    async def home(request: web.Request) -> web.Response:
+        coin = request.query.get("coin", "BTC").upper()
+        per_worker = {"BTC": 0.00004, "LTC": 0.0009, "DOGE": 9.0}.get(coin, 0.0)
+        return _ok({"profit_24hour": f"{per_worker * fleet.workers / len(fleet.coins):.8f}"})
+
+    async def worker(request: web.Request) -> web.Response:
+        coin = request.query.get("coin", "BTC").upper()
+        return web.Response(body=fleet.workers_body(WORKER_COINS.get(coin, coin)), content_type="application/json")
+
+    async def payments(request: web.Request) -> web.Response:
+        coin = request.query.get("coin", "BTC").upper()
+        day = 86400
+        last = fleet.started - fleet.started % day
+        rows = [
+            {"coin": coin, "time": last - i * day, "amount": f"{0.001 * (1 + i % 3):.8f}",
+             "txid": f"{coin.lower()}tx{(last - i * day) // day}"}
+            for i in range(args.payouts)
+        ]
+        return _ok({"data": rows})
+
+    async def profit(request: web.Request) -> web.Response:
+        coin = request.query.get("coin", "BTC").upper()
+        size = min(int(request.query.get("size", "24")), 24 * 90)
+        step = 3600 if request.query.get("range_type", "hour") == "hour" else 86400
+        now = int(time.time())
+        start = now - now % step - (size - 1) * step
+        rng = random.Random(f"{coin}:{start}")
+        values = [round(rng.uniform(0.8, 1.2) * 1e-5 * fleet.workers, 10) for _ in range(size)]
+        fmt = args.profit_format
+        if fmt == "mixed":
+            fmt = "grid" if coin == "BTC" else "points"
+        if fmt == "grid":
+            return _ok({"start": start * 1000, "data": values})
+        return _ok({"data": [{"time": start + i * step, "profit": v} for i, v in enumerate(values)]})
+
+    async def simple_price(request: web.Request) -> web.Response:
+        ids = [i for i in request.query.get("ids", "").split(",") if i]
+        vs = request.query.get("vs_currencies", "usd").lower()
+        return web.json_response({i: {vs: PRICES[i]} for i in ids if i in PRICES})
+
+    async def market_chart(request: web.Request) -> web.Response:
+        base = PRICES.get(request.match_info["id"])
+        if base is None:
+            return web.json_response({"error": "coin not found"}, status=404)
+        lo, hi = int(request.query.get("from", "0")), int(request.query.get("to", "0"))
+        step = 300 if hi - lo <= 86400 else 3600  # как у CoinGecko: до суток — 5 минут, дальше — часы
+        ts = lo - lo % step + step
+        pts = []
+        while ts <= hi:
+            pts.append([ts * 1000, round(base * (1 + 0.05 * math.sin(ts / 86400 * 2 * math.pi)), 6)])
+            ts += step
+        return web.json_response({"prices": pts})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    async def reset(request: web.Request) -> web.Response:
+        stats.clear()
+        return web.json_response({})
+
+    app = web.Application(middlewares=[chaos])
+    app.router.add_get(TP + "/observer/home", home)
+    app.router.add_get(TP + "/observer/worker", worker)
+    app.router.add_get(TP + "/observer/payment/detail", payments)
+    app.router.add_get(TP + "/observer/profit/chart", profit)
+    app.router.add_get(CG + "/simple/price", simple_price)
+    app.router.add_get(CG + "/coins/{id}/market_chart/range", market_chart)
+    app.router.add_get("/__stats", get_stats)
+    app.router.add_post("/__reset", reset)
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--workers", type=int, default=10, help="размер флота (всего по всем монетам)")
+    ap.add_argument("--coins", default="BTC,LTC")
+    ap.add_argument("--offline-pct", type=float, default=2.0)
+    ap.add_argument("--payouts", type=int, default=30)
+    ap.add_argument("--profit-format", choices=("grid", "points", "mixed"), default="mixed")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    return ap.parse_args(argv)
+
+
+if __name__ == "__main__":
+    a = parse_args()
+    web.run_app(make_app(a), host=a.host, port=a.port, access_log=None, print=None)
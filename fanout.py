@@ -0,0 +1,45 @@
+"""
+Параллельный опрос по монетам с ограничением числа одновременных запросов
+и дедлайном на каждый вызов. Ошибка/таймаут одной монеты не валит остальные.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, TypeVar
+
+from settings import settings
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+_sem: asyncio.Semaphore | None = None
+
+
+def _semaphore() -> asyncio.Semaphore:
+    # общий на процесс: лимит действует на все отчёты и опрос сразу
+    global _sem
+    if _sem is None:
+        _sem = asyncio.Semaphore(max(1, settings.fanout_max_inflight))
+    return _sem
+
+
+async def _call(fn: Callable[[K], Awaitable[T]], key: K, timeout: float) -> T:
+    async with _semaphore():
+        return await asyncio.wait_for(fn(key), timeout=timeout)
+
+
+async def gather_map(
+    keys: Iterable[K],
+    fn: Callable[[K], Awaitable[T]],
+    *,
+    timeout: float | None = None,
+) -> Dict[K, T | BaseException]:
+    """
+    Запускает fn(key) для всех ключей параллельно (не больше FANOUT_MAX_INFLIGHT
+    одновременно) и возвращает {key: результат или исключение}.
+    """
+    ks = list(dict.fromkeys(keys))
+    t = settings.fanout_deadline_sec if timeout is None else timeout
+    res = await asyncio.gather(*(_call(fn, k, t) for k in ks), return_exceptions=True)
+    return dict(zip(ks, res))
+
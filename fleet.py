@@ -0,0 +1,128 @@
+"""
+Агрегированный вид флота для кнопки «Хешрейт».
+
+FleetView собирается один раз на снимок отчёта (O(флота)): суммы хешрейта по
+монетам и по группам алиасов, top-N худших воркеров, отсортированный список
+строк. Группа — из реестра алиасов (aliases.py), иначе алиас без номера
+на конце. Страницы списка рендерятся лениво по нажатию — O(размера страницы):
+индекс фильтра (все / офлайн / монета) строится при первом обращении к нему
+и дальше переиспользуется.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Tuple
+
+from models import Worker
+from units import fmt_hashrate
+
+ALL = "all"
+OFFLINE = "off"
+GROUPS_SHOWN = 10
+
+# «garage-s19-07» -> «garage-s19», «btc00012» -> «btc»
+_GROUP_TAIL = re.compile(r"[\W_]*\d+$")
+
+
+def group_of(alias: str) -> str:
+    return _GROUP_TAIL.sub("", alias) or alias
+
+
+def _ratio(w: Worker) -> float:
+    """Текущий хешрейт к суточному: чем меньше, тем хуже воркер; офлайн — худшие."""
+    if not w.online:
+        return -1.0
+    return w.hr_recent / w.hr_1day if w.hr_1day > 0 else 1.0
+
+
+class _Agg:
+    __slots__ = ("online", "offline", "hr", "hr_1day")
+
+    def __init__(self) -> None:
+        self.online = 0
+        self.offline = 0
+        self.hr = 0.0
+        self.hr_1day = 0.0
+
+    def add(self, w: Worker) -> None:
+        if w.online:
+            self.online += 1
+        else:
+            self.offline += 1
+        self.hr += w.hr_recent
+        self.hr_1day += w.hr_1day
+
+
+def _line(w: Worker) -> str:
+    mark = "" if w.online else "🔴 "
+    return f"• {mark}{w.alias}: {fmt_hashrate(w.hr_recent)} (24h {fmt_hashrate(w.hr_1day)}) — {w.coin}"
+
+
+class FleetView:
+    def __init__(self, workers: List[Worker], *, page_size: int = 25, top_n: int = 10):
+        self.page_size = max(1, page_size)
+        self.rows = sorted(workers, key=lambda w: (w.coin, w.alias.lower(), w.name))
+        self.by_coin: Dict[str, _Agg] = {}
+        groups: Dict[Tuple[str, str], _Agg] = {}
+        for w in self.rows:
+            self.by_coin.setdefault(w.coin, _Agg()).add(w)
+            groups.setdefault((w.coin, w.group or group_of(w.alias)), _Agg()).add(w)
+        self.groups = sorted(groups.items(), key=lambda kv: -kv[1].hr)
+        worst = sorted((w for w in self.rows if _ratio(w) < 1.0), key=lambda w: (_ratio(w), w.last_active))
+        self.worst = worst[:top_n]
+        self._index: Dict[str, List[int]] = {ALL: list(range(len(self.rows)))}
+        self.text = self._summary()
+
+    @property
+    def coins(self) -> List[str]:
+        return list(self.by_coin)
+
+    @property
+    def offline(self) -> int:
+        return sum(a.offline for a in self.by_coin.values())
+
+    def _summary(self) -> str:
+        on = sum(a.online for a in self.by_coin.values())
+        lines = [f"⚙️ Воркеры: online {on}, offline {self.offline}"]
+        for coin, a in self.by_coin.items():
+            lines.append(
+                f"• {coin}: {fmt_hashrate(a.hr)} (24h {fmt_hashrate(a.hr_1day)}), "
+                f"online {a.online} / offline {a.offline}"
+            )
+        if len(self.groups) > 1:
+            lines.append("\n📦 Группы:")
+            for (coin, g), a in self.groups[:GROUPS_SHOWN]:
+                lines.append(f"• {g} ({coin}): {fmt_hashrate(a.hr)}, {a.online}/{a.online + a.offline} online")
+            if len(self.groups) > GROUPS_SHOWN:
+                lines.append(f"… ещё групп: {len(self.groups) - GROUPS_SHOWN}")
+        if self.worst:
+            lines.append("\n📉 Хуже всех:")
+            for w in self.worst:
+                tail = "офлайн" if not w.online else f"{_ratio(w) * 100:.0f}% от суточного"
+                lines.append(f"• {w.alias} ({w.coin}): {fmt_hashrate(w.hr_recent)} — {tail}")
+        return "\n".join(lines)
+
+    def _ids(self, flt: str) -> List[int]:
+        ids = self._index.get(flt)
+        if ids is None:
+            if flt == OFFLINE:
+                ids = [i for i, w in enumerate(self.rows) if not w.online]
+            else:
+                ids = [i for i, w in enumerate(self.rows) if w.coin == flt]
+            self._index[flt] = ids
+        return ids
+
+    def pages(self, flt: str) -> int:
+        return max(1, -(-len(self._ids(flt)) // self.page_size))
+
+    def page(self, flt: str, n: int) -> Tuple[str, int, int]:
+        """(текст страницы, номер страницы после приведения к диапазону, всего страниц)."""
+        ids = self._ids(flt)
+        total = self.pages(flt)
+        n = min(max(0, n), total - 1)
+        title = {ALL: "все", OFFLINE: "офлайн"}.get(flt, flt)
+        lines = [f"⚙️ Воркеры ({title}): {len(ids)}, стр. {n + 1}/{total}"]
+        lines += [_line(self.rows[i]) for i in ids[n * self.page_size:(n + 1) * self.page_size]]
+        if not ids:
+            lines.append("• нет воркеров")
+        return "\n".join(lines), n, total
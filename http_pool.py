@@ -0,0 +1,55 @@
+"""
+Долгоживущие HTTP-сессии: по одной на апстрим (Trustpool, CoinGecko).
+Открываются в on_startup и закрываются при остановке приложения,
+поэтому TCP/TLS-соединения переиспользуются между запросами.
+"""
+from __future__ import annotations
+
+from typing import Dict
+
+import aiohttp
+
+from settings import settings
+
+TRUSTPOOL = "trustpool"
+COINGECKO = "coingecko"
+
+# таймаут по умолчанию (сек) для каждого апстрима
+_TIMEOUTS: Dict[str, int] = {TRUSTPOOL: 20, COINGECKO: 15}
+
+_sessions: Dict[str, aiohttp.ClientSession] = {}
+
+
+def _make_session(name: str) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.http_pool_limit,
+        limit_per_host=settings.http_pool_limit_per_host,
+        keepalive_timeout=settings.http_keepalive_sec,
+        use_dns_cache=True,
+        ttl_dns_cache=settings.http_dns_ttl_sec,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=_TIMEOUTS.get(name, 20)),
+        headers={"Accept": "application/json"},
+    )
+
+
+def session(name: str) -> aiohttp.ClientSession:
+    """Сессия апстрима; если ещё не открыта (скрипты, тесты) — создаём лениво."""
+    s = _sessions.get(name)
+    if s is None or s.closed:
+        s = _sessions[name] = _make_session(name)
+    return s
+
+
+async def open_sessions() -> None:
+    for name in _TIMEOUTS:
+        session(name)
+
+
+async def close_sessions() -> None:
+    for s in list(_sessions.values()):
+        if not s.closed:
+            await s.close()
+    _sessions.clear()
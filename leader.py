@@ -0,0 +1,225 @@
+"""
+Выбор лидера между репликами: аренда (lease) с heartbeat и fencing-токеном.
+
+Фоновые опросчики и рассылка алертов работают только у лидера; интерактивные
+команды обслуживает любая реплика из общей SQLite и своих кэшей.
+
+- acquire: аренду берёт тот, кто уже её держит, или кто угодно, если она
+  истекла; при смене держателя токен растёт на 1.
+- heartbeat каждые ttl/3 продлевает аренду; не продлилась (забрали или база
+  недоступна дольше ttl) — реплика слагает полномочия.
+- fence() — проверка «токен всё ещё мой» внутри транзакции записи. Проверка
+  сама открывает транзакцию BEGIN IMMEDIATE (блокировка записи до коммита),
+  так что между проверкой и коммитом никто не перехватит аренду: бывший
+  лидер, проспавший смену, не запишет алерты и не поставит их в рассылку
+  поверх нового лидера.
+
+Бэкенд подключаемый (LEADER_BACKEND): sqlite — общий файл базы на томе,
+local — одна реплика, всегда лидер.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import os
+import secrets
+import socket
+import time
+from typing import Awaitable, Callable
+
+from storage import transaction
+
+log = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Аренда лидерства потеряна — запись от имени лидера недопустима."""
+
+
+class LeaseBackend(ABC):
+    """Хранилище аренды; неполный бэкенд падает при создании, а не посреди heartbeat."""
+
+    @abstractmethod
+    async def acquire(self, name: str, holder: str, ttl: float) -> int | None:
+        """Токен, если аренда свободна, истекла или уже наша (смена держателя — токен растёт); иначе None."""
+
+    @abstractmethod
+    async def renew(self, name: str, holder: str, token: int, ttl: float) -> bool:
+        """Продлевает свою аренду; False — её уже перехватили."""
+
+    @abstractmethod
+    async def release(self, name: str, holder: str, token: int) -> None:
+        """Отпускает свою аренду досрочно."""
+
+    @abstractmethod
+    async def check(self, name: str, holder: str, token: int) -> bool:
+        """Аренда всё ещё наша (для fence)."""
+
+
+class LocalLease(LeaseBackend):
+    """Одна реплика: всегда лидер."""
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> int | None:
+        return 1
+
+    async def renew(self, name: str, holder: str, token: int, ttl: float) -> bool:
+        return True
+
+    async def release(self, name: str, holder: str, token: int) -> None:
+        pass
+
+    async def check(self, name: str, holder: str, token: int) -> bool:
+        return True
+
+
+class SqliteLease(LeaseBackend):
+    """Аренда в таблице lease общей базы; каждая операция — одна атомарная запись."""
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> int | None:
+        now = time.time()
+        async with transaction() as db:
+            await db.execute(
+                "INSERT OR IGNORE INTO lease(name, holder, token, expires_at) VALUES(?, '', 0, 0)", (name,)
+            )
+            cur = await db.execute(
+                """UPDATE lease SET token = CASE WHEN holder=? THEN token ELSE token + 1 END,
+                   holder=?, expires_at=?
+                   WHERE name=? AND (holder=? OR expires_at<?)""",
+                (holder, holder, now + ttl, name, holder, now),
+            )
+            won = cur.rowcount == 1
+            await cur.close()
+            if not won:
+                return None
+            async with db.execute("SELECT token FROM lease WHERE name=?", (name,)) as c:
+                row = await c.fetchone()
+        return int(row[0])
+
+    async def renew(self, name: str, holder: str, token: int, ttl: float) -> bool:
+        now = time.time()
+        async with transaction() as db:
+            cur = await db.execute(
+                "UPDATE lease SET expires_at=? WHERE name=? AND holder=? AND token=? AND expires_at>=?",
+                (now + ttl, name, holder, token, now),
+            )
+            ok = cur.rowcount == 1
+            await cur.close()
+        return ok
+
+    async def release(self, name: str, holder: str, token: int) -> None:
+        async with transaction() as db:
+            await db.execute(
+                "UPDATE lease SET expires_at=0 WHERE name=? AND holder=? AND token=?", (name, holder, token)
+            )
+
+    async def check(self, name: str, holder: str, token: int) -> bool:
+        # внутри transaction() опроса присоединяется к ней и держит блокировку до её коммита
+        async with transaction() as db:
+            if not db.in_transaction:
+                # sqlite3 начинает транзакцию только на первой записи — без этого
+                # аренду могли бы перехватить между проверкой и записями опроса
+                await db.execute("BEGIN IMMEDIATE")
+            async with db.execute(
+                "SELECT 1 FROM lease WHERE name=? AND holder=? AND token=? AND expires_at>=?",
+                (name, holder, token, time.time()),
+            ) as cur:
+                return await cur.fetchone() is not None
+
+
+BACKENDS = {"sqlite": SqliteLease, "local": LocalLease}
+
+
+def backend(kind: str) -> LeaseBackend:
+    try:
+        return BACKENDS[kind.lower()]()
+    except KeyError:
+        raise ValueError(f"LEADER_BACKEND: неизвестный бэкенд {kind!r} ({', '.join(BACKENDS)})") from None
+
+
+class Leader:
+    def __init__(
+        self,
+        backend: LeaseBackend,
+        *,
+        ttl: float,
+        on_elected: Callable[[int], Awaitable[None]],
+        on_lost: Callable[[], Awaitable[None]],
+        on_tick: Callable[[bool], Awaitable[None]] | None = None,
+        name: str = "pollers",
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.token: int | None = None
+        self._on_elected = on_elected
+        self._on_lost = on_lost
+        self._on_tick = on_tick
+        self._renewed_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None
+
+    async def start(self) -> None:
+        await self._beat()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.token is not None:
+            token = self.token
+            await self._step_down()
+            try:
+                await self.backend.release(self.name, self.holder, token)
+            except Exception:
+                log.warning("lease release failed", exc_info=True)
+
+    async def fence(self) -> None:
+        """
+        Вызывать первым делом внутри transaction() опроса: бэкенд берёт блокировку
+        записи до коммита, и проверка атомарна с записями, что идут следом.
+        """
+        if self.token is None or not await self.backend.check(self.name, self.holder, self.token):
+            raise LeaseLost(self.name)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._beat()
+
+    async def _beat(self) -> None:
+        try:
+            if self.token is not None:
+                if await self.backend.renew(self.name, self.holder, self.token, self.ttl):
+                    self._renewed_at = time.monotonic()
+                else:
+                    log.warning("lease %s lost (token %s)", self.name, self.token)
+                    await self._step_down()
+            if self.token is None:
+                token = await self.backend.acquire(self.name, self.holder, self.ttl)
+                if token is not None:
+                    self.token, self._renewed_at = token, time.monotonic()
+                    log.info("lease %s acquired by %s (token %s)", self.name, self.holder, token)
+                    await self._on_elected(token)
+        except Exception:
+            log.warning("lease %s heartbeat failed", self.name, exc_info=True)
+            if self.token is not None and time.monotonic() - self._renewed_at > self.ttl:
+                await self._step_down()  # аренда уже истекла — её мог взять другой
+        if self._on_tick:
+            try:
+                await self._on_tick(self.is_leader)
+            except Exception:
+                log.warning("lease tick failed", exc_info=True)
+
+    async def _step_down(self) -> None:
+        self.token = None
+        try:
+            await self._on_lost()
+        except Exception:
+            log.warning("step down failed", exc_info=True)
@@ -0,0 +1,243 @@
+"""
+Метрики в текстовом формате Prometheus (без внешних зависимостей).
+
+Counter / Gauge / Histogram с метками, регистрируются при импорте модуля,
+отдаются целиком в render() на /metrics. Коллекторы — функции, которые
+досчитывают значения в момент скрейпа (например, счётчики кэшей по всем
+тенантам). handler() оборачивает обработчики Telegram: гистограмма времени
+и, при PROFILE_SLOW_MS > 0, выборочный cProfile — профиль запуска, который
+оказался медленнее порога, пишется в лог.
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import random
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from aiohttp import web
+
+from settings import settings
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]  # (имя с суффиксом, метки, значение)
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    esc = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, esc)) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        """Текущие значения для экспозиции."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._v: Dict[Labels, float] = {}
+
+    def inc(self, n: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        self._v[k] = self._v.get(k, 0.0) + n
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, dict(zip(self.labelnames, k)), v) for k, v in self._v.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, v: float, **labels: str) -> None:
+        self._v[self._key(labels)] = v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(buckets)
+        self._v: Dict[Labels, List[float]] = {}  # [счётчики корзин..., sum, count]
+
+    def observe(self, x: float, **labels: str) -> None:
+        k = self._key(labels)
+        st = self._v.get(k)
+        if st is None:
+            st = self._v[k] = [0.0] * (len(self.buckets) + 2)
+        for i, b in enumerate(self.buckets):
+            if x <= b:
+                st[i] += 1
+                break
+        st[-2] += x
+        st[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self) -> List[Sample]:
+        out: List[Sample] = []
+        for k, st in self._v.items():
+            base = dict(zip(self.labelnames, k))
+            acc = 0.0
+            for b, n in zip(self.buckets, st):
+                acc += n
+                out.append((self.name + "_bucket", {**base, "le": _fmt_value(b)}, acc))
+            out.append((self.name + "_bucket", {**base, "le": "+Inf"}, st[-1]))
+            out.append((self.name + "_sum", base, st[-2]))
+            out.append((self.name + "_count", base, st[-1]))
+        return out
+
+
+# коллектор: () -> [(имя, тип, описание, [(метки, значение)])]
+Collector = Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, str], float]]]]]
+
+_registry: List[_Metric] = []
+_collectors: List[Collector] = []
+
+
+def collector(fn: Collector) -> Collector:
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        samples = m.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {m.name} {m.doc}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines += [f"{n}{_fmt_labels(lb)} {_fmt_value(v)}" for n, lb, v in samples]
+    for fn in _collectors:
+        for name, kind, doc, rows in fn():
+            rows = list(rows)
+            if not rows:
+                continue
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f"{name}{_fmt_labels(lb)} {_fmt_value(v)}" for lb, v in rows]
+    return "\n".join(lines) + "\n"
+
+
+async def handle(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """Отдельный сервер /metrics (в polling-режиме; в webhook-режиме маршрут на общем сервере)."""
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# ======================= метрики горячих путей =======================
+
+UPSTREAM_SECONDS = Histogram(
+    "trustbot_upstream_request_seconds", "Upstream HTTP latency", ("upstream", "endpoint", "status")
+)
+UPSTREAM_RETRIES = Counter("trustbot_upstream_retries_total", "Upstream request retries", ("upstream", "endpoint"))
+UPSTREAM_HEDGES = Counter("trustbot_upstream_hedges_total", "Hedged upstream requests sent", ("upstream", "endpoint"))
+UPSTREAM_STALE = Counter("trustbot_upstream_stale_total", "Last good value served instead of a failed fetch", ("source",))
+HANDLER_SECONDS = Histogram("trustbot_handler_seconds", "Telegram command/callback handler latency", ("handler",))
+HANDLER_ERRORS = Counter("trustbot_handler_errors_total", "Telegram handlers that raised", ("handler",))
+CALLBACKS_COALESCED = Counter(
+    "trustbot_callbacks_coalesced_total", "Button taps served without their own edit", ("result",)
+)
+POLL_SECONDS = Histogram("trustbot_poll_seconds", "Background poll run duration", ("source", "result"))
+WORKERS_SEEN = Histogram(
+    "trustbot_worker_stats_size", "Workers returned by one worker_stats call",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+)
+TG_SEND_SECONDS = Histogram("trustbot_telegram_send_seconds", "Telegram sendMessage latency", ("result",))
+TG_RETRY_AFTER = Counter("trustbot_telegram_retry_after_total", "Telegram 429 (RetryAfter) responses")
+SQLITE_TX_SECONDS = Histogram("trustbot_sqlite_tx_seconds", "SQLite write transaction duration", ("result",))
+SQLITE_LOCK_WAIT = Histogram("trustbot_sqlite_lock_wait_seconds", "Wait for the process-wide write lock")
+PROFILES = Counter("trustbot_profiles_dumped_total", "cProfile dumps of slow handlers", ("handler",))
+
+_profiling = False  # одновременно активен только один профайлер на процесс
+
+
+def _dump_profile(name: str, prof: cProfile.Profile, elapsed: float) -> None:
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(25)
+    PROFILES.inc(handler=name)
+    # в профиль попадают и задачи, шедшие в event loop параллельно с обработчиком
+    log.warning("slow handler %s: %.0f ms\n%s", name, elapsed * 1000, buf.getvalue())
+
+
+def handler(
+    name: str | Callable[..., str], fn: Callable[..., Awaitable[None]]
+) -> Callable[..., Awaitable[None]]:
+    """
+    Обёртка обработчика Telegram: латентность, ошибки, выборочный cProfile медленных запусков.
+    name может быть функцией от аргументов обработчика (метка по данным колбэка).
+    """
+
+    @functools.wraps(fn)
+    async def wrapped(*args, **kw):
+        global _profiling
+        label = name(*args) if callable(name) else name
+        prof = None
+        if settings.profile_slow_ms > 0 and not _profiling and random.random() < settings.profile_sample:
+            prof, _profiling = cProfile.Profile(), True
+            prof.enable()
+        t0 = time.perf_counter()
+        try:
+            await fn(*args, **kw)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=label)
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            HANDLER_SECONDS.observe(elapsed, handler=label)
+            if prof is not None:
+                prof.disable()
+                _profiling = False
+                if elapsed * 1000 >= settings.profile_slow_ms:
+                    _dump_profile(label, prof, elapsed)
+
+    return wrapped
@@ -0,0 +1,139 @@
+"""
+Компактные типизированные записи ответов Trustpool.
+
+Worker/Payout — классы со __slots__ (без dict на экземпляр), хешрейты
+разбираются один раз при создании в H/s. ProfitSeries хранит ряд прибыли
+в array('d'): для равномерной сетки — t0 + step, для явных точек — ещё и
+array('q') с временами; суммы по диапазону — через bisect по префиксным суммам.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Any, Dict, Iterator, Tuple
+
+from units import parse_float, parse_hashrate
+
+
+class Worker:
+    __slots__ = (
+        "coin", "name", "alias", "group", "last_active", "status",
+        "hr_recent", "hr_10min", "hr_1hour", "hr_1day", "reject_rate",
+    )
+
+    def __init__(
+        self,
+        coin: str,
+        name: str,
+        alias: str,
+        last_active: int,
+        status: str,
+        hr_recent: float,
+        hr_10min: float,
+        hr_1hour: float,
+        hr_1day: float,
+        reject_rate: float,
+        group: str = "",
+    ):
+        self.coin = coin
+        self.name = name
+        self.alias = alias
+        self.group = group
+        self.last_active = last_active
+        self.status = status
+        self.hr_recent = hr_recent
+        self.hr_10min = hr_10min
+        self.hr_1hour = hr_1hour
+        self.hr_1day = hr_1day
+        self.reject_rate = reject_rate
+
+    @classmethod
+    def from_api(cls, w: Dict[str, Any], coin: str, alias: str, group: str = "") -> "Worker":
+        return cls(
+            coin=coin,
+            name=w.get("name") or w.get("worker") or "unknown",
+            alias=alias,
+            last_active=int(w.get("last_active") or 0),
+            status=w.get("status") or "unknown",
+            hr_recent=parse_hashrate(w.get("recent_hashrate")),
+            hr_10min=parse_hashrate(w.get("hashrate_10min")),
+            hr_1hour=parse_hashrate(w.get("hashrate_1hour")),
+            hr_1day=parse_hashrate(w.get("hashrate_1day")),
+            reject_rate=parse_float(w.get("reject_rate")),
+            group=group,
+        )
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.coin, self.name
+
+    @property
+    def online(self) -> bool:
+        return self.status.lower() == "active"
+
+    def __repr__(self) -> str:
+        return f"Worker({self.coin}:{self.name}, {self.status}, {self.hr_recent:.3g} H/s)"
+
+
+class Payout:
+    __slots__ = ("coin", "time", "amount", "txid")
+
+    def __init__(self, coin: str, time: int, amount: float, txid: str = ""):
+        self.coin = coin
+        self.time = time
+        self.amount = amount
+        self.txid = txid
+
+    @property
+    def key(self) -> str:
+        # у некоторых выплат txid пустой — ключуем по времени и сумме
+        return self.txid or f"t{self.time}:{self.amount}"
+
+    def __repr__(self) -> str:
+        return f"Payout({self.coin} {self.amount} @ {self.time})"
+
+
+class ProfitSeries:
+    """Ряд прибыли. times is None — равномерная сетка t0 + i*step."""
+
+    __slots__ = ("t0", "step", "values", "times", "_prefix")
+
+    def __init__(self, values: array, *, t0: int = 0, step: int = 3600, times: array | None = None):
+        self.t0 = t0
+        self.step = step
+        self.values = values
+        self.times = times
+        self._prefix: array | None = None
+
+    @classmethod
+    def empty(cls, step: int = 3600) -> "ProfitSeries":
+        return cls(array("d"), step=step)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def time_at(self, i: int) -> int:
+        return self.times[i] if self.times is not None else self.t0 + i * self.step
+
+    def __iter__(self) -> Iterator[Tuple[int, float]]:
+        if self.times is not None:
+            return zip(self.times, self.values)
+        return ((self.t0 + i * self.step, v) for i, v in enumerate(self.values))
+
+    def _index_range(self, start: int, end: int) -> Tuple[int, int]:
+        """Индексы [lo, hi) точек с start <= time <= end."""
+        n = len(self.values)
+        if self.times is not None:
+            return bisect_left(self.times, start), bisect_right(self.times, end)
+        lo = max(0, -((self.t0 - start) // self.step))  # ceil((start - t0) / step)
+        hi = min(n, (end - self.t0) // self.step + 1) if end >= self.t0 else 0
+        return min(lo, n), max(hi, 0)
+
+    def sum_between(self, start: int, end: int) -> float:
+        lo, hi = self._index_range(start, end)
+        if hi <= lo:
+            return 0.0
+        if self._prefix is None:
+            self._prefix = array("d", accumulate(self.values, initial=0.0))
+        return self._prefix[hi] - self._prefix[lo]
@@ -0,0 +1,129 @@
+"""
+Локальный реестр выплат (таблица payout, ключ (coin, txid), индекс по времени).
+
+Синхронизируется из payouts_list; новые выплаты определяются по монете как
+строки, которых ещё не было в реестре. Первая синхронизация монеты — базовая
+линия без алертов. «Последняя выплата» читается из индекса, без запроса к API.
+Для выгрузки backfill() дописывает всю историю, что отдаёт Trustpool, но только
+выплаты старше самой ранней в реестре — новые по-прежнему видит лишь sync().
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List, Mapping, Tuple
+
+from models import Payout
+from settings import settings
+from storage import connection, kv_get, kv_get_many, kv_set_many, transaction
+
+_synced_at: Dict[Tuple[str, str], float] = {}
+_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+_backfilled: set[Tuple[str, str]] = set()
+
+
+def _init_key(tenant: str, coin: str) -> str:
+    return f"payout_ledger_init:{tenant}:{coin}"
+
+
+async def fetch(client, coin: str) -> List[Payout]:
+    return await client.payouts_list(coin, limit=settings.payout_sync_limit)
+
+
+async def ingest_many(tenant: str, by_coin: Mapping[str, List[Payout]]) -> Dict[str, List[Payout]]:
+    """
+    Пишет выплаты монет в реестр одной транзакцией (флаги первой синхронизации —
+    одним запросом). Возвращает новые по монетам (кроме первой синхронизации).
+    """
+    keys = {coin: _init_key(tenant, coin) for coin in by_coin}
+    out: Dict[str, List[Payout]] = {}
+    async with transaction() as db:
+        inited = await kv_get_many(keys.values())
+        for coin, payouts in by_coin.items():
+            rows = [(tenant, coin, p.key, p.time, p.amount) for p in payouts]
+            known: set[str] = set()
+            if rows:
+                marks = ",".join("?" * len(rows))
+                async with db.execute(
+                    f"SELECT txid FROM payout WHERE tenant=? AND coin=? AND txid IN ({marks})",
+                    (tenant, coin, *[r[2] for r in rows]),
+                ) as cur:
+                    known = {r[0] async for r in cur}
+                await db.executemany(
+                    "INSERT OR IGNORE INTO payout(tenant, coin, txid, time, amount) VALUES(?,?,?,?,?)", rows
+                )
+            new = [p for p, r in zip(payouts, rows) if r[2] not in known] if keys[coin] in inited else []
+            out[coin] = sorted(new, key=lambda p: p.time)
+        await kv_set_many({k: "1" for k in keys.values() if k not in inited})
+    now = time.monotonic()
+    for coin in by_coin:
+        _synced_at[(tenant, coin)] = now
+    return out
+
+
+async def ingest(tenant: str, coin: str, payouts: List[Payout]) -> List[Payout]:
+    """ingest_many по одной монете."""
+    return (await ingest_many(tenant, {coin: payouts}))[coin]
+
+
+async def sync(client, coin: str) -> List[Payout]:
+    """fetch + ingest под замком монеты."""
+    lock = _locks.setdefault((client.tenant, coin), asyncio.Lock())
+    async with lock:
+        return await ingest(client.tenant, coin, await fetch(client, coin))
+
+
+async def ensure(client, coin: str) -> None:
+    """
+    Для отчётов: подтягивает реестр, только если монета ещё ни разу не синхронизировалась.
+    Дальше его держит свежим цикл опроса — иначе отчёт «съел» бы новые выплаты без алерта.
+    """
+    key = (client.tenant, coin)
+    if key in _synced_at or await kv_get(_init_key(*key)) is not None:
+        _synced_at.setdefault(key, 0.0)
+        return
+    await sync(client, coin)
+
+
+async def backfill(client, coin: str) -> int:
+    """Дописывает выплаты старше самой ранней известной (раз за процесс). Возвращает число новых строк."""
+    key = (client.tenant, coin)
+    if key in _backfilled:
+        return 0
+    await ensure(client, coin)
+    async with _locks.setdefault(key, asyncio.Lock()):
+        db = await connection()
+        async with db.execute("SELECT MIN(time) FROM payout WHERE tenant=? AND coin=?", key) as cur:
+            row = await cur.fetchone()
+        oldest = row[0] if row and row[0] is not None else None
+        rows = [
+            (client.tenant, coin, p.key, p.time, p.amount)
+            for p in await client.payouts_iter(coin)
+            if oldest is None or p.time < oldest
+        ]
+        if rows:
+            async with transaction() as db:
+                await db.executemany(
+                    "INSERT OR IGNORE INTO payout(tenant, coin, txid, time, amount) VALUES(?,?,?,?,?)", rows
+                )
+        _backfilled.add(key)
+        return len(rows)
+
+
+async def last(tenant: str, coin: str) -> Tuple[int, float] | None:
+    """(time, amount) последней выплаты монеты."""
+    db = await connection()
+    async with db.execute(
+        "SELECT time, amount FROM payout WHERE tenant=? AND coin=? ORDER BY time DESC LIMIT 1", (tenant, coin)
+    ) as cur:
+        row = await cur.fetchone()
+    return (int(row[0]), float(row[1])) if row else None
+
+
+async def recent(tenant: str, coin: str, limit: int = 10) -> List[Payout]:
+    db = await connection()
+    async with db.execute(
+        "SELECT time, amount, txid FROM payout WHERE tenant=? AND coin=? ORDER BY time DESC LIMIT ?",
+        (tenant, coin, limit),
+    ) as cur:
+        return [Payout(coin, t, a, tx) async for t, a, tx in cur]
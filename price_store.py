@@ -0,0 +1,110 @@
+"""
+Локальная почасовая история цен (SQLite) для оценки дохода по часам.
+
+История общая для всех тенантов — ключ (монета, фиат). Первый раз монета
+загружается за PRICE_BACKFILL_DAYS одним запросом market_chart/range на
+каждые 90 дней (в этих пределах CoinGecko отдаёт почасовые точки), дальше —
+только часы начиная с последнего сохранённого (он мог быть неполным).
+Точки внутри часа усредняются. sync(since=...) (выгрузка за длинный период)
+дотягивает и часы раньше самого раннего сохранённого.
+
+value_between умножает каждую почасовую точку прибыли на цену её часа (сумма
+монет за период — profit_store.sum_between по колонке cum, без прохода); часы
+без цены (текущий час ещё не попал в историю CoinGecko, история недоступна)
+берут последнюю известную цену перед ними, а если её нет — спот. Если и
+спота нет (CoinGecko лежит), стоимость неизвестна — None, а не ноль.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+import profit_store
+from prices import market_chart
+from settings import settings
+from storage import connection, transaction
+
+HOUR = 3600
+WINDOW = 90 * 86400
+
+_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+_synced_at: Dict[Tuple[str, str], float] = {}
+_asked_since: Dict[Tuple[str, str], int] = {}
+
+
+async def _bounds(coin: str, fiat: str) -> Tuple[int | None, int | None]:
+    db = await connection()
+    async with db.execute("SELECT MIN(ts), MAX(ts) FROM price_hourly WHERE coin=? AND fiat=?", (coin, fiat)) as cur:
+        row = await cur.fetchone()
+    return (int(row[0]), int(row[1])) if row and row[0] is not None else (None, None)
+
+
+async def sync(coin: str, fiat: str, *, force: bool = False, since: int | None = None) -> int:
+    """Дотягивает почасовые цены монеты (с since, если задан). Возвращает число записанных часов."""
+    coin, fiat = coin.upper(), fiat.upper()
+    key = (coin, fiat)
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        now = int(time.time())
+        first, last = await _bounds(coin, fiat)
+        start = last if last is not None else now - settings.price_backfill_days * 86400
+        oldest = first if first is not None else start
+        deep = since is not None and since < min(oldest, _asked_since.get(key, oldest))
+        if not force and not deep and time.monotonic() - _synced_at.get(key, 0.0) < settings.price_sync_min_sec:
+            return 0
+        spans = [(since, oldest - 1)] if deep else []
+        spans.append((start, now))
+        buckets: Dict[int, List[float]] = {}
+        for a, b in spans:
+            for lo in range(a, b, WINDOW):
+                for ts, price in await market_chart(coin, fiat, lo, min(b, lo + WINDOW)):
+                    buckets.setdefault(ts - ts % HOUR, []).append(price)
+        rows = [(coin, fiat, h, sum(ps) / len(ps)) for h, ps in sorted(buckets.items())]
+        if rows:
+            async with transaction() as db:
+                await db.executemany(
+                    "REPLACE INTO price_hourly(coin, fiat, ts, price) VALUES(?,?,?,?)", rows
+                )
+        _synced_at[key] = time.monotonic()
+        if deep:
+            _asked_since[key] = since
+        return len(rows)
+
+
+async def hourly(coin: str, fiat: str, start_ts: int, end_ts: int) -> Tuple[Dict[int, float], float | None]:
+    """({час: цена} за [start_ts, end_ts], последняя цена до start_ts)."""
+    coin, fiat = coin.upper(), fiat.upper()
+    lo = start_ts - start_ts % HOUR
+    db = await connection()
+    async with db.execute(
+        "SELECT price FROM price_hourly WHERE coin=? AND fiat=? AND ts<? ORDER BY ts DESC LIMIT 1", (coin, fiat, lo)
+    ) as cur:
+        row = await cur.fetchone()
+    async with db.execute(
+        "SELECT ts, price FROM price_hourly WHERE coin=? AND fiat=? AND ts BETWEEN ? AND ?", (coin, fiat, lo, end_ts)
+    ) as cur:
+        prices = {int(ts): float(p) async for ts, p in cur}
+    return prices, (float(row[0]) if row else None)
+
+
+async def value_between(
+    tenant: str, coin: str, fiat: str, start_ts: int, end_ts: int, spot: float | None
+) -> float | None:
+    """Стоимость прибыли в фиате по цене каждого часа (None — цены нет) за start_ts <= time <= end_ts."""
+    points = await profit_store.points(tenant, coin, start_ts, end_ts)
+    if not points:
+        return 0.0
+    prices, prev = await hourly(coin, fiat, start_ts, end_ts)
+    value: float | None = 0.0
+    for ts, profit in points:
+        p = prices.get(ts - ts % HOUR)
+        if p is None:
+            p = prev if prev is not None else spot
+        else:
+            prev = p
+        if p is None:
+            value = None
+        elif value is not None:
+            value += profit * p
+    return value
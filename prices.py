@@ -1,28 +1,74 @@
-import aiohttp
+import time
+
+import resilience
+import tape
+from cache import ResponseCache
+from http_pool import COINGECKO, session
+from metrics import UPSTREAM_SECONDS
 from settings import settings
 
-CG = "https://api.coingecko.com/api/v3/simple/price"
+CG_PATH = "/simple/price"
+CHART_PATH = "/coins/{id}/market_chart/range"
 MAP = {"BTC": "bitcoin", "LTC": "litecoin", "DOGE": "dogecoin"}
 
-async def get_prices() -> dict[str, float]:
-    ids = ",".join([MAP[c] for c in settings.coins if c in MAP])
-    if not ids:
-        return {}
-    params = {"ids": ids, "vs_currencies": settings.fiat.lower()}
+# текущие цены — общий кэш на процесс (все тенанты и отчёты); при сбое CoinGecko
+# отдаёт последний удачный ответ с пометкой устаревших данных
+cache = ResponseCache("CoinGecko")
+
+async def _request(path: str, endpoint: str, params: dict[str, str]):
+    t0 = time.perf_counter()
+    status = "error"
     try:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15)) as s:
-            async with s.get(CG, params=params) as r:
-                r.raise_for_status()
-                j = await r.json()
-    except Exception:
+        async with session(COINGECKO).get(settings.coingecko_base + path, params=params) as r:
+            status = str(r.status)
+            r.raise_for_status()
+            return await r.json()
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - t0, upstream="coingecko", endpoint=endpoint, status=status)
+
+async def _get(path: str, endpoint: str, params: dict[str, str]):
+    return await resilience.call(
+        "coingecko", endpoint, lambda: tape.through("coingecko", path, params, lambda: _request(path, endpoint, params))
+    )
+
+async def get_prices(coins: list[str] | None = None, fiat: str | None = None) -> dict[str, float]:
+    """
+    {монета: текущая цена}. Монет без цены в ответе нет в словаре; если CoinGecko
+    недоступен и в кэше нет прошлого ответа — исключение, а не нули.
+    """
+    coins = coins or settings.coins
+    fiat = (fiat or settings.fiat).lower()
+    ids = ",".join([MAP[c] for c in coins if c in MAP])
+    if not ids:
         return {}
+    params = {"ids": ids, "vs_currencies": fiat}
+    j = await cache.get(
+        (ids, fiat), lambda: _get(CG_PATH, "simple_price", params),
+        ttl=settings.price_ttl_sec, swr=settings.cache_swr_sec, group=CG_PATH, fallback=True,
+    )
     out: dict[str, float] = {}
     try:
         for c, cg in MAP.items():
-            if c in settings.coins:
-                v = (j or {}).get(cg, {}).get(settings.fiat.lower())
-                out[c] = float(v) if v is not None else 0.0
+            if c in coins:
+                v = (j or {}).get(cg, {}).get(fiat)
+                if v is not None:
+                    out[c] = float(v)
     except Exception:
         # В случае странного ответа — вернём то, что успели собрать
         pass
     return out
+
+async def market_chart(coin: str, fiat: str, start_ts: int, end_ts: int) -> list[tuple[int, float]]:
+    """[(ts, цена)] за [start_ts, end_ts]: до 90 дней — почасовые точки, до суток — 5-минутные."""
+    cg = MAP.get(coin.upper())
+    if not cg:
+        return []
+    params = {"vs_currency": fiat.lower(), "from": str(int(start_ts)), "to": str(int(end_ts))}
+    j = await _get(CHART_PATH.format(id=cg), "market_chart", params)
+    out: list[tuple[int, float]] = []
+    for p in (j or {}).get("prices") or []:
+        try:
+            out.append((int(p[0]) // 1000, float(p[1])))
+        except (TypeError, ValueError, IndexError):
+            continue
+    return out
@@ -0,0 +1,151 @@
+"""
+Локальное хранилище почасовой прибыли (SQLite).
+
+Точки profit_chart дописываются инкрементально: запрашиваются только часы
+после последней сохранённой точки (+ пара последних часов на дозапись
+текущего неполного часа). Колонка cum — накопленная сумма по монете, поэтому
+сумма за любой [start, end] — два индексных поиска, а не проход по точкам.
+Все данные разнесены по тенантам (аккаунтам Trustpool).
+
+sync(since=...) нужен выгрузке: если история начинается позже since, график
+запрашивается глубже (до CHART_MAX_HOURS за раз) и переписывается целиком.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from datetime import datetime, timedelta, tzinfo
+from typing import Dict, List, Tuple
+
+import aiosqlite
+
+from settings import settings
+from storage import connection, transaction
+
+HOUR = 3600
+# сколько последних часов перезаписываем при каждой синхронизации
+REFRESH_HOURS = 2
+# глубже за один запрос почасовой график не тянем
+CHART_MAX_HOURS = 24 * 90
+
+_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+_synced_at: Dict[Tuple[str, str], float] = {}
+_asked_since: Dict[Tuple[str, str], int] = {}  # самое раннее since, уже запрошенное у API
+
+
+async def _last_point(db: aiosqlite.Connection, tenant: str, coin: str) -> Tuple[int, float] | None:
+    async with db.execute(
+        "SELECT ts, cum FROM profit_hourly WHERE tenant=? AND coin=? ORDER BY ts DESC LIMIT 1", (tenant, coin)
+    ) as cur:
+        row = await cur.fetchone()
+    return (int(row[0]), float(row[1])) if row else None
+
+
+async def _cum_at(db: aiosqlite.Connection, tenant: str, coin: str, ts: int, *, inclusive: bool) -> float:
+    op = "<=" if inclusive else "<"
+    async with db.execute(
+        f"SELECT cum FROM profit_hourly WHERE tenant=? AND coin=? AND ts {op} ? ORDER BY ts DESC LIMIT 1",
+        (tenant, coin, ts),
+    ) as cur:
+        row = await cur.fetchone()
+    return float(row[0]) if row else 0.0
+
+
+async def sync(client, coin: str, *, force: bool = False, since: int | None = None) -> int:
+    """
+    Дотягивает новые часовые точки монеты аккаунта client. Возвращает число записанных точек.
+    since — нужна история с этого момента (если её ещё нет, график запрашивается глубже).
+    """
+    tenant = client.tenant
+    key = (tenant, coin)
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        now = int(time.time())
+        oldest = await first_ts(tenant, coin) or now
+        deep = since is not None and since < min(oldest, _asked_since.get(key, oldest))
+        if not force and not deep and time.monotonic() - _synced_at.get(key, 0.0) < settings.profit_sync_min_sec:
+            return 0
+
+        last = await _last_point(await connection(), tenant, coin)
+
+        if last is None:
+            size = settings.profit_backfill_hours
+        else:
+            behind = max(0, now - last[0]) // HOUR
+            size = min(settings.profit_backfill_hours, behind + REFRESH_HOURS + 1)
+        if deep:
+            size = max(size, min(CHART_MAX_HOURS, (now - since) // HOUR + 1))
+
+        series = await client.profit_chart(coin=coin, range_type="hour", size=size)
+        points = [(t, v) for t, v in series if t]
+        if not points:
+            return 0
+
+        head = points[0][0]
+        async with transaction() as db:
+            base = await _cum_at(db, tenant, coin, head, inclusive=False)
+            # cum точки — база + сумма ряда с head по неё (префиксные суммы ProfitSeries)
+            rows = [(tenant, coin, int(t), v, base + series.sum_between(head, t)) for t, v in points]
+            # всё, что не старше первой полученной точки, переписываем заново
+            await db.execute(
+                "DELETE FROM profit_hourly WHERE tenant=? AND coin=? AND ts>=?", (tenant, coin, head)
+            )
+            await db.executemany(
+                "INSERT INTO profit_hourly(tenant, coin, ts, profit, cum) VALUES(?,?,?,?,?)", rows
+            )
+
+        _synced_at[key] = time.monotonic()
+        if deep:
+            _asked_since[key] = since
+        return len(rows)
+
+
+async def sum_between(tenant: str, coin: str, start_ts: int, end_ts: int) -> float:
+    """Сумма прибыли по точкам с start_ts <= time <= end_ts."""
+    if end_ts < start_ts:
+        return 0.0
+    db = await connection()
+    hi = await _cum_at(db, tenant, coin, end_ts, inclusive=True)
+    lo = await _cum_at(db, tenant, coin, start_ts, inclusive=False)
+    return hi - lo
+
+
+async def points(tenant: str, coin: str, start_ts: int, end_ts: int) -> List[Tuple[int, float]]:
+    """Почасовые точки (ts, прибыль) с start_ts <= time <= end_ts по возрастанию времени."""
+    db = await connection()
+    async with db.execute(
+        "SELECT ts, profit FROM profit_hourly WHERE tenant=? AND coin=? AND ts BETWEEN ? AND ? ORDER BY ts",
+        (tenant, coin, start_ts, end_ts),
+    ) as cur:
+        return [(int(ts), float(v)) async for ts, v in cur]
+
+
+async def first_ts(tenant: str, coin: str) -> int:
+    db = await connection()
+    async with db.execute("SELECT MIN(ts) FROM profit_hourly WHERE tenant=? AND coin=?", (tenant, coin)) as cur:
+        row = await cur.fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
+
+
+_PERIOD_RE = re.compile(r"^(\d+)\s*([hdw])$")
+
+
+def period_range(spec: str, tz: tzinfo, now: datetime | None = None) -> Tuple[int, int]:
+    """
+    '24h', '7d', '30d', '90d', '2w', 'mtd', 'ytd' -> (start_ts, end_ts) в секундах UTC.
+    mtd/ytd считаются от начала месяца/года в часовом поясе tz.
+    """
+    now = now or datetime.now(tz)
+    s = (spec or "").strip().lower()
+    if s == "ytd":
+        start = datetime(now.year, 1, 1, tzinfo=tz)
+    elif s == "mtd":
+        start = datetime(now.year, now.month, 1, tzinfo=tz)
+    else:
+        m = _PERIOD_RE.match(s)
+        if not m:
+            raise ValueError(f"Непонятный период: {spec!r} (пример: 7d, 30d, 90d, ytd)")
+        n, unit = int(m.group(1)), m.group(2)
+        start = now - {"h": timedelta(hours=n), "d": timedelta(days=n), "w": timedelta(weeks=n)}[unit]
+    return int(start.timestamp()), int(now.timestamp())
@@ -0,0 +1,132 @@
+"""
+Материализованные отчёты для кнопок меню.
+
+Отрисованный текст каждого отчёта (тенант × вид) хранится в памяти вместе со
+временем сборки. Обработчики отвечают из снимка сразу; если снимок старше
+max_age — отдают его и пересобирают в фоне. Опросчики после изменения данных
+помечают затронутые отчёты, и те пересобираются в фоне — только уже
+открывавшиеся: по отчётам, которые никто не смотрит, работы нет.
+Сборка одного отчёта single-flight: параллельные запросы ждут одну задачу.
+Builder возвращает текст или объект-представление с атрибутом text (сводка) —
+тогда снимок хранит и его: страницы/фильтры рендерятся из снимка по нажатию.
+Если при сборке какой-то источник отдал запасное (устаревшее) значение, снимок
+помнит это в stale и пересобирается в фоне при каждом обращении.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Set, Tuple
+
+import resilience
+from tenants import Tenant, registry
+
+log = logging.getLogger(__name__)
+
+Builder = Callable[[Tenant], Awaitable[Any]]  # str или объект с .text
+Key = Tuple[str, str]  # (tenant, вид отчёта)
+
+
+class Snapshot:
+    __slots__ = ("value", "built_at", "stale")
+
+    def __init__(self, value: Any, built_at: float, stale: Dict[str, float] | None = None):
+        self.value = value
+        self.built_at = built_at
+        self.stale = stale or {}  # источник -> на какой момент его данные
+
+    @property
+    def text(self) -> str:
+        return self.value if isinstance(self.value, str) else self.value.text
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+
+class Reports:
+    def __init__(self) -> None:
+        self._builders: Dict[str, Builder] = {}
+        self._snaps: Dict[Key, Snapshot] = {}
+        self._building: Dict[Key, asyncio.Task] = {}
+        self._stale: Set[Key] = set()  # данные поменялись во время сборки
+        self._bg: Set[asyncio.Task] = set()
+
+    def register(self, kind: str, builder: Builder) -> None:
+        self._builders[kind] = builder
+
+    def kinds(self) -> Iterable[str]:
+        return self._builders.keys()
+
+    async def _build(self, t: Tenant, kind: str) -> Snapshot:
+        key = (t.id, kind)
+        task = self._building.get(key)
+        if task is None:
+            task = self._building[key] = asyncio.create_task(self._run(t, kind))
+            task.add_done_callback(lambda _: self._done(t, kind))
+        return await asyncio.shield(task)
+
+    def _done(self, t: Tenant, kind: str) -> None:
+        key = (t.id, kind)
+        self._building.pop(key, None)
+        if key in self._stale:
+            self._stale.discard(key)
+            self._refresh(registry.get(t.id) or t, kind)
+
+    async def _run(self, t: Tenant, kind: str) -> Snapshot:
+        started = time.time()
+        with resilience.track() as stale:
+            value = await self._builders[kind](t)
+        snap = self._snaps[(t.id, kind)] = Snapshot(value, started, stale)
+        return snap
+
+    def _refresh(self, t: Tenant, kind: str, *, changed: bool = False) -> None:
+        if (t.id, kind) in self._building:
+            if changed:
+                self._stale.add((t.id, kind))
+            return
+
+        async def bg() -> None:
+            try:
+                await self._build(t, kind)
+            except Exception:
+                log.warning("report %s/%s refresh failed", t.id, kind, exc_info=True)
+
+        task = asyncio.create_task(bg())
+        self._bg.add(task)
+        task.add_done_callback(self._bg.discard)
+
+    async def get(self, t: Tenant, kind: str, *, max_age: float, not_before: float = 0.0) -> Snapshot:
+        """
+        Снимок отчёта; первый запрос собирает синхронно, устаревший — обновляется в фоне.
+        Снимок, собранный раньше not_before, не годится вовсе и собирается заново.
+        """
+        snap = self._snaps.get((t.id, kind))
+        if snap is None or snap.built_at < not_before:
+            return await self._build(t, kind)
+        if snap.age > max_age or snap.stale:
+            self._refresh(t, kind)
+        return snap
+
+    def invalidate(self, tid: str, *kinds: str) -> int:
+        """Данные изменились: пересобрать в фоне уже материализованные отчёты тенанта."""
+        t = registry.get(tid)
+        if t is None:
+            return 0
+        n = 0
+        for kind in kinds:
+            if (tid, kind) in self._snaps:
+                self._refresh(t, kind, changed=True)
+                n += 1
+        return n
+
+    def drop(self, tid: str) -> None:
+        for key in [k for k in self._snaps if k[0] == tid]:
+            del self._snaps[key]
+
+    def __len__(self) -> int:
+        return len(self._snaps)
+
+
+reports = Reports()
@@ -0,0 +1,176 @@
+"""
+Устойчивый доступ к апстримам (Trustpool, CoinGecko) — общий для обоих клиентов.
+
+call() оборачивает идемпотентный GET:
+- повтор с экспоненциальной задержкой и полным jitter — только на сетевые
+  ошибки, таймауты, 429 и 5xx (4xx и ответ с битым телом не повторяем);
+- circuit breaker на (апстрим, эндпоинт): после BREAKER_FAILURES неудачных
+  вызовов подряд эндпоинт «открыт» BREAKER_COOLDOWN_SEC — вызовы сразу падают
+  с CircuitOpen, затем один пробный вызов решает, закрыться или открыться снова;
+- hedged request: если ответа нет за UPSTREAM_HEDGE_MS, параллельно уходит
+  второй такой же запрос, берётся первый успешный (0 — выкл.).
+
+Запасной вариант — последний удачный ответ — отдают уровнем выше (кэш ответов
+Trustpool, цены) и отмечают через note_stale(). Отчёт, собранный внутри
+track(), узнаёт, какие источники были устаревшими и с какого момента.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterator, Tuple, TypeVar
+
+import aiohttp
+
+from metrics import UPSTREAM_HEDGES, UPSTREAM_RETRIES, UPSTREAM_STALE, collector
+from settings import settings
+
+T = TypeVar("T")
+
+
+class CircuitOpen(Exception):
+    """Эндпоинт апстрима временно считается недоступным."""
+
+
+class Breaker:
+    __slots__ = ("failures", "opened_at", "probing")
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    @property
+    def open(self) -> bool:
+        return self.failures >= settings.breaker_failures
+
+    def allow(self) -> bool:
+        if not self.open:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < settings.breaker_cooldown_sec:
+            return False
+        self.probing = True  # полуоткрыт: пропускаем один пробный вызов
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.open:
+            self.opened_at = time.monotonic()
+
+
+_breakers: Dict[Tuple[str, str], Breaker] = {}
+
+
+def breaker(upstream: str, endpoint: str) -> Breaker:
+    b = _breakers.get((upstream, endpoint))
+    if b is None:
+        b = _breakers[(upstream, endpoint)] = Breaker()
+    return b
+
+
+def open_circuits() -> list[Tuple[str, str]]:
+    return [k for k, b in _breakers.items() if b.open]
+
+
+def _retryable(e: BaseException) -> bool:
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    if not isinstance(e, aiohttp.ClientError):
+        return False
+    status = getattr(e, "status", None)
+    if status is None:
+        return True  # соединение, обрыв тела и т. п.
+    return status == 0 or status == 429 or status >= 500
+
+
+async def _hedged(fetch: Callable[[], Awaitable[T]], upstream: str, endpoint: str) -> T:
+    delay = settings.upstream_hedge_ms / 1000
+    if delay <= 0:
+        return await fetch()
+    first = asyncio.ensure_future(fetch())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+        UPSTREAM_HEDGES.inc(upstream=upstream, endpoint=endpoint)
+        tasks.add(asyncio.ensure_future(fetch()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+                error = t.exception()
+        raise error
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+async def call(upstream: str, endpoint: str, fetch: Callable[[], Awaitable[T]]) -> T:
+    """fetch() — один HTTP-вызов; повторы, breaker и hedging — здесь."""
+    br = breaker(upstream, endpoint)
+    if not br.allow():
+        raise CircuitOpen(f"{upstream} {endpoint}: circuit open")
+    attempts = 1 + max(0, settings.upstream_retries)
+    for i in range(attempts):
+        try:
+            value = await _hedged(fetch, upstream, endpoint)
+        except asyncio.CancelledError:
+            br.probing = False
+            raise
+        except Exception as e:
+            if not _retryable(e):
+                br.probing = False  # апстрим ответил — не сбой, но и пробу не держим
+                raise
+            if i == attempts - 1:
+                br.failure()
+                raise
+            UPSTREAM_RETRIES.inc(upstream=upstream, endpoint=endpoint)
+            await asyncio.sleep(random.uniform(0, settings.upstream_retry_base_ms / 1000 * 2**i))
+            continue
+        br.success()
+        return value
+    raise AssertionError("unreachable")
+
+
+# ======================= устаревшие данные =======================
+
+# источник -> время (unix), на которое данные актуальны; None — никто не слушает
+_stale: ContextVar[Dict[str, float] | None] = ContextVar("stale", default=None)
+
+
+def note_stale(source: str, since: float) -> None:
+    """Вместо свежего ответа отдан запасной — от момента since."""
+    UPSTREAM_STALE.inc(source=source)
+    d = _stale.get()
+    if d is not None:
+        d[source] = min(d.get(source, since), since)
+
+
+@contextmanager
+def track() -> Iterator[Dict[str, float]]:
+    """Собирает note_stale() из текущей задачи и порождённых в ней."""
+    d: Dict[str, float] = {}
+    token = _stale.set(d)
+    try:
+        yield d
+    finally:
+        _stale.reset(token)
+
+
+@collector
+def _breaker_metrics():
+    yield (
+        "trustbot_circuit_open", "gauge", "Upstream endpoints failing fast (1 = open)",
+        [({"upstream": u, "endpoint": e}, int(b.open)) for (u, e), b in _breakers.items()],
+    )
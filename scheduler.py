@@ -0,0 +1,191 @@
+"""
+Расписание опроса тенантов: отдельная каденция на каждый источник данных.
+
+Каждый (тенант, источник) — цепочка run_once: следующий запуск планируется
+только после завершения текущего, поэтому запуски одного источника никогда
+не перекрываются. Интервал адаптивный:
+- источник сообщил об изменениях — интервал сжимается (×0.5, не ниже lo);
+- изменений нет — растёт (×1.25, не выше hi);
+- ошибка апстрима — экспоненциальный backoff от lo до hi;
+- align — запуск привязан к границе периода (профит — к началу часа);
+- cap — подсказка источника «опроси не позже чем через N сек»
+  (воркеры: ближайший дедлайн активности / подтверждение suspected).
+Старты тенантов разнесены по интервалу (по рангу id при старте, по хешу id —
+для добавленных на лету) плюс случайный jitter, чтобы тысячи аккаунтов
+не били в API пула одной пачкой.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from telegram.ext import Application, ContextTypes
+
+from metrics import POLL_SECONDS
+from settings import settings
+
+log = logging.getLogger(__name__)
+
+FIRST_DELAY_SEC = 10
+GROW = 1.25
+SHRINK = 0.5
+
+# fn(app, tid) -> изменилось ли что-то; None — источник для тенанта больше не нужен
+PollFn = Callable[[Application, str], Awaitable[bool | None]]
+CapFn = Callable[[str], float | None]
+
+
+class Source:
+    __slots__ = ("name", "fn", "base", "lo", "hi", "align", "offset", "cap")
+
+    def __init__(
+        self,
+        name: str,
+        fn: PollFn,
+        *,
+        base: float,
+        lo: float | None = None,
+        hi: float | None = None,
+        align: int = 0,
+        offset: float = 0.0,
+        cap: CapFn | None = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.base = base
+        self.lo = lo if lo is not None else base / 4
+        self.hi = hi if hi is not None else base * 4
+        self.align = align
+        self.offset = offset
+        self.cap = cap
+
+
+class _Run:
+    __slots__ = ("interval", "errors", "frac", "runs")
+
+    def __init__(self, interval: float, frac: float):
+        self.interval = interval
+        self.errors = 0
+        self.frac = frac
+        self.runs = 0
+
+
+_sources: Dict[str, Source] = {}
+_runs: Dict[Tuple[str, str], _Run] = {}
+
+
+def _job_name(tid: str, source: str) -> str:
+    return f"poll:{tid}:{source}"
+
+
+def hash_offset(key: str) -> float:
+    """Детерминированная доля [0, 1) интервала для тенанта."""
+    return zlib.crc32(key.encode()) / 2**32
+
+
+def _next_delay(src: Source, run: _Run, tid: str, changed: bool, error: bool) -> float:
+    if error:
+        run.errors += 1
+        delay = min(src.hi, src.lo * 2 ** run.errors)
+    else:
+        run.errors = 0
+        if src.align:
+            now = time.time()
+            delay = src.align - now % src.align + src.offset + run.frac * src.lo
+        else:
+            run.interval = max(src.lo, run.interval * SHRINK) if changed else min(src.hi, run.interval * GROW)
+            delay = run.interval
+        if src.cap:
+            cap = src.cap(tid)
+            if cap is not None:
+                delay = min(delay, max(src.lo, cap))
+    return delay + random.uniform(0, settings.poll_jitter_sec)
+
+
+async def _tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    tid, name = context.job.data
+    run = _runs.get((tid, name))
+    src = _sources.get(name)
+    if run is None or src is None:
+        return  # тенант снят с расписания
+    changed, error = False, False
+    t0 = time.perf_counter()
+    try:
+        r = await src.fn(context.application, tid)
+        if r is None:
+            _runs.pop((tid, name), None)
+            return
+        changed = r
+    except Exception:
+        error = True
+        log.warning("poll %s/%s failed (errors in a row: %d)", tid, name, run.errors + 1, exc_info=True)
+    finally:
+        POLL_SECONDS.observe(time.perf_counter() - t0, source=name, result="error" if error else "ok")
+    run.runs += 1
+    if _runs.get((tid, name)) is not run:
+        return  # сняли с расписания (или переназначили), пока шёл опрос
+    context.job_queue.run_once(
+        _tick, _next_delay(src, run, tid, changed, error), data=(tid, name), name=_job_name(tid, name)
+    )
+
+
+def set_sources(sources: Iterable[Source]) -> None:
+    _sources.clear()
+    _sources.update((s.name, s) for s in sources)
+
+
+def schedule_tenant(app: Application, tid: str, frac: float | None = None) -> None:
+    if frac is None:
+        frac = hash_offset(tid)
+    for src in _sources.values():
+        key = (tid, src.name)
+        if key in _runs:
+            continue
+        _runs[key] = _Run(src.base, frac)
+        first = FIRST_DELAY_SEC + frac * (src.lo if src.align else src.base)
+        app.job_queue.run_once(_tick, first, data=key, name=_job_name(tid, src.name))
+
+
+def unschedule_tenant(app: Application, tid: str) -> None:
+    for name in _sources:
+        _runs.pop((tid, name), None)
+        for job in app.job_queue.get_jobs_by_name(_job_name(tid, name)):
+            job.schedule_removal()
+
+
+def schedule_all(app: Application, tids: Iterable[str]) -> None:
+    ids = sorted(tids)
+    for i, tid in enumerate(ids):
+        schedule_tenant(app, tid, frac=i / max(1, len(ids)))
+
+
+def scheduled() -> set[str]:
+    return {tid for tid, _ in _runs}
+
+
+def unschedule_all(app: Application) -> None:
+    for tid in scheduled():
+        unschedule_tenant(app, tid)
+
+
+def reconcile(app: Application, tids: Iterable[str]) -> None:
+    """Приводит расписание к списку тенантов: новых ставит, удалённых снимает."""
+    want = set(tids)
+    have = scheduled()
+    for tid in have - want:
+        unschedule_tenant(app, tid)
+    for tid in sorted(want - have):
+        schedule_tenant(app, tid)
+
+
+def stats() -> List[Tuple[str, int, float, int]]:
+    """(источник, тенантов, средний текущий интервал, ошибок подряд суммарно) — для /cache."""
+    out = []
+    for name in _sources:
+        rs = [r for (_, n), r in _runs.items() if n == name]
+        if rs:
+            out.append((name, len(rs), sum(r.interval for r in rs) / len(rs), sum(r.errors for r in rs)))
+    return out
@@ -24,9 +24,123 @@ class Settings(BaseModel):
         ]
     )
 
+    # Выбор лидера между репликами: sqlite (общий DB_PATH на томе) | local (одна реплика)
+    leader_backend: str = Field(default_factory=lambda: os.getenv("LEADER_BACKEND", "sqlite"))
+    leader_lease_sec: float = Field(default_factory=lambda: float(os.getenv("LEADER_LEASE_SEC", "30")))
+
+    # Webhook-режим (включается заданным WEBHOOK_URL — публичный https-адрес бота)
+    webhook_url: str = Field(default_factory=lambda: os.getenv("WEBHOOK_URL", ""))
+    webhook_path: str = Field(default_factory=lambda: os.getenv("WEBHOOK_PATH", "/telegram"))
+    webhook_listen: str = Field(default_factory=lambda: os.getenv("WEBHOOK_LISTEN", "0.0.0.0"))
+    webhook_port: int = Field(default_factory=lambda: int(os.getenv("WEBHOOK_PORT", "8080")))
+    webhook_secret: str = Field(default_factory=lambda: os.getenv("WEBHOOK_SECRET", ""))
+
+    # Метрики Prometheus: отдельный порт /metrics в polling-режиме (0 — выкл.;
+    # в webhook-режиме /metrics всегда на сервере вебхука)
+    metrics_port: int = Field(default_factory=lambda: int(os.getenv("METRICS_PORT", "0")))
+    metrics_listen: str = Field(default_factory=lambda: os.getenv("METRICS_LISTEN", "0.0.0.0"))
+    # cProfile медленных обработчиков: порог (мс, 0 — выкл.) и доля профилируемых запусков
+    profile_slow_ms: float = Field(default_factory=lambda: float(os.getenv("PROFILE_SLOW_MS", "0")))
+    profile_sample: float = Field(default_factory=lambda: float(os.getenv("PROFILE_SAMPLE", "0.1")))
+
+    # Снимки отчётов меню: старше этого возраста — пересборка в фоне (сек)
+    report_max_age_sec: float = Field(default_factory=lambda: float(os.getenv("REPORT_MAX_AGE_SEC", "120")))
+
+    # Апдейты Telegram: сколько обрабатывать параллельно (1 — строго по очереди)
+    # и окно debounce серии нажатий кнопок одного сообщения (мс, 0 — выкл.)
+    updates_concurrency: int = Field(default_factory=lambda: int(os.getenv("UPDATES_CONCURRENCY", "16")))
+    callback_debounce_ms: float = Field(default_factory=lambda: float(os.getenv("CALLBACK_DEBOUNCE_MS", "300")))
+
+    # Отчёт «Хешрейт»: воркеров на странице списка и сколько худших показывать в сводке
+    hashrate_page_size: int = Field(default_factory=lambda: int(os.getenv("HASHRATE_PAGE_SIZE", "25")))
+    hashrate_top_n: int = Field(default_factory=lambda: int(os.getenv("HASHRATE_TOP_N", "10")))
+
+    # Кто может управлять тенантами (по умолчанию — чаты из TELEGRAM_CHAT_IDS)
+    admin_chats: List[int] = Field(
+        default_factory=lambda: [
+            int(x.strip())
+            for x in (os.getenv("ADMIN_CHAT_IDS") or os.getenv("TELEGRAM_CHAT_IDS", "")).split(",")
+            if x.strip().lstrip("-").isdigit()
+        ]
+    )
+
+    # Опрос тенантов (сек): у каждого источника своя адаптивная каденция.
+    # Воркеры: базовый интервал / минимум (подтверждение офлайна, backoff) / максимум в тишине
+    poll_interval_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_INTERVAL_SEC", "120")))
+    poll_min_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_MIN_SEC", "30")))
+    poll_workers_max_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_WORKERS_MAX_SEC", "600")))
+    # Выплаты и цены/доход за 24ч (границы — ×¼ … ×4 от базового)
+    poll_payouts_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_PAYOUTS_SEC", "900")))
+    poll_prices_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_PRICES_SEC", "300")))
+    # Профит: раз в час, через столько секунд после начала часа
+    poll_profit_offset_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_PROFIT_OFFSET_SEC", "120")))
+    # Случайный сдвиг каждого запуска
+    poll_jitter_sec: float = Field(default_factory=lambda: float(os.getenv("POLL_JITTER_SEC", "5")))
+
+    # Рассылка: лимиты Telegram (сообщений в секунду) и число параллельных отправителей
+    tg_global_rate: float = Field(default_factory=lambda: float(os.getenv("TELEGRAM_GLOBAL_RATE", "25")))
+    tg_chat_rate: float = Field(default_factory=lambda: float(os.getenv("TELEGRAM_CHAT_RATE", "1")))
+    tg_send_concurrency: int = Field(default_factory=lambda: int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "8")))
+
     # Trustpool Watcher API
     base: str = Field(default_factory=lambda: os.getenv("TRUSTPOOL_BASE", "https://trustpool.ru/res/saas").rstrip("/"))
     access_key: str = Field(default_factory=lambda: os.getenv("TRUSTPOOL_ACCESS_KEY", ""))
+    coingecko_base: str = Field(
+        default_factory=lambda: os.getenv("COINGECKO_BASE", "https://api.coingecko.com/api/v3").rstrip("/")
+    )
+
+    # Устойчивость к сбоям апстримов: повторы, circuit breaker, hedged requests
+    upstream_retries: int = Field(default_factory=lambda: int(os.getenv("UPSTREAM_RETRIES", "2")))
+    upstream_retry_base_ms: float = Field(default_factory=lambda: float(os.getenv("UPSTREAM_RETRY_BASE_MS", "300")))
+    upstream_hedge_ms: float = Field(default_factory=lambda: float(os.getenv("UPSTREAM_HEDGE_MS", "0")))
+    breaker_failures: int = Field(default_factory=lambda: int(os.getenv("BREAKER_FAILURES", "5")))
+    breaker_cooldown_sec: float = Field(default_factory=lambda: float(os.getenv("BREAKER_COOLDOWN_SEC", "30")))
+
+    # Запись / воспроизведение трафика к апстримам (см. tape.py)
+    upstream_record: str = Field(default_factory=lambda: os.getenv("UPSTREAM_RECORD", ""))
+    upstream_replay: str = Field(default_factory=lambda: os.getenv("UPSTREAM_REPLAY", ""))
+    upstream_replay_speed: float = Field(default_factory=lambda: float(os.getenv("UPSTREAM_REPLAY_SPEED", "0")))
+    upstream_replay_shift: bool = Field(
+        default_factory=lambda: os.getenv("UPSTREAM_REPLAY_SHIFT", "false").lower() in ("1", "true", "yes")
+    )
+
+    # HTTP (общий пул соединений на апстрим)
+    http_pool_limit: int = Field(default_factory=lambda: int(os.getenv("HTTP_POOL_LIMIT", "20")))
+    http_pool_limit_per_host: int = Field(default_factory=lambda: int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "10")))
+    http_keepalive_sec: float = Field(default_factory=lambda: float(os.getenv("HTTP_KEEPALIVE_SEC", "30")))
+    http_dns_ttl_sec: int = Field(default_factory=lambda: int(os.getenv("HTTP_DNS_TTL_SEC", "300")))
+
+    # Параллельный опрос по монетам
+    fanout_max_inflight: int = Field(default_factory=lambda: int(os.getenv("FANOUT_MAX_INFLIGHT", "8")))
+    fanout_deadline_sec: float = Field(default_factory=lambda: float(os.getenv("FANOUT_DEADLINE_SEC", "25")))
+
+    # Кэш ответов Trustpool: TTL по эндпоинтам и окно stale-while-revalidate (сек)
+    cache_ttl_home: float = Field(default_factory=lambda: float(os.getenv("CACHE_TTL_HOME", "60")))
+    cache_ttl_worker: float = Field(default_factory=lambda: float(os.getenv("CACHE_TTL_WORKER", "30")))
+    cache_ttl_payment: float = Field(default_factory=lambda: float(os.getenv("CACHE_TTL_PAYMENT", "120")))
+    cache_ttl_profit: float = Field(default_factory=lambda: float(os.getenv("CACHE_TTL_PROFIT", "300")))
+    cache_swr_sec: float = Field(default_factory=lambda: float(os.getenv("CACHE_SWR_SEC", "60")))
+
+    # Локальная история почасовой прибыли
+    profit_backfill_hours: int = Field(default_factory=lambda: int(os.getenv("PROFIT_BACKFILL_HOURS", str(24 * 14))))
+    profit_sync_min_sec: float = Field(default_factory=lambda: float(os.getenv("PROFIT_SYNC_MIN_SEC", "60")))
+
+    # Цены: TTL кэша текущих цен и почасовая история для оценки дохода по часам
+    price_ttl_sec: float = Field(default_factory=lambda: float(os.getenv("PRICE_TTL_SEC", "60")))
+    price_backfill_days: int = Field(default_factory=lambda: int(os.getenv("PRICE_BACKFILL_DAYS", "14")))
+    price_sync_min_sec: float = Field(default_factory=lambda: float(os.getenv("PRICE_SYNC_MIN_SEC", "600")))
+
+    # Выгрузка /export: строк на страницу чтения из SQLite и лимит сжатого файла (Telegram — до 50 МБ)
+    export_page_rows: int = Field(default_factory=lambda: int(os.getenv("EXPORT_PAGE_ROWS", "5000")))
+    export_max_mb: float = Field(default_factory=lambda: float(os.getenv("EXPORT_MAX_MB", "50")))
+
+    # Реестр выплат: сколько последних выплат запрашивать за раз
+    payout_sync_limit: int = Field(default_factory=lambda: int(os.getenv("PAYOUT_SYNC_LIMIT", "50")))
+
+    # Временные ряды воркеров: сколько хранить сырые сэмплы и rollup-корзины
+    series_raw_retention_h: int = Field(default_factory=lambda: int(os.getenv("SERIES_RAW_RETENTION_HOURS", "48")))
+    series_hourly_retention_d: int = Field(default_factory=lambda: int(os.getenv("SERIES_HOURLY_RETENTION_DAYS", "30")))
+    series_daily_retention_d: int = Field(default_factory=lambda: int(os.getenv("SERIES_DAILY_RETENTION_DAYS", "365")))
 
     # Business
     coins: List[str] = Field(default_factory=lambda: [c.strip().upper() for c in os.getenv("COINS", "BTC").split(",") if c.strip()])
@@ -34,11 +148,16 @@ class Settings(BaseModel):
 
     # Alerts
     alert_offline_min: int = Field(default_factory=lambda: int(os.getenv("ALERT_OFFLINE_MINUTES", "10")))
+    alert_offline_confirm_polls: int = Field(default_factory=lambda: int(os.getenv("ALERT_OFFLINE_CONFIRM_POLLS", "2")))
     alert_drop_pct: float = Field(default_factory=lambda: float(os.getenv("ALERT_HASHRATE_DROP_PCT", "35")))
     alert_min_daily_usd: float = Field(default_factory=lambda: float(os.getenv("ALERT_MIN_DAILY_USD", "0")))
     only_offline_alerts: bool = Field(default_factory=lambda: os.getenv("ONLY_OFFLINE_ALERTS", "false").lower() in {"1","true","yes"})
+    alert_ewma_alpha: float = Field(default_factory=lambda: float(os.getenv("ALERT_EWMA_ALPHA", "0.2")))
+    alert_warmup_samples: int = Field(default_factory=lambda: int(os.getenv("ALERT_WARMUP_SAMPLES", "5")))
+    detector_checkpoint_sec: float = Field(default_factory=lambda: float(os.getenv("DETECTOR_CHECKPOINT_SEC", "600")))
 
-    # Алиасы
+    # Алиасы: WORKER_ALIAS_* из окружения + файл (JSON/YAML), перечитывается при изменении
+    aliases_file: str = Field(default_factory=lambda: os.getenv("ALIASES_FILE", ""))
     worker_alias_scoped: Dict[Tuple[str, str], str] = Field(default_factory=dict)  # (COIN, normalized_name) -> alias
     worker_alias_global: Dict[str, str] = Field(default_factory=dict)              # normalized_name -> alias
 
@@ -48,15 +167,16 @@ class Settings(BaseModel):
         return v or ["BTC"]
 
     @classmethod
-    def build_alias_maps(cls) -> tuple[Dict[Tuple[str, str], str], Dict[str, str]]:
+    def build_alias_maps(cls, coins: List[str]) -> tuple[Dict[Tuple[str, str], str], Dict[str, str]]:
         scoped: Dict[Tuple[str, str], str] = {}
         global_: Dict[str, str] = {}
+        known = {c.upper() for c in coins} | {"BTC", "LTC", "DOGE"}
         for k, v in os.environ.items():
             if not k.startswith("WORKER_ALIAS_"):
                 continue
             tail = k[len("WORKER_ALIAS_"):]
             parts = tail.split("_", 1)
-            if len(parts) == 2 and parts[0].upper() in {"BTC", "LTC", "DOGE"}:
+            if len(parts) == 2 and parts[0].upper() in known:
                 coin = parts[0].upper()
                 name_norm = _normalize_key(parts[1])
                 scoped[(coin, name_norm)] = v
@@ -68,7 +188,7 @@ class Settings(BaseModel):
     @classmethod
     def load(cls) -> "Settings":
         s = cls()
-        scoped, global_ = cls.build_alias_maps()
+        scoped, global_ = cls.build_alias_maps(s.coins)
         s.worker_alias_scoped = scoped
         s.worker_alias_global = global_
         return s
@@ -1,21 +1,379 @@
+"""
+Хранилище состояния бота (SQLite).
+
+Одно долгоживущее соединение на процесс: открывается в on_startup, журнал WAL,
+synchronous=NORMAL. Записи группируются через transaction() — один коммит на
+цикл опроса вместо соединения на каждый ключ. Схема версионируется через
+PRAGMA user_version и список MIGRATIONS (только дописывать в конец!).
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Mapping
+
 import aiosqlite
 
-DB_PATH = "state.db"
+from metrics import SQLITE_LOCK_WAIT, SQLITE_TX_SECONDS
 
-CREATE = """CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT);"""
+DB_PATH = os.getenv("DB_PATH", "state.db")
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(CREATE)
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # ~16 МБ
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+]
+
+# MIGRATIONS[i] переводит схему с версии i на i+1
+MIGRATIONS: List[List[str]] = [
+    [
+        "CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT)",
+        # почасовая прибыль; cum — накопленная сумма по монете (для сумм по диапазону)
+        """CREATE TABLE IF NOT EXISTS profit_hourly (
+            coin TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            profit REAL NOT NULL,
+            cum REAL NOT NULL,
+            PRIMARY KEY (coin, ts)
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # журнал отправленных алертов
+        """CREATE TABLE alert_log (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            msg TEXT NOT NULL
+        )""",
+        "CREATE INDEX alert_log_ts ON alert_log(ts)",
+    ],
+    [
+        # временные ряды воркеров: справочник, сырые сэмплы и rollup-корзины (1ч/1д)
+        """CREATE TABLE worker (
+            id INTEGER PRIMARY KEY,
+            coin TEXT NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (coin, name)
+        )""",
+        """CREATE TABLE worker_sample (
+            worker_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            hr REAL NOT NULL,
+            hr_10m REAL NOT NULL,
+            reject REAL NOT NULL,
+            online INTEGER NOT NULL,
+            PRIMARY KEY (worker_id, ts)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX worker_sample_ts ON worker_sample(ts)",
+        """CREATE TABLE worker_rollup (
+            worker_id INTEGER NOT NULL,
+            res INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            hr_sum REAL NOT NULL,
+            hr_min REAL NOT NULL,
+            hr_max REAL NOT NULL,
+            reject_sum REAL NOT NULL,
+            online_n INTEGER NOT NULL,
+            PRIMARY KEY (worker_id, res, bucket)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX worker_rollup_bucket ON worker_rollup(res, bucket)",
+    ],
+    [
+        # чекпойнты потоковых детекторов алертов
+        """CREATE TABLE detector_state (
+            k TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            base REAL NOT NULL,
+            n INTEGER NOT NULL,
+            fired INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # состояние воркеров для офлайн-алертов (online/suspected/offline)
+        """CREATE TABLE worker_state (
+            coin TEXT NOT NULL,
+            name TEXT NOT NULL,
+            state TEXT NOT NULL,
+            since INTEGER NOT NULL,
+            last_active INTEGER NOT NULL,
+            PRIMARY KEY (coin, name)
+        ) WITHOUT ROWID""",
+    ],
+    [
+        # неотправленные сообщения рассылки (переживают рестарт)
+        """CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            created INTEGER NOT NULL
+        )""",
+    ],
+    [
+        # реестр выплат
+        """CREATE TABLE payout (
+            coin TEXT NOT NULL,
+            txid TEXT NOT NULL,
+            time INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (coin, txid)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX payout_coin_time ON payout(coin, time)",
+        "DELETE FROM kv WHERE k='last_payout_ts'",
+    ],
+    [
+        # мультиаккаунт: реестр тенантов и колонка tenant во всех per-account таблицах;
+        # существующие данные уезжают в тенант 'default'
+        """CREATE TABLE tenant (
+            id TEXT PRIMARY KEY,
+            access_key TEXT NOT NULL,
+            coins TEXT NOT NULL,
+            fiat TEXT NOT NULL,
+            aliases TEXT NOT NULL DEFAULT '{}',
+            enabled INTEGER NOT NULL DEFAULT 1
+        ) WITHOUT ROWID""",
+        """CREATE TABLE tenant_chat (
+            chat_id INTEGER NOT NULL,
+            tenant_id TEXT NOT NULL,
+            PRIMARY KEY (chat_id, tenant_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX tenant_chat_tenant ON tenant_chat(tenant_id)",
+
+        "ALTER TABLE profit_hourly RENAME TO profit_hourly_v7",
+        """CREATE TABLE profit_hourly (
+            tenant TEXT NOT NULL,
+            coin TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            profit REAL NOT NULL,
+            cum REAL NOT NULL,
+            PRIMARY KEY (tenant, coin, ts)
+        ) WITHOUT ROWID""",
+        "INSERT INTO profit_hourly SELECT 'default', coin, ts, profit, cum FROM profit_hourly_v7",
+        "DROP TABLE profit_hourly_v7",
+
+        "DROP INDEX payout_coin_time",
+        "ALTER TABLE payout RENAME TO payout_v7",
+        """CREATE TABLE payout (
+            tenant TEXT NOT NULL,
+            coin TEXT NOT NULL,
+            txid TEXT NOT NULL,
+            time INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (tenant, coin, txid)
+        ) WITHOUT ROWID""",
+        "INSERT INTO payout SELECT 'default', coin, txid, time, amount FROM payout_v7",
+        "DROP TABLE payout_v7",
+        "CREATE INDEX payout_coin_time ON payout(tenant, coin, time)",
+        "UPDATE kv SET k = 'payout_ledger_init:default:' || substr(k, 20) WHERE k LIKE 'payout_ledger_init:%'",
+
+        "ALTER TABLE worker RENAME TO worker_v7",
+        """CREATE TABLE worker (
+            id INTEGER PRIMARY KEY,
+            tenant TEXT NOT NULL,
+            coin TEXT NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (tenant, coin, name)
+        )""",
+        "INSERT INTO worker SELECT id, 'default', coin, name FROM worker_v7",
+        "DROP TABLE worker_v7",
+
+        "ALTER TABLE worker_state RENAME TO worker_state_v7",
+        """CREATE TABLE worker_state (
+            tenant TEXT NOT NULL,
+            coin TEXT NOT NULL,
+            name TEXT NOT NULL,
+            state TEXT NOT NULL,
+            since INTEGER NOT NULL,
+            last_active INTEGER NOT NULL,
+            PRIMARY KEY (tenant, coin, name)
+        ) WITHOUT ROWID""",
+        "INSERT INTO worker_state SELECT 'default', coin, name, state, since, last_active FROM worker_state_v7",
+        "DROP TABLE worker_state_v7",
+
+        "ALTER TABLE detector_state RENAME TO detector_state_v7",
+        """CREATE TABLE detector_state (
+            tenant TEXT NOT NULL,
+            k TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            base REAL NOT NULL,
+            n INTEGER NOT NULL,
+            fired INTEGER NOT NULL,
+            PRIMARY KEY (tenant, k)
+        ) WITHOUT ROWID""",
+        "INSERT INTO detector_state SELECT 'default', k, kind, base, n, fired FROM detector_state_v7",
+        "DROP TABLE detector_state_v7",
+
+        "ALTER TABLE alert_log ADD COLUMN tenant TEXT NOT NULL DEFAULT 'default'",
+    ],
+    # 8 -> 9: аренда лидерства между репликами (leader.py)
+    [
+        """CREATE TABLE lease (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            token INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )""",
+    ],
+    # 9 -> 10: правки алиасов/групп воркеров на ходу (aliases.py); coin '' — все монеты
+    [
+        """CREATE TABLE worker_alias (
+            tenant TEXT NOT NULL,
+            coin TEXT NOT NULL,
+            name TEXT NOT NULL,
+            alias TEXT NOT NULL,
+            grp TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (tenant, coin, name)
+        ) WITHOUT ROWID""",
+    ],
+    # 10 -> 11: почасовая история цен (price_store.py), общая для всех тенантов
+    [
+        """CREATE TABLE price_hourly (
+            coin TEXT NOT NULL,
+            fiat TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (coin, fiat, ts)
+        ) WITHOUT ROWID""",
+    ],
+]
+
+
+class _Hooks:
+    __slots__ = ("commit", "rollback")
+
+    def __init__(self) -> None:
+        self.commit: List[Callable[[], None]] = []
+        self.rollback: List[Callable[[], None]] = []
+
+
+_db: aiosqlite.Connection | None = None
+_open_lock = asyncio.Lock()
+_write_lock = asyncio.Lock()
+# хуки текущей transaction(); None — вне транзакции
+_in_tx: contextvars.ContextVar[_Hooks | None] = contextvars.ContextVar("storage_in_tx", default=None)
+
+
+async def _migrate(db: aiosqlite.Connection) -> None:
+    async with db.execute("PRAGMA user_version") as cur:
+        version = (await cur.fetchone())[0]
+    for i in range(version, len(MIGRATIONS)):
+        for stmt in MIGRATIONS[i]:
+            await db.execute(stmt)
+        await db.execute(f"PRAGMA user_version={i + 1}")
         await db.commit()
 
+
+async def connection() -> aiosqlite.Connection:
+    """Общее соединение; при первом обращении открывается и мигрируется."""
+    global _db
+    if _db is not None:
+        return _db
+    async with _open_lock:
+        if _db is None:
+            db = await aiosqlite.connect(DB_PATH)
+            for p in PRAGMAS:
+                await db.execute(p)
+            await _migrate(db)
+            _db = db
+    return _db
+
+
+async def init_db():
+    await connection()
+
+
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    Группа записей с одним коммитом. Записи разных задач сериализуются;
+    вложенный transaction() в той же задаче присоединяется к внешнему.
+    Состояние в памяти, зависящее от записей, меняют через after_commit/after_rollback.
+    """
+    db = await connection()
+    if _in_tx.get() is not None:
+        yield db
+        return
+    t0 = time.perf_counter()
+    async with _write_lock:
+        t1 = time.perf_counter()
+        SQLITE_LOCK_WAIT.observe(t1 - t0)
+        hooks = _Hooks()
+        token = _in_tx.set(hooks)
+        result = "commit"
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            result = "rollback"
+            await db.rollback()
+            for fn in hooks.rollback:
+                fn()
+            raise
+        finally:
+            _in_tx.reset(token)
+            SQLITE_TX_SECONDS.observe(time.perf_counter() - t1, result=result)
+    for fn in hooks.commit:
+        fn()
+
+
+def after_commit(fn: Callable[[], None]) -> None:
+    """fn() после коммита текущей transaction() (вне транзакции — сразу); при откате не вызывается."""
+    hooks = _in_tx.get()
+    if hooks is None:
+        fn()
+    elif fn not in hooks.commit:
+        hooks.commit.append(fn)
+
+
+def after_rollback(fn: Callable[[], None]) -> None:
+    """fn() после отката текущей transaction(); вне транзакции ничего не делает."""
+    hooks = _in_tx.get()
+    if hooks is not None and fn not in hooks.rollback:
+        hooks.rollback.append(fn)
+
+
 async def kv_get(k: str) -> str | None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT v FROM kv WHERE k=?", (k,)) as cur:
-            row = await cur.fetchone()
-            return row[0] if row else None
+    db = await connection()
+    async with db.execute("SELECT v FROM kv WHERE k=?", (k,)) as cur:
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+async def kv_get_many(keys: Iterable[str]) -> Dict[str, str]:
+    ks = list(keys)
+    if not ks:
+        return {}
+    db = await connection()
+    out: Dict[str, str] = {}
+    # лимит параметров SQLite — режем на пачки
+    for i in range(0, len(ks), 500):
+        chunk = ks[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        async with db.execute(f"SELECT k, v FROM kv WHERE k IN ({marks})", chunk) as cur:
+            async for k, v in cur:
+                out[k] = v
+    return out
+
 
 async def kv_set(k: str, v: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         await db.execute("REPLACE INTO kv(k,v) VALUES(?,?)", (k, v))
-        await db.commit()
+
+
+async def kv_set_many(items: Mapping[str, str]):
+    if not items:
+        return
+    async with transaction() as db:
+        await db.executemany("REPLACE INTO kv(k,v) VALUES(?,?)", list(items.items()))
@@ -0,0 +1,197 @@
+"""
+Запись и воспроизведение трафика к апстримам (Trustpool, CoinGecko) в JSONL.
+
+UPSTREAM_RECORD=upstream.jsonl — каждый запрос и ответ дописывается строкой:
+{"ts", "upstream", "path", "params", "status", "ms", "body"} (access_key
+вырезан). Ошибки тоже пишутся: status — HTTP-код, 0 — сетевая ошибка/таймаут.
+
+UPSTREAM_REPLAY=upstream.jsonl — вместо сети ответы отдаются из записи.
+Ответы одного запроса (апстрим, путь, параметры) идут в порядке записи,
+после последнего повторяется последний — результат не зависит от того,
+в каком порядке конкурентные опросы добрались до ленты. Запрос, которого
+в записи нет, — ошибка. Time-warp:
+- UPSTREAM_REPLAY_SPEED — 0: без задержек, 1: с записанной латентностью,
+  N: в N раз быстрее;
+- UPSTREAM_REPLAY_SHIFT — сдвинуть метки времени в ответах (time, last_active,
+  start…) на целое число часов так, будто запись сделана только что: иначе
+  воркеры из старой записи выглядят офлайн, а прибыль — вне «сегодня».
+
+    python tape.py upstream.jsonl      # сводка по записи: запросы, ошибки, p50/p95, размер
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, TextIO, Tuple
+
+import aiohttp
+
+from settings import settings
+
+REDACT = frozenset({"access_key"})
+# поля с метками времени в ответах Trustpool (сек или мс)
+TIME_KEYS = frozenset({"time", "timestamp", "ts", "last_active", "start"})
+HOUR = 3600
+
+Key = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+
+class TapeMiss(LookupError):
+    """Запроса нет в записи."""
+
+
+class ReplayedError(aiohttp.ClientError):
+    """Ошибка апстрима, воспроизведённая из записи."""
+
+    def __init__(self, status: int, error: str = ""):
+        super().__init__(f"replayed {status or 'network error'}: {error}".rstrip(": "))
+        self.status = status
+
+
+def _key(upstream: str, path: str, params: Dict[str, Any]) -> Key:
+    return upstream, path, tuple(sorted((k, str(v)) for k, v in params.items() if k not in REDACT))
+
+
+def _shift(obj: Any, sec: int) -> Any:
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if k in TIME_KEYS and isinstance(v, (int, float)) and not isinstance(v, bool) and v > 0:
+                out[k] = v + (sec * 1000 if v > 1e12 else sec)
+            else:
+                out[k] = _shift(v, sec)
+        return out
+    if isinstance(obj, list):
+        return [_shift(v, sec) for v in obj]
+    return obj
+
+
+class Recorder:
+    def __init__(self, path: str):
+        self.path = path
+        self._f: TextIO = open(path, "a", encoding="utf-8")
+
+    def write(self, upstream: str, path: str, params: Dict[str, Any], status: int, ms: float,
+              body: Any = None, error: str = "") -> None:
+        row: Dict[str, Any] = {
+            "ts": round(time.time(), 3),
+            "upstream": upstream,
+            "path": path,
+            "params": {k: ("***" if k in REDACT else str(v)) for k, v in params.items()},
+            "status": status,
+            "ms": round(ms, 1),
+            "body": body,
+        }
+        if error:
+            row["error"] = error
+        # синхронная запись: режим отладочный, а строки пишутся целиком и по порядку
+        self._f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class Player:
+    def __init__(self, path: str, *, speed: float = 0.0, shift: bool = False):
+        self.path = path
+        self.speed = speed
+        self._tapes: Dict[Key, List[dict]] = defaultdict(list)
+        self._pos: Dict[Key, int] = {}
+        first = None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                first = row["ts"] if first is None else min(first, row["ts"])
+                self._tapes[_key(row["upstream"], row["path"], row.get("params") or {})].append(row)
+        # целые часы — чтобы почасовая сетка прибыли не съезжала относительно границ часа
+        self.shift_sec = int(time.time() - first) // HOUR * HOUR if shift and first is not None else 0
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._tapes.values())
+
+    async def serve(self, upstream: str, path: str, params: Dict[str, Any]) -> Any:
+        key = _key(upstream, path, params)
+        rows = self._tapes.get(key)
+        if not rows:
+            raise TapeMiss(f"{upstream} {path} {dict(key[2])} not in {self.path}")
+        i = self._pos.get(key, 0)
+        self._pos[key] = min(i + 1, len(rows) - 1)
+        row = rows[i]
+        if self.speed > 0 and row.get("ms"):
+            await asyncio.sleep(row["ms"] / 1000 / self.speed)
+        status = int(row.get("status") or 0)
+        if status != 200:
+            raise ReplayedError(status, row.get("error", ""))
+        return _shift(row["body"], self.shift_sec) if self.shift_sec else row["body"]
+
+
+_recorder: Recorder | None = None
+_player: Player | None = None
+_opened = False
+
+
+def _open() -> None:
+    global _recorder, _player, _opened
+    _opened = True
+    if settings.upstream_replay:
+        _player = Player(
+            settings.upstream_replay, speed=settings.upstream_replay_speed, shift=settings.upstream_replay_shift
+        )
+    elif settings.upstream_record:
+        _recorder = Recorder(settings.upstream_record)
+
+
+def close() -> None:
+    global _recorder, _player, _opened
+    if _recorder is not None:
+        _recorder.close()
+    _recorder, _player, _opened = None, None, False
+
+
+async def through(
+    upstream: str, path: str, params: Dict[str, Any], fetch: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Запрос к апстриму через ленту: fetch() — настоящий HTTP-вызов, возвращающий JSON."""
+    if not _opened:
+        _open()
+    if _player is not None:
+        return await _player.serve(upstream, path, params)
+    if _recorder is None:
+        return await fetch()
+    t0 = time.perf_counter()
+    try:
+        body = await fetch()
+    except aiohttp.ClientResponseError as e:
+        _recorder.write(upstream, path, params, e.status, (time.perf_counter() - t0) * 1000, error=e.message)
+        raise
+    except Exception as e:
+        _recorder.write(upstream, path, params, 0, (time.perf_counter() - t0) * 1000, error=repr(e))
+        raise
+    _recorder.write(upstream, path, params, 200, (time.perf_counter() - t0) * 1000, body)
+    return body
+
+
+def _summary(path: str) -> None:
+    by: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                by[(row["upstream"], row["path"])].append(row)
+    print(f"{'апстрим':<11}{'путь':<28}{'запросов':>9}{'ошибок':>8}{'p50, мс':>9}{'p95, мс':>9}{'тело, КБ':>10}")
+    for (up, p), rows in sorted(by.items()):
+        ms = sorted(r.get("ms") or 0.0 for r in rows)
+        size = sum(len(json.dumps(r.get("body"))) for r in rows) / len(rows) / 1024
+        errors = sum(1 for r in rows if r.get("status") != 200)
+        print(f"{up:<11}{p:<28}{len(rows):>9}{errors:>8}{ms[len(ms) // 2]:>9.1f}"
+              f"{ms[min(len(ms) - 1, int(len(ms) * 0.95))]:>9.1f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    _summary(sys.argv[1] if len(sys.argv) > 1 else "upstream.jsonl")
@@ -0,0 +1,178 @@
+"""
+Реестр тенантов (аккаунтов Trustpool) в SQLite.
+
+Тенант = access key + монеты + фиат + алиасы воркеров + подписанные чаты.
+На каждого тенанта — свой TrustpoolClient, машина состояний воркеров и
+детекторы алертов. Аккаунт из .env заводится/обновляется как тенант 'default'.
+Алиасы тенанта из БД — нижний слой реестра алиасов (aliases.py): при каждой
+загрузке реестр проверяет файл и правки, и клиенты получают новые таблицы.
+"""
+from __future__ import annotations
+
+import json
+from typing import Dict, Iterable, List, Tuple
+
+import aliases
+from detectors import DetectorBank
+from settings import settings
+from storage import connection, transaction
+from trustpool_client import TrustpoolClient
+from worker_state import WorkerStateMachine
+
+DEFAULT = "default"
+
+
+def _pack_aliases(scoped: Dict[Tuple[str, str], str], global_: Dict[str, str]) -> str:
+    return json.dumps(
+        {"scoped": {f"{c}:{n}": a for (c, n), a in scoped.items()}, "global": global_},
+        ensure_ascii=False,
+    )
+
+
+def _unpack_aliases(raw: str) -> tuple[Dict[Tuple[str, str], str], Dict[str, str]]:
+    try:
+        j = json.loads(raw or "{}")
+    except ValueError:
+        j = {}
+    scoped: Dict[Tuple[str, str], str] = {}
+    for k, a in (j.get("scoped") or {}).items():
+        coin, _, name = k.partition(":")
+        scoped[(coin.upper(), name)] = a
+    return scoped, dict(j.get("global") or {})
+
+
+class Tenant:
+    __slots__ = ("id", "coins", "fiat", "chats", "client", "states", "detectors", "sig", "alias_base")
+
+    def __init__(
+        self,
+        id: str,
+        access_key: str,
+        coins: List[str],
+        fiat: str,
+        alias_scoped: Dict[Tuple[str, str], str],
+        alias_global: Dict[str, str],
+        chats: Iterable[int] = (),
+    ):
+        self.id = id
+        self.coins = coins or ["BTC"]
+        self.fiat = (fiat or "USD").upper()
+        self.chats: List[int] = list(chats)
+        self.alias_base = aliases.from_maps(alias_scoped, alias_global)
+        self.client = TrustpoolClient(
+            tenant=id, access_key=access_key, coins=self.coins, aliases=aliases.registry.table(id, self.alias_base)
+        )
+        self.states = WorkerStateMachine(id)
+        self.detectors = DetectorBank(id, checkpoint_sec=settings.detector_checkpoint_sec)
+        self.sig: tuple = ()  # конфигурация из БД — для переиспользования при перезагрузке
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.id}, {','.join(self.coins)}, chats={len(self.chats)})"
+
+
+class TenantRegistry:
+    def __init__(self) -> None:
+        self._by_id: Dict[str, Tenant] = {}
+        self._by_chat: Dict[int, List[str]] = {}
+
+    async def load(self) -> None:
+        aliases_changed = await aliases.registry.refresh()
+        db = await connection()
+        chats: Dict[str, List[int]] = {}
+        async with db.execute("SELECT chat_id, tenant_id FROM tenant_chat") as cur:
+            async for chat_id, tid in cur:
+                chats.setdefault(tid, []).append(int(chat_id))
+        by_id: Dict[str, Tenant] = {}
+        async with db.execute("SELECT id, access_key, coins, fiat, aliases FROM tenant WHERE enabled=1") as cur:
+            async for tid, key, coins, fiat, packed in cur:
+                old = self._by_id.get(tid)
+                sig = (key, coins, fiat, packed)
+                if old is not None and old.sig == sig:
+                    # конфигурация та же — оставляем клиента с его кэшем
+                    old.chats = chats.get(tid, [])
+                    if aliases_changed:
+                        old.client.aliases = aliases.registry.table(tid, old.alias_base)
+                    by_id[tid] = old
+                    continue
+                scoped, global_ = _unpack_aliases(packed)
+                t = Tenant(tid, key, [c for c in coins.split(",") if c], fiat, scoped, global_, chats.get(tid, []))
+                t.sig = sig
+                if old is not None:
+                    # не теряем накопленное в памяти состояние алертов
+                    t.states, t.detectors = old.states, old.detectors
+                by_id[tid] = t
+        self._by_id = by_id
+        self._by_chat = {}
+        for tid, t in by_id.items():
+            for c in t.chats:
+                self._by_chat.setdefault(c, []).append(tid)
+
+    async def seed_from_settings(self) -> None:
+        """Аккаунт из .env -> тенант 'default' (обновляется при каждом старте)."""
+        if not settings.access_key:
+            return
+        await self.upsert(
+            DEFAULT,
+            settings.access_key,
+            settings.coins,
+            settings.fiat,
+            aliases=_pack_aliases(settings.worker_alias_scoped, settings.worker_alias_global),
+            reload=False,
+        )
+        async with transaction() as db:
+            await db.executemany(
+                "INSERT OR IGNORE INTO tenant_chat(chat_id, tenant_id) VALUES(?,?)",
+                [(c, DEFAULT) for c in settings.tg_chats],
+            )
+        await self.load()
+
+    async def upsert(
+        self,
+        tid: str,
+        access_key: str,
+        coins: List[str],
+        fiat: str,
+        *,
+        aliases: str | None = None,
+        reload: bool = True,
+    ) -> None:
+        async with transaction() as db:
+            await db.execute(
+                """INSERT INTO tenant(id, access_key, coins, fiat, aliases) VALUES(?,?,?,?,?)
+                   ON CONFLICT(id) DO UPDATE SET access_key=excluded.access_key, coins=excluded.coins,
+                   fiat=excluded.fiat, aliases=COALESCE(?, aliases), enabled=1""",
+                (tid, access_key, ",".join(c.upper() for c in coins), fiat.upper(), aliases or "{}", aliases),
+            )
+        if reload:
+            await self.load()
+
+    async def remove(self, tid: str) -> None:
+        async with transaction() as db:
+            await db.execute("UPDATE tenant SET enabled=0 WHERE id=?", (tid,))
+        await self.load()
+
+    async def subscribe(self, tid: str, chat_id: int) -> None:
+        async with transaction() as db:
+            await db.execute("INSERT OR IGNORE INTO tenant_chat(chat_id, tenant_id) VALUES(?,?)", (chat_id, tid))
+        await self.load()
+
+    async def unsubscribe(self, tid: str, chat_id: int) -> None:
+        async with transaction() as db:
+            await db.execute("DELETE FROM tenant_chat WHERE chat_id=? AND tenant_id=?", (chat_id, tid))
+        await self.load()
+
+    def get(self, tid: str) -> Tenant | None:
+        return self._by_id.get(tid)
+
+    def for_chat(self, chat_id: int) -> Tenant | None:
+        """Тенант для интерактивных команд чата; неподписанные чаты видят 'default' (если есть)."""
+        tids = self._by_chat.get(chat_id)
+        if tids:
+            return self._by_id.get(tids[0])
+        return self._by_id.get(DEFAULT)
+
+    def all(self) -> List[Tenant]:
+        return list(self._by_id.values())
+
+
+registry = TenantRegistry()
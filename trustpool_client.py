@@ -1,37 +1,127 @@
 from __future__ import annotations
 
-import re
-from typing import Any, Dict, List
+import time
+from array import array
+from itertools import islice
+from typing import Any, Dict, Iterator, List
 
 import aiohttp
 
+import aliases
+import resilience
+import tape
+from cache import ResponseCache
+from fanout import gather_map
+from http_pool import TRUSTPOOL, session
+from metrics import UPSTREAM_SECONDS, WORKERS_SEEN
+from models import Payout, ProfitSeries, Worker
 from settings import settings
 
 
-def _norm_name(s: str | None) -> str:
-    return re.sub(r"[^A-Za-z0-9_]", "_", (s or ""))
-
-
 def _coin_for_workers(coin: str) -> str:
     # На Trustpool DOGE в воркерах = LTC (мердж-майнинг)
     c = (coin or "").upper()
     return "LTC" if c == "DOGE" else c
 
 
+# метка эндпоинта в метриках
+ENDPOINTS = {
+    "/observer/home": "home",
+    "/observer/worker": "workers",
+    "/observer/payment/detail": "payouts",
+    "/observer/profit/chart": "profit_chart",
+}
+
+
+def _cache_policy(path: str) -> tuple[float, float]:
+    """(ttl, swr) для эндпоинта. Воркеры без swr — по ним считаются офлайн-алерты."""
+    if path == "/observer/home":
+        return settings.cache_ttl_home, settings.cache_swr_sec
+    if path == "/observer/worker":
+        return settings.cache_ttl_worker, 0.0
+    if path == "/observer/payment/detail":
+        return settings.cache_ttl_payment, settings.cache_swr_sec
+    if path == "/observer/profit/chart":
+        return settings.cache_ttl_profit, settings.cache_swr_sec
+    return 0.0, 0.0
+
+
+def _iter_payouts(raw: Any, coin: str) -> Iterator[Payout]:
+    """Разбор строк payment/detail по одной — без промежуточного списка."""
+    if not isinstance(raw, list):
+        return
+    for p in raw:
+        if not isinstance(p, dict):
+            continue
+        try:
+            yield Payout(
+                coin=(p.get("coin") or coin).upper(),
+                time=int(p.get("time") or p.get("timestamp") or 0),
+                amount=float(str(p.get("amount") or "0").replace(",", ".")),
+                txid=p.get("txid") or p.get("txId") or p.get("hash") or "",
+            )
+        except Exception:
+            continue
+
+
+def aliases_from_settings() -> aliases.AliasTable:
+    return aliases.AliasTable(aliases.from_maps(settings.worker_alias_scoped, settings.worker_alias_global))
+
+
 class TrustpoolClient:
-    def __init__(self, *, timeout_sec: int = 20):
+    """
+    Клиент одного аккаунта (тенанта). Без аргументов — аккаунт из .env.
+    """
+
+    def __init__(
+        self,
+        *,
+        tenant: str = "default",
+        access_key: str | None = None,
+        coins: List[str] | None = None,
+        aliases: aliases.AliasTable | None = None,
+        timeout_sec: int = 20,
+    ):
+        self.tenant = tenant
         self.base = settings.base
-        self.params_base = {"access_key": settings.access_key}
+        self.coins = list(coins) if coins else list(settings.coins)
+        # подменяется целиком при перезагрузке алиасов (см. aliases.py)
+        self.aliases = aliases if aliases is not None else aliases_from_settings()
+        self.params_base = {"access_key": settings.access_key if access_key is None else access_key}
         self.timeout = aiohttp.ClientTimeout(total=timeout_sec)
         self.headers = {"Accept": "application/json"}
+        self.cache = ResponseCache("Trustpool")
 
     async def _get(self, path: str, **params) -> Dict[str, Any]:
+        ttl, swr = _cache_policy(path)
+        key = (path, tuple(sorted((k, str(v)) for k, v in params.items())))
+        # воркерам запасное значение не положено: по ним считаются офлайн-алерты,
+        # и опрос при сбое должен упасть (backoff), а не «подтвердить» старую картину
+        return await self.cache.get(
+            key, lambda: self._fetch(path, params), ttl=ttl, swr=swr, group=path,
+            fallback=path != "/observer/worker",
+        )
+
+    async def _fetch(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        # params без access_key — он не попадает в запись трафика
+        return await resilience.call(
+            "trustpool", ENDPOINTS.get(path, path),
+            lambda: tape.through("trustpool", path, params, lambda: self._request(path, params)),
+        )
+
+    async def _request(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
         url = f"{self.base}{path}"
         q = {**self.params_base, **params}
-        async with aiohttp.ClientSession(timeout=self.timeout) as s:
-            async with s.get(url, params=q, headers=self.headers) as r:
+        endpoint = ENDPOINTS.get(path, path)
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            async with session(TRUSTPOOL).get(url, params=q, headers=self.headers, timeout=self.timeout) as r:
+                status = str(r.status)
                 r.raise_for_status()
                 return await r.json()
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - t0, upstream="trustpool", endpoint=endpoint, status=status)
 
     # -------- сырье --------
     async def home(self, coin: str) -> Dict[str, Any]:
@@ -52,27 +142,30 @@ class TrustpoolClient:
 
     # -------- удобные методы --------
     async def revenue_24h(self) -> Dict[str, float]:
-        out: Dict[str, float] = {}
-        for coin in settings.coins:
-            try:
-                j = await self.home(coin)
-                val = (j.get("data") or {}).get("profit_24hour") or "0"
-                out[coin] = float(str(val).replace(",", "."))
-            except Exception:
-                out[coin] = 0.0
-        return out
+        """{монета: доход за 24ч}. Не ответила хоть одна монета — исключение, а не ноль в сумме."""
+        async def one(coin: str) -> float:
+            j = await self.home(coin)
+            val = (j.get("data") or {}).get("profit_24hour") or "0"
+            return float(str(val).replace(",", "."))
 
-    async def worker_stats(self) -> List[Dict[str, Any]]:
-        res: List[Dict[str, Any]] = []
-        queried: set[str] = set()
+        res = await gather_map(self.coins, one)
+        for v in res.values():
+            if isinstance(v, BaseException):
+                raise v
+        return res
 
-        for coin in settings.coins:
-            query_coin = _coin_for_workers(coin)
-            if query_coin in queried:
-                continue
-            queried.add(query_coin)
+    async def worker_stats(self) -> List[Worker]:
+        res: List[Worker] = []
+        # DOGE и LTC опрашиваются одним запросом (мердж-майнинг)
+        query_coins = [_coin_for_workers(c) for c in self.coins]
+        by_coin = await gather_map(query_coins, lambda c: self.workers(coin=c, group_id=-1))
+        failed = [v for v in by_coin.values() if isinstance(v, BaseException)]
+        if failed and len(failed) == len(by_coin):
+            # пустой список выглядел бы как «все воркеры пропали» — пусть решает вызывающий
+            raise failed[0]
 
-            lst = await self.workers(coin=query_coin, group_id=-1)
+        table = self.aliases
+        for query_coin, lst in by_coin.items():
             if not isinstance(lst, list):
                 continue
 
@@ -81,73 +174,41 @@ class TrustpoolClient:
                     continue
                 raw_name = w.get("name") or w.get("worker") or "unknown"
                 coin_u = (w.get("coin") or query_coin or "NA").upper()
-                nkey = _norm_name(raw_name)
-                alias = (
-                    settings.worker_alias_scoped.get((coin_u, nkey))
-                    or settings.worker_alias_global.get(nkey)
-                    or raw_name
-                )
-                res.append(
-                    {
-                        "coin": coin_u,   # для мерджа будет "LTC" — это ок
-                        "name": raw_name,
-                        "alias": alias,
-                        "last_active": int(w.get("last_active") or 0),
-                        "status": w.get("status") or "unknown",
-                        "recent_hashrate": w.get("recent_hashrate") or "0",
-                        "hashrate_10min": w.get("hashrate_10min") or "0",
-                        "hashrate_1hour": w.get("hashrate_1hour") or "0",
-                        "hashrate_1day": w.get("hashrate_1day") or "0",
-                        "reject_rate": w.get("reject_rate") or "0",
-                    }
-                )
+                alias, group = table.resolve(coin_u, raw_name)
+                # для мерджа coin будет "LTC" — это ок
+                res.append(Worker.from_api(w, coin_u, alias or raw_name, group))
+        WORKERS_SEEN.observe(len(res))
         return res
 
-    async def payouts_list(self, coin: str, limit: int = 10) -> List[Dict[str, Any]]:
-        pts_raw = await self.payouts(coin)
-        out: List[Dict[str, Any]] = []
-        if not isinstance(pts_raw, list):
-            return out
-        for p in pts_raw[:limit]:
-            if not isinstance(p, dict):
-                continue
-            try:
-                out.append(
-                    {
-                        "time": int(p.get("time") or p.get("timestamp") or 0),
-                        "amount": float(str(p.get("amount") or "0").replace(",", ".")),
-                        "coin": (p.get("coin") or coin).upper(),
-                        "txid": p.get("txid") or p.get("txId") or p.get("hash") or "",
-                    }
-                )
-            except Exception:
-                continue
-        return out
+    async def payouts_list(self, coin: str, limit: int = 10) -> List[Payout]:
+        return list(islice(_iter_payouts(await self.payouts(coin), coin), limit))
+
+    async def payouts_iter(self, coin: str) -> Iterator[Payout]:
+        """Все выплаты, что отдаёт Trustpool, — ленивым итератором (для выгрузки)."""
+        return _iter_payouts(await self.payouts(coin), coin)
 
     async def profit_chart(
         self,
         coin: str,
         range_type: str = "hour",
         size: int = 24 * 14,  # до 14 суток с запасом
-    ) -> List[Dict[str, Any]]:
+    ) -> ProfitSeries:
         """
-        Возвращает список точек [{"time": <sec>, "profit": <float>}, ...]
+        Возвращает ряд прибыли (ProfitSeries, время в СЕКУНДАХ).
         Поддерживает два формата Trustpool:
-        A) {"start": <ms|sec>, "data": [<float>, ...]}  — равномерная сетка
+        A) {"start": <ms|sec>, "data": [<float>, ...]}  — равномерная сетка (t0 + step)
         B) {"data": [{"time":..., "profit":...}, ...]}  — явные точки
-        Все time нормализуем в СЕКУНДАХ.
         """
+        step = 3600 if str(range_type).lower() == "hour" else 86400
         try:
             j = await self._get("/observer/profit/chart", coin=coin, range_type=range_type, size=size)
         except Exception:
-            return []
+            return ProfitSeries.empty(step)
 
         # достаём payload
         payload = j.get("data") if isinstance(j, dict) else None
         if payload is None:
-            return []
-
-        out: List[Dict[str, Any]] = []
+            return ProfitSeries.empty(step)
 
         # --- Вариант A: start + data (массив чисел) ---
         start = None
@@ -161,21 +222,18 @@ class TrustpoolClient:
             # нормализуем start в сек
             try:
                 t0 = int(start)
-                if t0 > 2_000_000_000_000 or t0 > 50_000_000_000:  # миллисекунды
+                if t0 > 50_000_000_000:  # миллисекунды
                     t0 //= 1000
             except Exception:
                 t0 = 0
 
-            step = 3600 if str(range_type).lower() == "hour" else 86400
-            t = t0
+            values = array("d")
             for v in series:
                 try:
-                    profit = float(str(v).replace(",", "."))
+                    values.append(float(str(v).replace(",", ".")))
                 except Exception:
-                    profit = 0.0
-                out.append({"time": t, "profit": profit})
-                t += step
-            return out
+                    values.append(0.0)
+            return ProfitSeries(values, t0=t0, step=step)
 
         # --- Вариант B: массив объектов (каждая точка со своим time/profit) ---
         data_list = None
@@ -185,6 +243,7 @@ class TrustpoolClient:
             # иногда сам payload — уже список
             data_list = payload if isinstance(payload, list) else []
 
+        pts: List[tuple[int, float]] = []
         for p in data_list:
             if not isinstance(p, dict):
                 continue
@@ -192,12 +251,15 @@ class TrustpoolClient:
             val_raw = p.get("profit") or p.get("value") or p.get("amount") or 0
             try:
                 ts = int(ts_raw)
-                if ts > 2_000_000_000_000 or ts > 50_000_000_000:
+                if ts > 50_000_000_000:
                     ts //= 1000  # ms → sec
-                profit = float(str(val_raw).replace(",", "."))
-                out.append({"time": ts, "profit": profit})
+                pts.append((ts, float(str(val_raw).replace(",", "."))))
             except Exception:
                 continue
 
-        return out
-
+        pts.sort()
+        return ProfitSeries(
+            array("d", (v for _, v in pts)),
+            step=step,
+            times=array("q", (t for t, _ in pts)),
+        )
@@ -0,0 +1,35 @@
+"""Разбор и форматирование хешрейта ("12.3 TH/s" <-> 1.23e13 H/s)."""
+from __future__ import annotations
+
+import re
+from typing import Any
+
+_PREFIX = {"": 1.0, "K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12, "P": 1e15, "E": 1e18, "Z": 1e21}
+_HR_RE = re.compile(r"^\s*([-+]?\d+(?:[.,]\d+)?(?:[eE][-+]?\d+)?)\s*([kKMGTPEZ]?)\s*(?:H|h)?(?:/s)?\s*$")
+
+
+def parse_hashrate(v: Any) -> float:
+    """Строка/число хешрейта -> H/s. Неразбираемое -> 0.0. Голое число считаем H/s."""
+    if v is None:
+        return 0.0
+    if isinstance(v, (int, float)):
+        return float(v)
+    m = _HR_RE.match(str(v))
+    if not m:
+        return 0.0
+    return float(m.group(1).replace(",", ".")) * _PREFIX[m.group(2).upper()]
+
+
+def fmt_hashrate(hs: float) -> str:
+    for p in ("E", "P", "T", "G", "M", "K"):
+        if hs >= _PREFIX[p]:
+            return f"{hs / _PREFIX[p]:.2f} {p}H/s"
+    return f"{hs:.0f} H/s"
+
+
+def parse_float(v: Any) -> float:
+    """'1,5' / '2.3%' / None -> float."""
+    try:
+        return float(str(v if v is not None else "0").replace(",", ".").rstrip("%").strip() or 0)
+    except ValueError:
+        return 0.0
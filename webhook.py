@@ -0,0 +1,112 @@
+"""
+Webhook-режим: встроенный aiohttp-сервер вместо long polling.
+
+POST WEBHOOK_PATH — апдейт от Telegram: сверяем секрет из заголовка
+X-Telegram-Bot-Api-Secret-Token, кладём апдейт в update_queue приложения и
+сразу отвечаем 200 — обработка идёт асинхронно. GET /healthz — для
+балансировщика и docker healthcheck, GET /metrics — метрики Prometheus. Несколько реплик за балансировщиком
+регистрируют один и тот же URL и секрет, так что set_webhook идемпотентен,
+а при остановке вебхук не снимается — его продолжают обслуживать соседи.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+from settings import settings
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH = "/healthz"
+
+TG_APP = web.AppKey("tg_app", Application)
+HEALTH = web.AppKey("health", Callable)
+
+Hook = Callable[[Application], Awaitable[None]]
+Health = Callable[[Application], Dict[str, Any]]
+
+
+def _no_health(app: Application) -> Dict[str, Any]:
+    return {}
+
+
+def secret() -> str:
+    """WEBHOOK_SECRET или детерминированный секрет из токена — одинаковый у всех реплик."""
+    if settings.webhook_secret:
+        return settings.webhook_secret
+    return hashlib.sha256(f"trustbot-webhook:{settings.tg_token}".encode()).hexdigest()[:48]
+
+
+async def _on_update(request: web.Request) -> web.Response:
+    if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret()):
+        return web.Response(status=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    app = request.app[TG_APP]
+    update = Update.de_json(data, app.bot)
+    if update is None:
+        return web.Response(status=400)
+    await app.update_queue.put(update)
+    return web.Response()
+
+
+async def _on_health(request: web.Request) -> web.Response:
+    app = request.app[TG_APP]
+    body: Dict[str, Any] = {"ok": app.running, "update_queue": app.update_queue.qsize()}
+    body.update(request.app[HEALTH](app))
+    return web.json_response(body, status=200 if app.running else 503)
+
+
+def make_web_app(app: Application, health: Health = _no_health) -> web.Application:
+    web_app = web.Application(client_max_size=1 << 20)
+    web_app[TG_APP] = app
+    web_app[HEALTH] = health
+    web_app.router.add_post(settings.webhook_path, _on_update)
+    web_app.router.add_get(HEALTH_PATH, _on_health)
+    web_app.router.add_get("/metrics", metrics.handle)
+    return web_app
+
+
+async def serve(
+    app: Application, *, on_startup: Hook, on_shutdown: Hook, health: Health = _no_health
+) -> None:
+    """Полный жизненный цикл приложения в webhook-режиме (до SIGINT/SIGTERM)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    async with app:
+        await on_startup(app)
+        await app.start()
+        runner = web.AppRunner(make_web_app(app, health), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, settings.webhook_listen, settings.webhook_port).start()
+        url = settings.webhook_url.rstrip("/") + settings.webhook_path
+        await app.bot.set_webhook(url=url, secret_token=secret(), allowed_updates=Update.ALL_TYPES)
+        log.info("webhook: %s -> %s:%s", url, settings.webhook_listen, settings.webhook_port)
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()
+            await app.stop()
+            await on_shutdown(app)
+
+
+def run(app: Application, **kw) -> None:
+    asyncio.run(serve(app, **kw))
@@ -0,0 +1,130 @@
+"""
+Временные ряды хешрейта воркеров.
+
+Каждый цикл опроса дописывает по сэмплу на воркера в worker_sample и сразу
+агрегирует его в часовые и суточные корзины worker_rollup (n/sum/min/max) —
+без повторного прохода по сырым строкам. Старые данные подрезаются по
+ретеншену, так что база остаётся маленькой и при сотнях воркеров.
+"""
+from __future__ import annotations
+
+import time
+from typing import Dict, List, Tuple
+
+from models import Worker
+from settings import settings
+from storage import after_rollback, connection, transaction
+
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = (HOUR, DAY)
+PRUNE_EVERY_SEC = HOUR
+
+_ids: Dict[Tuple[str, str, str], int] = {}  # (tenant, coin, name) -> worker.id
+_pruned_at = 0.0
+
+_UPSERT_ROLLUP = """
+INSERT INTO worker_rollup(worker_id, res, bucket, n, hr_sum, hr_min, hr_max, reject_sum, online_n)
+VALUES(?,?,?,1,?,?,?,?,?)
+ON CONFLICT(worker_id, res, bucket) DO UPDATE SET
+    n = n + 1,
+    hr_sum = hr_sum + excluded.hr_sum,
+    hr_min = min(hr_min, excluded.hr_min),
+    hr_max = max(hr_max, excluded.hr_max),
+    reject_sum = reject_sum + excluded.reject_sum,
+    online_n = online_n + excluded.online_n
+"""
+
+
+async def _worker_ids(keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], int]:
+    db = await connection()
+    if not _ids:
+        async with db.execute("SELECT id, tenant, coin, name FROM worker") as cur:
+            async for wid, tenant, coin, name in cur:
+                _ids[(tenant, coin, name)] = wid
+    missing = [k for k in keys if k not in _ids]
+    if missing:
+        def forget() -> None:
+            # откат убрал строки worker, а SQLite выдаст те же id другим воркерам
+            for k in missing:
+                _ids.pop(k, None)
+
+        after_rollback(forget)
+        await db.executemany("INSERT OR IGNORE INTO worker(tenant, coin, name) VALUES(?,?,?)", missing)
+        for key in missing:
+            async with db.execute("SELECT id FROM worker WHERE tenant=? AND coin=? AND name=?", key) as cur:
+                row = await cur.fetchone()
+            if row:
+                _ids[key] = row[0]
+    return _ids
+
+
+async def append(tenant: str, workers: List[Worker], ts: int | None = None) -> int:
+    """Дописывает сэмплы текущего опроса и обновляет rollup-корзины."""
+    if not workers:
+        return 0
+    ts = int(ts or time.time())
+    async with transaction() as db:
+        ids = await _worker_ids([(tenant, w.coin, w.name) for w in workers])
+        samples = []
+        rollups = []
+        for w in workers:
+            wid = ids.get((tenant, w.coin, w.name))
+            if wid is None:
+                continue
+            hr, rej, online = w.hr_recent, w.reject_rate, int(w.online)
+            samples.append((wid, ts, hr, w.hr_10min, rej, online))
+            for res in RESOLUTIONS:
+                rollups.append((wid, res, ts - ts % res, hr, hr, hr, rej, online))
+        await db.executemany(
+            "INSERT OR REPLACE INTO worker_sample(worker_id, ts, hr, hr_10m, reject, online) VALUES(?,?,?,?,?,?)",
+            samples,
+        )
+        await db.executemany(_UPSERT_ROLLUP, rollups)
+        await _maybe_prune(db, ts)
+    return len(samples)
+
+
+async def _maybe_prune(db, now: int) -> None:
+    global _pruned_at
+    if time.monotonic() - _pruned_at < PRUNE_EVERY_SEC:
+        return
+    _pruned_at = time.monotonic()
+    await db.execute("DELETE FROM worker_sample WHERE ts < ?", (now - settings.series_raw_retention_h * HOUR,))
+    await db.execute(
+        "DELETE FROM worker_rollup WHERE res=? AND bucket < ?", (HOUR, now - settings.series_hourly_retention_d * DAY)
+    )
+    await db.execute(
+        "DELETE FROM worker_rollup WHERE res=? AND bucket < ?", (DAY, now - settings.series_daily_retention_d * DAY)
+    )
+
+
+async def stats(
+    tenant: str, coin: str, name: str, seconds: int, now: int | None = None
+) -> Tuple[float, float, float, int] | None:
+    """
+    (min, avg, max, n) хешрейта воркера за последние seconds, H/s.
+    Короткие окна читаются из сырых сэмплов, длинные — из rollup-корзин.
+    """
+    now = int(now or time.time())
+    start = now - seconds
+    ids = await _worker_ids([])
+    wid = ids.get((tenant, coin, name))
+    if wid is None:
+        return None
+    db = await connection()
+    if seconds <= 2 * HOUR:
+        sql = "SELECT min(hr), sum(hr), max(hr), count(*) FROM worker_sample WHERE worker_id=? AND ts>=?"
+        args: tuple = (wid, start)
+    else:
+        res = HOUR if seconds <= settings.series_hourly_retention_d * DAY else DAY
+        sql = (
+            "SELECT min(hr_min), sum(hr_sum), max(hr_max), sum(n) FROM worker_rollup "
+            "WHERE worker_id=? AND res=? AND bucket>=?"
+        )
+        args = (wid, res, start - start % res)
+    async with db.execute(sql, args) as cur:
+        row = await cur.fetchone()
+    if not row or not row[3]:
+        return None
+    return float(row[0]), float(row[1]) / row[3], float(row[2]), int(row[3])
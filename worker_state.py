@@ -0,0 +1,178 @@
+"""
+Состояние воркеров для офлайн-алертов: online → suspected → offline → (recovered) → online.
+
+События порождают только переходы: offline (после ALERT_OFFLINE_CONFIRM_POLLS
+подряд «протухших» опросов) и recovered (offline → снова активен).
+На каждом опросе пересчитываются только воркеры, у которых поменялись
+last_active/status, у которых истёк дедлайн активности, или которые в suspected.
+Состояние хранится в таблице worker_state; пишутся только изменившиеся строки.
+Если транзакция опроса откатилась, память сбрасывается и перечитывается из
+таблицы — как после рестарта, — чтобы повтор опроса снова увидел переходы.
+"""
+from __future__ import annotations
+
+import heapq
+import time
+from typing import Dict, List, Set, Tuple
+
+from models import Worker
+from storage import after_rollback, connection, transaction
+
+ONLINE = "online"
+SUSPECTED = "suspected"
+OFFLINE = "offline"
+RECOVERED = "recovered"
+
+Key = Tuple[str, str]  # (coin, name)
+
+
+class _W:
+    __slots__ = ("state", "since", "strikes", "last_active", "status", "alias", "deadline")
+
+    def __init__(self, state: str = ONLINE, since: int = 0, last_active: int = 0):
+        self.state = state
+        self.since = since
+        self.strikes = 0
+        self.last_active = last_active
+        self.status = ""
+        self.alias = ""
+        self.deadline = 0
+
+
+class WorkerStateMachine:
+    def __init__(self, tenant: str = "default") -> None:
+        self.tenant = tenant
+        self._w: Dict[Key, _W] = {}
+        self._deadlines: List[Tuple[int, Key]] = []  # (когда протухнет, воркер)
+        self._suspected: Set[Key] = set()
+        self._loaded = False
+
+    async def load(self) -> None:
+        if self._loaded:
+            return
+        db = await connection()
+        async with db.execute(
+            "SELECT coin, name, state, since, last_active FROM worker_state WHERE tenant=?", (self.tenant,)
+        ) as cur:
+            async for coin, name, state, since, _ in cur:
+                # last_active=-1: первый снимок после рестарта пересчитает всех
+                w = self._w[(coin, name)] = _W(state, int(since), -1)
+                if state == SUSPECTED:
+                    self._suspected.add((coin, name))
+                    w.strikes = 1
+        self._loaded = True
+
+    def _reset(self) -> None:
+        self._w.clear()
+        self._deadlines.clear()
+        self._suspected.clear()
+        self._loaded = False
+
+    def _stale(self, w: _W, now: int, offline_sec: int) -> bool:
+        return not w.last_active or now - w.last_active > offline_sec
+
+    async def update(
+        self, workers: List[Worker], *, offline_min: int, confirm_polls: int, now: int | None = None
+    ) -> List[Tuple[str, Key, str]]:
+        """
+        Применяет снимок воркеров. Возвращает переходы [(OFFLINE|RECOVERED, key, alias)].
+        """
+        await self.load()
+        after_rollback(self._reset)
+        try:
+            return await self._update(workers, offline_min, confirm_polls, now)
+        except BaseException:
+            self._reset()  # вне транзакции опроса хук отката не сработает
+            raise
+
+    async def _update(
+        self, workers: List[Worker], offline_min: int, confirm_polls: int, now: int | None
+    ) -> List[Tuple[str, Key, str]]:
+        now = int(now or time.time())
+        offline_sec = offline_min * 60
+        touched: Set[Key] = set()
+
+        # 1) изменившиеся воркеры
+        for raw in workers:
+            key = raw.key
+            la = raw.last_active
+            st = raw.status
+            w = self._w.get(key)
+            if w is None:
+                w = self._w[key] = _W(ONLINE, now)
+                w.last_active = -1  # форсируем пересчёт
+            w.alias = raw.alias or raw.name
+            if w.last_active != la or w.status != st:
+                w.last_active, w.status = la, st
+                touched.add(key)
+                if la:
+                    w.deadline = la + offline_sec + 1
+                    heapq.heappush(self._deadlines, (w.deadline, key))
+
+        # 2) истёкшие дедлайны активности
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, key = heapq.heappop(self._deadlines)
+            touched.add(key)
+
+        # 3) подозреваемые ждут подтверждения
+        touched |= self._suspected
+
+        transitions: List[Tuple[str, Key, str]] = []
+        changed: List[Key] = []
+        for key in touched:
+            w = self._w.get(key)
+            if w is None:
+                continue
+            prev = w.state
+            if self._stale(w, now, offline_sec):
+                if w.state == ONLINE:
+                    w.state, w.strikes = SUSPECTED, 0
+                if w.state == SUSPECTED:
+                    w.strikes += 1
+                    if w.strikes >= max(1, confirm_polls):
+                        w.state = OFFLINE
+                        transitions.append((OFFLINE, key, w.alias))
+            else:
+                if w.state == OFFLINE:
+                    transitions.append((RECOVERED, key, w.alias))
+                w.state, w.strikes = ONLINE, 0
+
+            if w.state == SUSPECTED:
+                self._suspected.add(key)
+            else:
+                self._suspected.discard(key)
+            if w.state != prev:
+                w.since = now
+                changed.append(key)
+
+        if changed:
+            async with transaction() as db:
+                await db.executemany(
+                    "REPLACE INTO worker_state(tenant, coin, name, state, since, last_active) VALUES(?,?,?,?,?,?)",
+                    [
+                        (self.tenant, k[0], k[1], self._w[k].state, self._w[k].since, max(0, self._w[k].last_active))
+                        for k in changed
+                    ],
+                )
+        return transitions
+
+    def next_due(self, now: int | None = None) -> float | None:
+        """
+        Через сколько секунд нужен следующий снимок: сразу, если есть suspected,
+        иначе к ближайшему актуальному дедлайну активности (None — ждать нечего).
+        """
+        if self._suspected:
+            return 0.0
+        h = self._deadlines
+        # устаревшие записи (воркер с тех пор был активен) снимаем лениво
+        while h and self._w[h[0][1]].deadline != h[0][0]:
+            heapq.heappop(h)
+        if not h:
+            return None
+        return max(0.0, h[0][0] - int(now or time.time()))
+
+    def counts(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for w in self._w.values():
+            out[w.state] = out.get(w.state, 0) + 1
+        return out